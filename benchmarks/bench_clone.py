@@ -0,0 +1,41 @@
+"""Compare snapshot/restore/clone of the env with the cloudpickle `_save`/`_load` path.
+
+Usage::
+
+    python benchmarks/bench_clone.py
+"""
+import timeit
+
+from supply_chain_env.envs.env import SupplyChainBotTournament
+
+
+def run(env_type: str = "classical", number: int = 2000, repeat: int = 5) -> dict:
+    """
+    Time each way of copying the env in the middle of a game.
+    :return: dict mapping operation to microseconds per call (best of `repeat`)
+    """
+    env = SupplyChainBotTournament(env_type=env_type, seed=0, verbose=False)
+    env.reset()
+    for _ in range(env.n_turns // 2):
+        env.step([4] * env.n_agents)
+    snapshot = env.snapshot()
+    canned = env._save()
+    operations = {
+        "snapshot": env.snapshot,
+        "restore": lambda: env.restore(snapshot),
+        "clone": env.clone,
+        "_save": env._save,
+        "_load": lambda: env._load(canned),
+    }
+    return {
+        name: min(timeit.repeat(operation, number=number, repeat=repeat)) / number * 1e6
+        for name, operation in operations.items()
+    }
+
+
+if __name__ == "__main__":
+    timings = run()
+    for name, microseconds in timings.items():
+        print(f"{name:>10}: {microseconds:8.1f} us")
+    pickle_copy = timings["_save"] + timings["_load"]
+    print(f"clone is {pickle_copy / timings['clone']:.0f}x faster than _save + _load")
@@ -0,0 +1,169 @@
+"""Throughput, latency and memory benchmarks of the environments.
+
+Measures for every env type and render mode (see `supply_chain_env.envs.rendering`):
+
+* ``steps_per_s``: env steps per second, resets excluded
+* ``resets_per_s``: resets per second
+* ``game_ms_p50``, ``game_ms_p95``: latency of a full game (reset and all turns)
+* ``peak_kb``: peak memory allocated while playing one game
+
+and the ``_save``/``_load`` pickle path, snapshot/restore/clone (see `bench_clone.py`)
+and the batched env. Results are compared with a stored baseline and the script
+exits with status 1 if any metric regressed by more than the threshold.
+
+Usage::
+
+    python benchmarks/bench_env.py --save   # record the baseline of this machine
+    python benchmarks/bench_env.py          # compare with it after a change
+"""
+import contextlib
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+import bench_clone
+from supply_chain_env.envs import (
+    SupplyChainBotTournament,
+    VectorSupplyChainBotTournament,
+)
+from supply_chain_env.envs.rendering import RENDER_MODES
+
+ENV_TYPES = ("classical", "uniform_0_2", "normal_10_4")
+BASELINE = Path(__file__).parent / "baseline.json"
+# metrics with these suffixes are better when higher, all others when lower
+HIGHER_IS_BETTER = ("_per_s",)
+
+
+def _play(env, actions):
+    env.reset()
+    while not env.done:
+        env.step(actions)
+
+
+def bench_scalar(env_type: str, render_mode: str, n_games: int, repeat: int) -> dict:
+    env = SupplyChainBotTournament(
+        env_type=env_type, seed=0, verbose=False, renderer=render_mode
+    )
+    actions = [4] * env.n_agents
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        _play(env, actions)  # warm up
+
+        tracemalloc.start()
+        _play(env, actions)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        steps_per_s, game_times = 0.0, []
+        for _ in range(repeat):
+            step_time, n_steps = 0.0, 0
+            for _ in range(n_games):
+                start = time.perf_counter()
+                env.reset()
+                reset_done = time.perf_counter()
+                while not env.done:
+                    env.step(actions)
+                    n_steps += 1
+                end = time.perf_counter()
+                step_time += end - reset_done
+                game_times.append(end - start)
+            steps_per_s = max(steps_per_s, n_steps / step_time)
+
+        resets = min(timeit.repeat(env.reset, number=n_games, repeat=repeat))
+        env.close()
+    return {
+        "steps_per_s": steps_per_s,
+        "resets_per_s": n_games / resets,
+        "game_ms_p50": float(np.percentile(game_times, 50)) * 1e3,
+        "game_ms_p95": float(np.percentile(game_times, 95)) * 1e3,
+        "peak_kb": peak / 1024,
+    }
+
+
+def bench_vector(env_type: str, n_envs: int, repeat: int) -> dict:
+    env = VectorSupplyChainBotTournament(env_type=env_type, n_envs=n_envs, seed=0)
+    actions = np.full((n_envs, env.n_agents), 4)
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        env.reset()
+        while not env.done:
+            env.step(actions)
+        best = min(best, time.perf_counter() - start)
+    return {"game_steps_per_s": n_envs * env.n_turns / best}
+
+
+def run(n_games: int = 200, repeat: int = 3, n_envs: int = 1024) -> dict:
+    """
+    Run all benchmarks.
+    :return: dict mapping ``case/metric`` to its value
+    """
+    results = {}
+    for env_type in ENV_TYPES:
+        for render_mode in RENDER_MODES:
+            case = f"scalar/{env_type}/{render_mode}"
+            metrics = bench_scalar(env_type, render_mode, n_games, repeat)
+            results.update({f"{case}/{k}": v for k, v in metrics.items()})
+        metrics = bench_clone.run(env_type, number=n_games, repeat=repeat)
+        results.update({f"copy/{env_type}/{k}_us": v for k, v in metrics.items()})
+        metrics = bench_vector(env_type, n_envs, repeat)
+        results.update({f"vector/{env_type}/{k}": v for k, v in metrics.items()})
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Find the metrics that got worse than the baseline by more than `threshold`.
+    :return: list of (metric, baseline value, new value) tuples
+    """
+    regressions = []
+    for metric, old in baseline.items():
+        new = results.get(metric)
+        if new is None:
+            continue
+        if metric.endswith(HIGHER_IS_BETTER):
+            regressed = new < old * (1 - threshold)
+        else:
+            regressed = new > old * (1 + threshold)
+        if regressed:
+            regressions.append((metric, old, new))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description="Benchmark the supply chain environments.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="store as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--n_games", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args(argv)
+
+
+def main(args):
+    results = run(n_games=args.n_games, repeat=args.repeat)
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+    for metric, value in results.items():
+        old = baseline.get(metric)
+        change = f"{(value / old - 1):+7.1%}" if old else ""
+        print(f"{metric:<48} {value:12.1f} {change}")
+    if args.save:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for metric, old, new in regressions:
+        print(f"REGRESSION {metric}: {old:.1f} -> {new:.1f}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,89 @@
+"""Startup time of the package and of the bot script.
+
+Measures the wall time of fresh interpreters
+
+* ``import``: ``import supply_chain_env``
+* ``import_env``: ``import supply_chain_env.envs``, i.e. with gym
+* ``bot``: ``python bot.py --no_submit``, one game without submitting the score
+
+minus the time of an interpreter doing nothing, as the best of several runs. The
+script exits with status 1 if any of them exceeds its budget in milliseconds.
+
+Usage::
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --budget bot=300
+"""
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+CASES = {
+    "import": ["-c", "import supply_chain_env"],
+    "import_env": ["-c", "import supply_chain_env.envs"],
+    "bot": [str(ROOT / "bot.py"), "--no_submit"],
+}
+# milliseconds on top of the interpreter startup
+BUDGETS_MS = {"import": 20, "import_env": 400, "bot": 600}
+
+
+def wall_time(args: list, repeat: int) -> float:
+    """
+    Best wall time of running the interpreter with `args`, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(repeat: int = 5) -> dict:
+    """
+    :return: dict mapping case to milliseconds on top of the interpreter startup
+    """
+    interpreter = wall_time(["-c", "pass"], repeat)
+    return {
+        case: (wall_time(args, repeat) - interpreter) * 1e3
+        for case, args in CASES.items()
+    }
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description="Benchmark the startup time.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        help="case=milliseconds, overrides the default budget of a case",
+    )
+    return parser.parse_args(argv)
+
+
+def main(args):
+    budgets = dict(BUDGETS_MS)
+    for spec in args.budget:
+        case, _, milliseconds = spec.partition("=")
+        budgets[case] = float(milliseconds)
+    over_budget = 0
+    for case, milliseconds in run(args.repeat).items():
+        budget = budgets[case]
+        status = "ok" if milliseconds <= budget else "OVER BUDGET"
+        over_budget += status != "ok"
+        print(f"{case:<12} {milliseconds:8.1f} ms (budget {budget:.0f} ms) {status}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -30,6 +30,11 @@ Your goal is to implement a strategy for each of the four agents in such a way,
 shouldn't use any other information except stored in a dictionary that is given to `get_action()` method. Also, the
 agents are not allowed to communicate their stock levels or any other internal information to each other.
 
+Optionally, an agent can also implement `get_actions(states) -> np.ndarray`, which gets the states of many games at
+once: the same dictionary keys, with an array holding one row per game as values. The tournament runner
+(`python -m supply_chain_env.tournament`) then plays all games together and calls it once per turn instead of calling
+`get_action()` once per game, which makes NumPy or model-based strategies much faster to evaluate.
+
 In this file, you'll find a dummy implementation for each agent that orders a random amount of items each turn. If you
 run this script as-is, you'll see that the costs at the end of the game are very high. Try to come up with a better
 solution!
@@ -39,8 +44,9 @@ from argparse import ArgumentParser
 
 import numpy as np
 
-from supply_chain_env.envs.env import SupplyChainBotTournament
-from supply_chain_env.leaderboard import post_score_to_api
+from supply_chain_env.envs.rendering import RENDER_MODES
+from supply_chain_env.envs.streams import seed_agents
+from supply_chain_env.tournament import run_game
 
 
 class Retailer:
@@ -81,32 +87,33 @@ def create_agents():
     return [Retailer(), Wholesaler(), Distributor(), Manufacturer()]
 
 
-def run_game(agents: list, environment: str = 'classical', verbose: bool = False):
-    env = SupplyChainBotTournament(
-        env_type=environment
-    )  # TODO: decide if we should support all 3 environments or support one
-    state = env.reset()
-    while not env.done:
-        if verbose:
-            env.render()
-        actions = [a.get_action(state[i]) for i, a in enumerate(agents)]
-        state, rewards, done, _ = env.step(actions)
-    return state
-
-
 def parse_args():
     parser = ArgumentParser()
     parser.add_argument('--no_submit', action='store_true')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--render', choices=RENDER_MODES, default='turns',
+                        help='print every turn, only the total cost, nothing or a live '
+                             'dashboard of the game')
+    parser.add_argument('--cache', default=None,
+                        help='directory to cache the result of a seeded game in, it is '
+                             'reused while the agents and the env are unchanged')
     return parser.parse_args()
 
 
 def main(args):
-    last_state = run_game(create_agents(), verbose=True)
+    if args.seed is not None:
+        # the same game as the tournament's game of this seed
+        seed_agents(args.seed)
+    last_state = run_game(create_agents(), seed=args.seed, cache=args.cache,
+                          renderer=args.render)
 
     if args.no_submit:
         sys.exit(0)
 
-    # get total costs and post results to leaderboard api
+    # get total costs and post results to leaderboard api, imported only here as the
+    # HTTP client takes long to import
+    from supply_chain_env.leaderboard import post_score_to_api
+
     total_costs = sum(agent_state["cum_cost"] for agent_state in last_state)
     post_score_to_api(score=total_costs)
 
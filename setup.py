@@ -6,4 +6,6 @@ setup(
     author="Alexander Orlov",
     maintainer="Blue Yonder GmbH",
     install_requires=["gym", "numpy", "cloudpickle", "pytest", "requests"],
+    # registers the environments when gym is imported
+    entry_points={"gym.envs": ["__root__ = supply_chain_env:register_envs"]},
 )
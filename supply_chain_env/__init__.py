@@ -1,5 +1,29 @@
-from gym.envs.registration import register
+import sys
 
-register(
-    id="SupplyChainTournament-v0", entry_point="supply_chain_env.envs:SupplyChainBotTournament",
-)
+# gym ids of the environments and their classes
+ENV_ENTRY_POINTS = {
+    "SupplyChainTournament-v0": "supply_chain_env.envs:SupplyChainBotTournament",
+    "SupplyChainTournamentVector-v0": (
+        "supply_chain_env.envs:VectorSupplyChainBotTournament"
+    ),
+}
+
+
+def register_envs():
+    """
+    Register the environments with gym.
+
+    Importing gym takes long, so it is not imported just for this: the installed
+    package registers them through its ``gym.envs`` entry point when gym is imported,
+    and importing `supply_chain_env` or `supply_chain_env.envs` after gym registers
+    them too.
+    """
+    from gym.envs.registration import register, registry
+
+    for env_id, entry_point in ENV_ENTRY_POINTS.items():
+        if env_id not in registry:
+            register(id=env_id, entry_point=entry_point)
+
+
+if "gym.envs.registration" in sys.modules:
+    register_envs()
@@ -1 +1,5 @@
+from supply_chain_env import register_envs
 from supply_chain_env.envs.env import SupplyChainBotTournament
+from supply_chain_env.envs.vector_env import VectorSupplyChainBotTournament
+
+register_envs()
@@ -1,11 +1,20 @@
 import itertools
+import sys
 from collections import deque
+from typing import Optional
 
-import cloudpickle
 import gym
 import numpy as np
 from gym import error
-from gym.utils import seeding
+
+from supply_chain_env.envs.observations import (
+    ObservationView,
+    n_observation_fields,
+    observation_layout,
+)
+from supply_chain_env.envs.rendering import format_turn, make_renderer
+from supply_chain_env.envs.scenario_bank import draw_demand, open_bank, score_weights
+from supply_chain_env.envs.streams import root_sequence, scenario_rng
 
 
 def add_noise_to_init(init, noise):
@@ -46,28 +55,206 @@ def get_init_len(init):
     return init_len
 
 
+def draw_initial_state(
+    env_type: str,
+    rng,
+    order_lead_times: list,
+    shipment_lead_times: list,
+    add_noise: bool = True,
+):
+    """
+    Draw the initial state of a game, the noise comes from `rng` only.
+    :type rng: np.random.Generator
+    :return: orders and inbound shipments (lists of lists in arrival order), next
+        incoming orders and stocks (lists)
+    """
+    n_agents = len(order_lead_times)
+    if env_type == "classical":
+        temp_orders = [[4] * lead for lead in order_lead_times]
+        temp_inbound_shipments = [[4] * lead for lead in shipment_lead_times]
+        next_incoming_orders = [4] * n_agents  # pending order delivery for each agent
+        stocks = [12] * n_agents  # initial inventory level for each agent
+
+        if add_noise:
+            # noise is uniform [-2,2]
+            orders_noise = rng.choice(np.arange(5), size=get_init_len(temp_orders)) - 2
+            temp_orders = add_noise_to_init(temp_orders, orders_noise)
+
+            inbound_shipments_noise = (
+                rng.choice(np.arange(5), size=get_init_len(temp_inbound_shipments))
+                - 2
+            )
+            temp_inbound_shipments = add_noise_to_init(
+                temp_inbound_shipments, inbound_shipments_noise
+            )
+
+            last_incoming_orders_noise = (
+                rng.choice(np.arange(5), size=get_init_len(next_incoming_orders))
+                - 2
+            )
+            next_incoming_orders = add_noise_to_init(
+                next_incoming_orders, last_incoming_orders_noise
+            )
+
+            stocks_noise = rng.choice(np.arange(13), size=get_init_len(stocks)) - 6
+            stocks = add_noise_to_init(stocks, stocks_noise)
+
+    elif env_type == "uniform_0_2":
+        temp_orders = [[1] * lead for lead in order_lead_times]
+        temp_inbound_shipments = [[1] * lead for lead in shipment_lead_times]
+        next_incoming_orders = [1] * n_agents
+        stocks = [4] * n_agents
+
+        if add_noise:
+            # noise is uniform [-1,1]
+            orders_noise = rng.choice(np.arange(3), size=get_init_len(temp_orders)) - 1
+            temp_orders = add_noise_to_init(temp_orders, orders_noise)
+
+            inbound_shipments_noise = (
+                rng.choice(np.arange(3), size=get_init_len(temp_inbound_shipments))
+                - 1
+            )
+            temp_inbound_shipments = add_noise_to_init(
+                temp_inbound_shipments, inbound_shipments_noise
+            )
+
+            last_incoming_orders_noise = (
+                rng.choice(np.arange(3), size=get_init_len(next_incoming_orders))
+                - 1
+            )
+            next_incoming_orders = add_noise_to_init(
+                next_incoming_orders, last_incoming_orders_noise
+            )
+
+            stocks_noise = rng.choice(np.arange(5), size=get_init_len(stocks)) - 2
+            stocks = add_noise_to_init(stocks, stocks_noise)
+
+    elif env_type == "normal_10_4":
+        temp_orders = [[10] * lead for lead in order_lead_times]
+        temp_inbound_shipments = [[10] * lead for lead in shipment_lead_times]
+        next_incoming_orders = [10] * n_agents
+        stocks = [40] * n_agents
+
+        if add_noise:
+            # noise is uniform [-1,1]
+            orders_noise = rng.normal(loc=0, scale=5, size=get_init_len(temp_orders))
+            orders_noise = np.clip(
+                orders_noise, -10, 10
+            )  # clip to prevent negative orders
+            temp_orders = add_noise_to_init(temp_orders, orders_noise)
+
+            inbound_shipments_noise = rng.normal(
+                loc=0, scale=5, size=get_init_len(temp_inbound_shipments)
+            )
+            inbound_shipments_noise = np.clip(
+                inbound_shipments_noise, -10, 10
+            )  # clip to prevent negative inbound shipments
+            temp_inbound_shipments = add_noise_to_init(
+                temp_inbound_shipments, inbound_shipments_noise
+            )
+
+            last_incoming_orders_noise = rng.normal(
+                loc=0, scale=5, size=get_init_len(next_incoming_orders)
+            )
+            last_incoming_orders_noise = np.clip(
+                last_incoming_orders_noise, -10, 10
+            )
+            next_incoming_orders = add_noise_to_init(
+                next_incoming_orders, last_incoming_orders_noise
+            )
+
+            stocks_noise = rng.normal(loc=0, scale=4, size=get_init_len(stocks))
+            stocks_noise = np.clip(stocks_noise, -10, 10)
+            stocks = add_noise_to_init(stocks, stocks_noise)
+
+    else:
+        raise NotImplementedError(
+            f"Environment type {env_type} is not implemented yet."
+        )
+    return temp_orders, temp_inbound_shipments, next_incoming_orders, stocks
+
+
+# games longer than this draw their demand in blocks of this many turns when needed
+DEMAND_BLOCK_SIZE = 4096
+# ids telling the games apart, see `SupplyChainBotTournament.snapshot`
+_game_ids = itertools.count()
+# attributes that are views on other attributes, they are recreated when unpickling
+_VIEW_ATTRIBUTES = (
+    "_pipelines",
+    "stocks",
+    "next_incoming_orders",
+    "_clipped_stocks",
+    "_costs",
+    "_cum_costs",
+    "_flat_pipelines",
+    "_flat_view",
+    "_observation_views",
+    "_history",
+    "_history_views",
+    "_agent_history_views",
+)
+
+
 class SupplyChainBotTournament(gym.Env):
-    metadata = {"render.modes": ["human"]}
+    metadata = {"render.modes": ["human", "ansi"]}
 
     def __init__(
         self,
         env_type: str,
         seed=None,
+        verbose: bool = True,
+        flat_observations: bool = False,
+        scenario_bank=None,
+        instrumentation=None,
+        n_agents: int = 4,
+        n_turns: int = 20,
+        order_lead_times=None,
+        shipment_lead_times=None,
+        history_window: int = 0,
+        renderer=None,
     ):
+        """
+        :param verbose: print the total cost at the end of every game, like
+            ``renderer="summary"``
+        :param n_agents: length of the chain, the first agent is the retailer and the
+            last one the manufacturer
+        :param n_turns: length of a game, long games use constant memory per turn
+        :param order_lead_times: turns until an agent's order reaches its supplier,
+            2 for all agents but the manufacturer (1) by default
+        :param shipment_lead_times: turns until a shipment reaches an agent, 2 for all
+            agents by default
+        :param history_window: number of recent turns of flat observations kept in
+            `history`, 0 to keep none
+        :param renderer: `supply_chain_env.envs.rendering.Renderer` or render mode
+            rendering the games while they are played, overrides `verbose`
+        """
         super().__init__()
-        self.orders = (
-            []
-        )  # this is the decision each agent makes - how much do I need and should order?
-        self.inbound_shipments = (
-            []
-        )  # shipments inbound at each agent (for example, for the agent Distributor, how much the Manufacturer has shipped)
-        self.next_incoming_orders = []  # demand for each agent
-        self.stocks = []  # current inventory level for each agent
-        self.holding_cost = None
-        self.stockout_cost = None
-        self.cum_holding_cost = None
-        self.cum_stockout_cost = None
+        # Orders are the decision each agent makes - how much do I need and should
+        # order? Shipments are inbound at each agent (for example, for the agent
+        # Distributor, how much the Manufacturer has shipped). Both are kept in the ring
+        # buffer `self._pipelines` of shape (2, n_agents, 2 * lead_time) holding the
+        # orders at index 0 and the shipments at index 1. The slot at `self._head` is
+        # the one arriving on the next turn and the head moves one slot forward every
+        # turn. Every slot is mirrored at `slot + lead_time`, so that the pipelines in
+        # arrival order are the slice `head:head + lead_time`. Use the `orders` and
+        # `inbound_shipments` properties to get them as lists in arrival order.
+        # The pipelines, stocks and costs are views on the fields of one fixed-size
+        # record `self._state`, which is what `snapshot()` and `restore()` copy.
+        self._state = None
+        self._pipelines = None
+        self._head = 0
+        self.next_incoming_orders = None  # demand for each agent
+        self.stocks = None  # current inventory level for each agent
+        # holding costs at index 0 and stockout costs at index 1, of the last turn and
+        # cumulative, see the `holding_cost`, `stockout_cost`, ... properties
+        self._costs = None
+        self._cum_costs = None
         self.end_customer_demand = None  # end customer's demand, i.e., the customers buying goods at the retailer
+        # games longer than `DEMAND_BLOCK_SIZE` only keep the block of the demand from
+        # turn `self._demand_start` on in `end_customer_demand`, the blocks are drawn
+        # from generators seeded with `self._demand_seed` and the block number
+        self._demand_start = 0
+        self._demand_seed = None
         self.score_weight = (
             None  # a list of 2 lists, each of which has `n_agents` elements
         )
@@ -77,18 +264,63 @@ class SupplyChainBotTournament(gym.Env):
             3  # number of recent turns for which the state is persisted
         )
         self.prev_states = None
+        self._last_observations = None
+        # generator of the current game, drawn from the root seed of `seed()`
         self.np_random = None
-
-        self.n_agents = 4  # keeping 4 as default corresponding to brewery, distributor, wholesaler, retailer
+        # return a read-only (n_agents, n_fields) array refreshed in place instead of
+        # a list of dicts, see `supply_chain_env.envs.observations` for the layout and
+        # `self.observation_views` for dict-like access. `prev_states` is not kept.
+        self.flat_observations = flat_observations
+        self._observation_views = None
+        # the flat observations of the last `history_window` turns are kept in the
+        # ring buffer `self._history` of shape (2 * window, n_agents, n_fields), part
+        # of the state record. The slot at `self._history_head` holds the oldest turn
+        # and every slot is mirrored at `slot + window` like the pipelines, so the
+        # turns in order are the slice `head:head + window`. The read-only views of
+        # these slices are created once for every head position, see `history`.
+        if history_window < 0:
+            raise ValueError("The history window can't be negative")
+        self.history_window = history_window
+        self._history_head = 0
+
+        # 4 by default corresponding to brewery, distributor, wholesaler, retailer
+        self.n_agents = n_agents
         self.env_type = env_type
         if self.env_type not in ["classical", "uniform_0_2", "normal_10_4"]:
             raise NotImplementedError(
                 "env_type must be in ['classical', 'uniform_0_2', 'normal_10_4']"
             )
 
-        self.n_turns = 20
+        self.n_turns = n_turns
         self.add_noise_initialization = True
+        self.verbose = verbose  # print the total cost at the end of the game
+        # renders the games as they are played, see `supply_chain_env.envs.rendering`
+        if renderer is None and verbose:
+            renderer = "summary"
+        self.renderer = make_renderer(renderer)
+        if order_lead_times is None:
+            # order lead time of 2 for all agents except the manufacturer
+            order_lead_times = [2] * (self.n_agents - 1) + [1]
+        if shipment_lead_times is None:
+            shipment_lead_times = [2] * self.n_agents
+        self.order_lead_times = np.array(order_lead_times, dtype=np.int64)
+        self.shipment_lead_times = np.array(shipment_lead_times, dtype=np.int64)
+        for lead_times in (self.order_lead_times, self.shipment_lead_times):
+            if lead_times.shape != (self.n_agents,) or lead_times.min() < 1:
+                raise ValueError("Lead times must be at least 1 turn for every agent")
+        # length of the pipelines, i.e. the longest lead time
+        self.lead_time = int(
+            max(self.order_lead_times.max(), self.shipment_lead_times.max())
+        )
+        self._allocate()
         self.seed(seed)
+        # precomputed scenarios to `reset` to, a `ScenarioBank` or its path
+        self.scenario_bank = open_bank(scenario_bank)
+        if self.scenario_bank is not None:
+            self.scenario_bank.check_env(self)
+        # optional `supply_chain_env.instrumentation.Instrumentation` timing the phases
+        # of `step`
+        self.instrumentation = instrumentation
 
         # TODO calculate state shape
         # self.action_space = spaces.Discrete(N_DISCRETE_ACTIONS)
@@ -98,6 +330,8 @@ class SupplyChainBotTournament(gym.Env):
         serialize environment to a pickle string
         :rtype: string
         """
+        import cloudpickle
+
         canned = cloudpickle.dumps(self)
         return canned
 
@@ -105,222 +339,517 @@ class SupplyChainBotTournament(gym.Env):
         """
         deserialize environment from a pickle string
         """
+        import cloudpickle
+
         self.__dict__.update(cloudpickle.loads(pickle_string).__dict__)
 
+    def _allocate(self):
+        """
+        Preallocate the state arrays and the scratch buffers used by `step`.
+        """
+        n, lead_time = self.n_agents, self.lead_time
+        self._state = np.zeros((), dtype=self._state_dtype())
+        self._make_state_views()
+        self._make_history_views()
+        self._weights = np.zeros((2, n), dtype=np.float64)
+        # positive and negative part of the stocks
+        self._signs = np.array([[1], [-1]], dtype=np.int64)
+        # scratch buffers for the new shipments and backorders
+        self._shipment = np.zeros(n, dtype=np.int64)
+        self._backorder = np.zeros(n - 1, dtype=np.int64)
+        # flat indices of the ring buffer slots (and their mirrors) that new orders
+        # and shipments are written to, for every head position
+        heads = np.arange(lead_time)[:, None, None]
+        agents = np.arange(n)
+        mirrors = np.array([[0], [lead_time]])
+        order_slots = (heads + self.order_lead_times) % lead_time + mirrors
+        shipment_slots = (heads + self.shipment_lead_times) % lead_time + mirrors
+        self._order_index = np.ravel_multi_index(
+            (0, agents, order_slots), self._pipelines.shape
+        ).reshape(lead_time, -1)
+        self._shipment_index = np.ravel_multi_index(
+            (1, agents, shipment_slots), self._pipelines.shape
+        ).reshape(lead_time, -1)
+        self._order_lead_list = self.order_lead_times.tolist()
+        self._shipment_lead_list = self.shipment_lead_times.tolist()
+        # pipeline slots beyond an agent's lead times, orders at index 0 and shipments
+        # at index 1, they hold stale values and are masked with 0
+        lead_times = np.stack([self.order_lead_times, self.shipment_lead_times])
+        self._pipeline_padding = np.arange(lead_time) >= lead_times[..., None]
+        # flat observations hold the shipments before the orders
+        self._observation_layout = observation_layout(lead_time)
+        n_fields = n_observation_fields(lead_time)
+        self._flat_observations = np.zeros((n, n_fields))
+        kind, agent, slot = np.nonzero(self._pipeline_padding[::-1])
+        self._pipeline_padding_index = np.ravel_multi_index(
+            (agent, n_fields - (2 - kind) * lead_time + slot),
+            self._flat_observations.shape,
+        )
+        self._make_views()
+
+    def _state_dtype(self):
+        n, lead_time = self.n_agents, self.lead_time
+        history = []
+        if self.history_window:
+            n_fields = n_observation_fields(lead_time)
+            history = [
+                ("history", np.float64, (2 * self.history_window, n, n_fields)),
+                ("history_head", np.int64),
+            ]
+        return np.dtype(
+            [
+                ("pipelines", np.int64, (2, n, 2 * lead_time)),
+                ("stocks", np.int64, (n,)),
+                ("next_incoming_orders", np.int64, (n,)),
+                ("clipped_stocks", np.int64, (2, n)),
+                ("costs", np.float64, (2, n)),
+                ("cum_costs", np.float64, (2, n)),
+                ("head", np.int64),
+                ("turn", np.int64),
+                ("done", np.bool_),
+                ("game", np.int64),  # id of the game, snapshots only fit their game
+                *history,
+            ]
+        )
+
+    def _make_state_views(self):
+        state = self._state
+        self._pipelines = state["pipelines"]
+        self.stocks = state["stocks"]
+        self.next_incoming_orders = state["next_incoming_orders"]
+        self._clipped_stocks = state["clipped_stocks"]
+        self._costs = state["costs"]
+        self._cum_costs = state["cum_costs"]
+
+    def _make_history_views(self):
+        """
+        Create the views on the history for every head position, `reset()` keeps
+        the state record and they stay valid.
+        """
+        self._history = None
+        self._history_views = []
+        self._agent_history_views = []
+        window = self.history_window
+        if window:
+            self._history = self._state["history"]
+            history = self._history.view()
+            history.flags.writeable = False
+            self._history_views = [
+                history[head : head + window] for head in range(window)
+            ]
+            self._agent_history_views = [
+                [view[:, i] for i in range(self.n_agents)]
+                for view in self._history_views
+            ]
+
+    def _make_views(self):
+        """
+        Create the views on the flat observations, they are not pickled but recreated.
+        """
+        n, lead_time = self.n_agents, self.lead_time
+        self._flat_pipelines = self._flat_observations[:, -2 * lead_time :].reshape(
+            n, 2, lead_time
+        )
+        self._flat_view = self._flat_observations.view()
+        self._flat_view.flags.writeable = False
+        self._observation_views = None
+
+    @property
+    def observation_views(self):
+        """
+        Lazy dict-like views of each agent's row of the flat observations.
+        :rtype: list of ObservationView
+        """
+        if self._observation_views is None:
+            self._observation_views = [
+                ObservationView(
+                    self._flat_view[i],
+                    self._observation_layout,
+                    order_lead,
+                    shipment_lead,
+                )
+                for i, (order_lead, shipment_lead) in enumerate(
+                    zip(self._order_lead_list, self._shipment_lead_list)
+                )
+            ]
+        return self._observation_views
+
+    @property
+    def history(self):
+        """
+        Read-only view of the flat observations of the last `history_window` turns,
+        the oldest first and the current turn last. Before the first turn of a game
+        all slots hold its initial observations. See
+        `supply_chain_env.envs.observations` for the layout of the fields.
+
+        The view is valid for the current turn only and not copied, use
+        `agent_history` for the history of one agent.
+        :rtype: np.array of shape (history_window, n_agents, n_fields)
+        """
+        if not self.history_window:
+            raise ValueError("The env keeps no history, pass a history_window")
+        return self._history_views[self._history_head]
+
+    def agent_history(self, agent: int):
+        """
+        Read-only view of one agent's column of `history`, not copied.
+        :rtype: np.array of shape (history_window, n_fields)
+        """
+        if not self.history_window:
+            raise ValueError("The env keeps no history, pass a history_window")
+        return self._agent_history_views[self._history_head][agent]
+
+    def _record_history(self):
+        """
+        Append the current flat observations to the history, overwriting the oldest
+        turn and its mirror.
+        """
+        if not self.flat_observations:
+            self._update_flat_observations()
+        head, window = self._history_head, self.history_window
+        self._history[head] = self._flat_observations
+        self._history[head + window] = self._flat_observations
+        self._history_head = (head + 1) % window
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in _VIEW_ATTRIBUTES:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_state_views()
+        self._make_history_views()
+        self._make_views()
+
+    def snapshot(self):
+        """
+        Take a snapshot of the current turn to `restore()` it later.
+
+        The snapshot is a read-only fixed-size record, so the same snapshot can be
+        restored any number of times, into this env or any of its clones.
+        :rtype: np.ndarray, 0-dimensional structured array
+        """
+        if self.turn is None:
+            raise error.ResetNeeded("Environment must be reset before a snapshot")
+        state = self._state
+        state["head"] = self._head
+        if self.history_window:
+            state["history_head"] = self._history_head
+        state["turn"] = self.turn
+        state["done"] = self.done
+        snapshot = state.copy()
+        snapshot.flags.writeable = False
+        return snapshot
+
+    def restore(self, snapshot):
+        """
+        Go back to the turn of a snapshot of the current game.
+        :return: the observations of the restored turn
+        """
+        if snapshot["game"] != self._state["game"]:
+            raise ValueError("The snapshot was taken from a different game")
+        self._state[...] = snapshot
+        self._head = int(snapshot["head"])
+        if self.history_window:
+            self._history_head = int(snapshot["history_head"])
+        self.turn = int(snapshot["turn"])
+        self.done = bool(snapshot["done"])
+        if self.flat_observations:
+            return self._update_flat_observations()
+        self._last_observations = self._get_observations()
+        return self._last_observations
+
+    def clone(self):
+        """
+        Copy the environment, e.g. to run rollouts from the current turn.
+
+        Only the state record and the per-env buffers are copied. The demand trace,
+        score weights and random generator are shared with the original (they are
+        replaced, not modified, by `reset()`). The clone has no renderer and no
+        instrumentation, so rollouts are neither rendered nor counted as games of the
+        original.
+        :rtype: SupplyChainBotTournament
+        """
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.verbose = False
+        clone.renderer = None
+        clone.instrumentation = None
+        clone._state = self._state.copy()
+        clone._shipment = np.empty_like(self._shipment)
+        clone._backorder = np.empty_like(self._backorder)
+        clone._flat_observations = self._flat_observations.copy()
+        if self.prev_states is not None:
+            clone.prev_states = deque(self.prev_states)
+        clone._make_state_views()
+        clone._make_history_views()
+        clone._make_views()
+        return clone
+
+    def _update_clipped_stocks(self):
+        np.multiply(self._signs, self.stocks, out=self._clipped_stocks)
+        np.maximum(self._clipped_stocks, 0, out=self._clipped_stocks)
+
+    @property
+    def holding_cost(self):
+        return self._costs[0]
+
+    @property
+    def stockout_cost(self):
+        return self._costs[1]
+
+    @property
+    def cum_holding_cost(self):
+        return self._cum_costs[0]
+
+    @property
+    def cum_stockout_cost(self):
+        return self._cum_costs[1]
+
+    @property
+    def orders(self):
+        """
+        Pending orders of each agent in arrival order.
+        :rtype: list of lists
+        """
+        orders = self._pipelines[0, :, self._head : self._head + self.lead_time]
+        return [x[:lead] for x, lead in zip(orders.tolist(), self._order_lead_list)]
+
+    @property
+    def inbound_shipments(self):
+        """
+        Pending inbound shipments of each agent in arrival order.
+        :rtype: list of lists
+        """
+        head = self._head
+        shipments = self._pipelines[1, :, head : head + self.lead_time]
+        lead_times = self._shipment_lead_list
+        return [x[:lead] for x, lead in zip(shipments.tolist(), lead_times)]
+
+    def get_pipelines(self, out=None):
+        """
+        Pending orders (index 0) and inbound shipments (index 1) in arrival order,
+        slots beyond an agent's lead times are 0.
+        :param out: np.array to write the pipelines to
+        :rtype: np.array of shape (2, n_agents, lead_time)
+        """
+        head = self._head
+        pipelines = self._pipelines[:, :, head : head + self.lead_time]
+        if out is None:
+            out = pipelines.copy()
+        else:
+            out[...] = pipelines
+        out[self._pipeline_padding] = 0
+        return out
+
     def _get_observations(self):
         # these observations are in the order starting with the retailer and
         # subsequently going upstream, for example, for `n_agents` as 4, the
         # sequence is: retailer, wholesaler, distribution and manufacturer
+        head = self._head
+        orders, inbound_shipments = self._pipelines[
+            :, :, head : head + self.lead_time
+        ].tolist()
+        stocks = self.stocks.tolist()
+        next_incoming_orders = self.next_incoming_orders.tolist()
+        cum_cost = (self._cum_costs[0] + self._cum_costs[1]).tolist()
+        order_lead_times = self._order_lead_list
+        shipment_lead_times = self._shipment_lead_list
         observations = [None] * self.n_agents
         for i in range(self.n_agents):
             observations[i] = {
-                "current_stock": self.stocks[i],
+                "current_stock": stocks[i],
                 "turn": self.turn,
-                "cum_cost": self.cum_holding_cost[i] + self.cum_stockout_cost[i],
-                "inbound_shipments": list(self.inbound_shipments[i]),
-                "orders": list(self.orders[i]),
-                "next_incoming_order": self.next_incoming_orders[i],
+                "cum_cost": cum_cost[i],
+                "inbound_shipments": inbound_shipments[i][: shipment_lead_times[i]],
+                "orders": orders[i][: order_lead_times[i]],
+                "next_incoming_order": next_incoming_orders[i],
             }
         return observations
 
+    def _update_flat_observations(self):
+        flat, head = self._flat_observations, self._head
+        flat[:, 0] = self.stocks
+        flat[:, 1] = self.turn
+        np.add(self._cum_costs[0], self._cum_costs[1], out=flat[:, 2])
+        flat[:, 3] = self.next_incoming_orders
+        # shipments first, then orders
+        self._flat_pipelines[...] = self._pipelines[
+            ::-1, :, head : head + self.lead_time
+        ].transpose(1, 0, 2)
+        flat.put(self._pipeline_padding_index, 0)
+        return self._flat_view
+
     def _get_rewards(self):
-        return -(self.holding_cost + self.stockout_cost)
+        return -(self._costs[0] + self._costs[1])
 
     def _get_demand(self):
-        return self.end_customer_demand[self.turn]
+        index = self.turn - self._demand_start
+        if not 0 <= index < len(self.end_customer_demand):
+            self._load_demand_block(self.turn // DEMAND_BLOCK_SIZE)
+            index = self.turn - self._demand_start
+        return self.end_customer_demand[index]
+
+    @property
+    def demand(self):
+        """
+        End customer demand of the current turn.
+        """
+        return self._get_demand()
+
+    def _reset_demand(self, rng):
+        """
+        Draw the demand of a new game, of long games only the first block of it.
+        """
+        self._demand_start = 0
+        if self.n_turns <= DEMAND_BLOCK_SIZE:
+            self._demand_seed = None
+            self.end_customer_demand = draw_demand(self.env_type, rng, self.n_turns)
+        else:
+            self._demand_seed = int(rng.integers(2**63))
+            self._load_demand_block(0)
+
+    def _load_demand_block(self, block: int):
+        if self._demand_seed is None:
+            raise IndexError(f"No demand for turn {self.turn}")
+        start = block * DEMAND_BLOCK_SIZE
+        size = min(DEMAND_BLOCK_SIZE, self.n_turns - start)
+        rng = np.random.default_rng([self._demand_seed, block])
+        self.end_customer_demand = draw_demand(self.env_type, rng, size, start=start)
+        self._demand_start = start
 
     def seed(self, seed=None):
-        self.np_random, seed = seeding.np_random(seed)
-        return [seed]
+        """
+        Set the root seed the games are drawn from, see
+        `supply_chain_env.envs.streams`, and start over with its first game.
+        :type seed: int, sequence of ints, np.random.SeedSequence or None
+        :return: [entropy of the root seed]
+        """
+        self._seed_sequence = root_sequence(seed)
+        self._next_game = 0
+        return [self._seed_sequence.entropy]
 
-    def reset(self):
+    def reset(self, scenario_id=None, scenario=None, game: Optional[int] = None):
+        """
+        Start a new game, drawn at random or taken from the scenario bank.
+
+        Random games are the games ``0, 1, 2, ...`` of the root seed in the order
+        of the resets, each drawn from its own stream.
+        :type scenario_id: int or None
+        :param scenario: record of `scenario_dtype` to start from instead, e.g. the
+            initial state of a recorded trajectory
+        :param game: index of the game of the root seed to draw instead of the next
+            one, the following resets continue after it
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.count("env.resets")
         self.done = False
 
-        if self.env_type == "classical":
-            temp_orders = [[4, 4]] * (self.n_agents - 1) + [
-                [4]
-            ]  # order lead time of 2 for all agents except the manufacturer
+        if scenario_id is not None:
+            if self.scenario_bank is None:
+                raise ValueError("Resetting to a scenario id requires a scenario bank")
+            scenario = self.scenario_bank[scenario_id]
+        if scenario is not None:
+            temp_orders = [
+                x[:lead]
+                for x, lead in zip(scenario["orders"].tolist(), self._order_lead_list)
+            ]
             temp_inbound_shipments = [
-                [4, 4]
-            ] * self.n_agents  # shipment lead time of 2 for all agents
-            self.next_incoming_orders = [
-                4
-            ] * self.n_agents  # pending order delivery for each agent
-            self.stocks = [12] * self.n_agents  # initial inventory level for each agent
-
-            if self.add_noise_initialization:
-                # noise is uniform [-2,2]
-                orders_noise = (
-                    np.random.choice(np.arange(5), size=get_init_len(temp_orders)) - 2
-                )
-                temp_orders = add_noise_to_init(temp_orders, orders_noise)
-
-                inbound_shipments_noise = (
-                    np.random.choice(
-                        np.arange(5), size=get_init_len(temp_inbound_shipments)
-                    )
-                    - 2
+                x[:lead]
+                for x, lead in zip(
+                    scenario["inbound_shipments"].tolist(), self._shipment_lead_list
                 )
-                temp_inbound_shipments = add_noise_to_init(
-                    temp_inbound_shipments, inbound_shipments_noise
-                )
-
-                last_incoming_orders_noise = (
-                    np.random.choice(
-                        np.arange(5), size=get_init_len(self.next_incoming_orders)
-                    )
-                    - 2
-                )
-                self.next_incoming_orders = add_noise_to_init(
-                    self.next_incoming_orders, last_incoming_orders_noise
-                )
-
-                stocks_noise = (
-                    np.random.choice(np.arange(13), size=get_init_len(self.stocks)) - 6
-                )
-                self.stocks = add_noise_to_init(self.stocks, stocks_noise)
-
-            self.end_customer_demand = [4] * 4 + [8] * (self.n_turns - 4)
-            self.score_weight = [[0.5] * self.n_agents, [1] * self.n_agents]
-
-        elif self.env_type == "uniform_0_2":
-            temp_orders = [[1, 1]] * (self.n_agents - 1) + [[1]]
-            temp_inbound_shipments = [[1, 1]] * self.n_agents
-            self.next_incoming_orders = [1] * self.n_agents
-            self.stocks = [4] * self.n_agents
-
-            if self.add_noise_initialization:
-                # noise is uniform [-1,1]
-                orders_noise = (
-                    np.random.choice(np.arange(3), size=get_init_len(temp_orders)) - 1
-                )
-                temp_orders = add_noise_to_init(temp_orders, orders_noise)
-
-                inbound_shipments_noise = (
-                    np.random.choice(
-                        np.arange(3), size=get_init_len(temp_inbound_shipments)
-                    )
-                    - 1
-                )
-                temp_inbound_shipments = add_noise_to_init(
-                    temp_inbound_shipments, inbound_shipments_noise
-                )
-
-                last_incoming_orders_noise = (
-                    np.random.choice(
-                        np.arange(3), size=get_init_len(self.next_incoming_orders)
-                    )
-                    - 1
-                )
-                self.next_incoming_orders = add_noise_to_init(
-                    self.next_incoming_orders, last_incoming_orders_noise
-                )
-
-                stocks_noise = (
-                    np.random.choice(np.arange(5), size=get_init_len(self.stocks)) - 2
-                )
-                self.stocks = add_noise_to_init(self.stocks, stocks_noise)
-
-            # uniform [0, 2]
-            self.end_customer_demand = self.np_random.uniform(
-                low=0, high=3, size=self.n_turns
-            ).astype(np.int)
-            self.score_weight = [[0.5] * self.n_agents, [1] * self.n_agents]
-
-        elif self.env_type == "normal_10_4":
-            temp_orders = [[10, 10]] * (self.n_agents - 1) + [[10]]
-            temp_inbound_shipments = [[10, 10]] * self.n_agents
-            self.next_incoming_orders = [10] * self.n_agents
-            self.stocks = [40] * self.n_agents
-
-            if self.add_noise_initialization:
-                # noise is uniform [-1,1]
-                orders_noise = np.random.normal(
-                    loc=0, scale=5, size=get_init_len(temp_orders)
-                )
-                orders_noise = np.clip(
-                    orders_noise, -10, 10
-                )  # clip to prevent negative orders
-                temp_orders = add_noise_to_init(temp_orders, orders_noise)
-
-                inbound_shipments_noise = np.random.normal(
-                    loc=0, scale=5, size=get_init_len(temp_inbound_shipments)
-                )
-                inbound_shipments_noise = np.clip(
-                    inbound_shipments_noise, -10, 10
-                )  # clip to prevent negative inbound shipments
-                temp_inbound_shipments = add_noise_to_init(
-                    temp_inbound_shipments, inbound_shipments_noise
-                )
-
-                last_incoming_orders_noise = np.random.normal(
-                    loc=0, scale=5, size=get_init_len(self.next_incoming_orders)
-                )
-                last_incoming_orders_noise = np.clip(
-                    last_incoming_orders_noise, -10, 10
-                )
-                self.next_incoming_orders = add_noise_to_init(
-                    self.next_incoming_orders, last_incoming_orders_noise
-                )
-
-                stocks_noise = np.random.normal(
-                    loc=0, scale=4, size=get_init_len(self.stocks)
-                )
-                stocks_noise = np.clip(stocks_noise, -10, 10)
-                self.stocks = add_noise_to_init(self.stocks, stocks_noise)
-
-            self.end_customer_demand = self.np_random.normal(
-                loc=10, scale=4, size=self.n_turns
-            )
-            self.end_customer_demand = np.clip(self.turns, 0, 1000).astype(np.int)
-            # dqn paper page 24
-            self.score_weight = [
-                [1.0, 0.75, 0.5, 0.25] * self.n_agents,
-                [10.0] + [0.0] * (self.n_agents - 1),
             ]
+            self.next_incoming_orders = scenario["next_incoming_orders"].tolist()
+            self.stocks = scenario["stocks"].tolist()
+            if len(scenario["demand"]) != self.n_turns:
+                raise ValueError(f"The scenario must have {self.n_turns} turns")
+            self.end_customer_demand = scenario["demand"].astype(np.int64)
+            self._demand_start = 0
+            self._demand_seed = None
 
         else:
-            raise NotImplementedError(
-                f"Environment type {self.env_type} is not implemented yet."
+            game = self._next_game if game is None else game
+            self._next_game = game + 1
+            self.np_random = rng = scenario_rng(self._seed_sequence, game)
+            temp_orders, temp_inbound_shipments, next_incoming_orders, stocks = (
+                draw_initial_state(
+                    self.env_type,
+                    rng,
+                    self._order_lead_list,
+                    self._shipment_lead_list,
+                    self.add_noise_initialization,
+                )
             )
+            self.next_incoming_orders, self.stocks = next_incoming_orders, stocks
+            self._reset_demand(rng)
+        self.score_weight = score_weights(self.env_type, self.n_agents).tolist()
 
         # initialize other variables
-        self.cum_holding_cost = np.zeros(self.n_agents, dtype=np.float)
-        self.cum_stockout_cost = np.zeros(self.n_agents, dtype=np.float)
-        self.orders = [deque(x) for x in temp_orders]
-        self.inbound_shipments = [deque(x) for x in temp_inbound_shipments]
+        stocks, next_incoming_orders = self.stocks, self.next_incoming_orders
+        self._state.fill(0)
+        self._state["game"] = next(_game_ids)
+        self._make_state_views()
+        self.stocks[:] = stocks
+        self.next_incoming_orders[:] = next_incoming_orders
+        self._update_clipped_stocks()
+        self._weights = np.array(
+            [w[: self.n_agents] for w in self.score_weight], dtype=np.float64
+        )
+        self._head = 0
+        for i, x in enumerate(temp_orders):
+            self._pipelines[0, i, : len(x)] = x
+        for i, x in enumerate(temp_inbound_shipments):
+            self._pipelines[1, i, : len(x)] = x
+        self._pipelines[..., self.lead_time :] = self._pipelines[..., : self.lead_time]
         self.turn = 0
 
+        if self.history_window:
+            self._update_flat_observations()
+            self._history[...] = self._flat_observations
+            self._history_head = 0
+        if self.renderer is not None:
+            self.renderer.begin_game(self)
+            self.renderer.render_turn(self)
+        if self.flat_observations:
+            self.prev_states = None
+            return self._update_flat_observations()
         temp_obs = [None] * self.n_agents
         for i in range(self.n_agents):
             temp_obs[i] = {
                 "current_stock": self.stocks[i],
                 "turn": self.turn,
                 "cum_cost": self.cum_holding_cost[i] + self.cum_stockout_cost[i],
-                "inbound_shipments": list(self.inbound_shipments[i]),
-                "orders": list(self.orders[i])[::-1],
+                "inbound_shipments": self.inbound_shipments[i],
+                "orders": self.orders[i][::-1],
                 "next_incoming_order": self.next_incoming_orders[i],
             }
         prev_state = temp_obs
         self.prev_states = deque([prev_state] * (self.n_states_concatenated - 1))
-        return self._get_observations()
+        self._last_observations = self._get_observations()
+        return self._last_observations
 
     def render(self, mode="human"):
-        if mode != "human":
+        """
+        Print the state before the current turn, or return it as text with mode
+        ``"ansi"``. To render the games while they are played, pass a `renderer`
+        to the constructor instead.
+        """
+        if mode not in self.metadata["render.modes"]:
             raise NotImplementedError(f"Render mode {mode} is not implemented yet")
-        print("\n" + "=" * 50)
-        print("Turn #: ", self.turn + 1)
-        print(
-            "Stocks Levels (at the end of the turn): ",
-            ", ".join([str(x) for x in self.stocks]),
-        )
-        print("Orders Placed: ", [list(x) for x in self.orders])
-        print("Shipments Inbound: ", [list(x) for x in self.inbound_shipments])
-        print("Next Incoming Orders: ", self.next_incoming_orders)
-        print("Cumulative holding cost: ", self.cum_holding_cost)
-        print("Cumulative stockout cost: ", self.cum_stockout_cost)
-        print("Last holding cost: ", self.holding_cost)
-        print("Last stockout cost: ", self.stockout_cost)
+        text = format_turn(self)
+        if mode == "ansi":
+            return text
+        sys.stdout.write(text)
+
+    def close(self):
+        """
+        Write the text the renderer buffered.
+        """
+        if self.renderer is not None:
+            self.renderer.flush()
 
     def step(self, action: list):
         # sanity checks
@@ -328,75 +857,81 @@ class SupplyChainBotTournament(gym.Env):
             raise error.ResetNeeded(
                 "Environment is finished, please run env.reset() before taking actions"
             )
-        if get_init_len(action) != self.n_agents:
+        if len(action) != self.n_agents:
             raise error.InvalidAction(
                 f"Length of action array must be same as n_agents({self.n_agents})"
             )
-        if any(np.array(action) < 0):
+        if min(action) < 0:
             raise error.InvalidAction(
                 f"You can't order negative amount. You agents actions are: {action}"
             )
 
-        # concatenate previous states, self.prev_states in an queue of previous states
-        self.prev_states.popleft()
-        self.prev_states.append(self._get_observations())
-        # make incoming step
+        probe = self.instrumentation
+        if probe is not None:
+            probe.start()
+        # concatenate previous states, self.prev_states in an queue of previous states,
+        # the state didn't change since the last observations were returned
+        if not self.flat_observations:
+            self.prev_states.popleft()
+            self.prev_states.append(self._last_observations)
+        # make incoming step: the heads of the pipelines arrive
         demand = self._get_demand()
-        orders_inc = [order.popleft() for order in self.orders]
-        self.next_incoming_orders = [demand] + orders_inc[
-            :-1
-        ]  # what's the demand for each agent
-        ship_inc = [shipment.popleft() for shipment in self.inbound_shipments]
-        # calculate inbound shipments respecting orders and stock levels
-        for i in range(
-            self.n_agents - 1
-        ):  # manufacturer is assumed to have no constraints
-            max_possible_shipment = (
-                max(0, self.stocks[i + 1]) + ship_inc[i + 1]
-            )  # stock + incoming shipment
-            order = orders_inc[i] + max(
-                0, -self.stocks[i + 1]
-            )  # incoming order + stockout (backorder)
-            shipment = min(order, max_possible_shipment)
-            self.inbound_shipments[i].append(shipment)
-        self.inbound_shipments[-1].append(orders_inc[-1])
+        head = self._head
+        orders_inc = self._pipelines[0, :, head]
+        ship_inc = self._pipelines[1, :, head]
+        # calculate inbound shipments respecting orders and stock levels, the
+        # manufacturer is assumed to have no constraints
+        positive_stocks, negative_stocks = self._clipped_stocks
+        shipment, backorder = self._shipment, self._backorder
+        # stock + incoming shipment
+        np.add(positive_stocks[1:], ship_inc[1:], out=shipment[:-1])
+        # incoming order + stockout (backorder)
+        np.add(negative_stocks[1:], orders_inc[:-1], out=backorder)
+        np.minimum(shipment[:-1], backorder, out=shipment[:-1])
+        shipment[-1] = orders_inc[-1]
+        if probe is not None:
+            probe.lap("env.step.shipments")
         # update stocks
-        self.stocks = [(stock + inc) for stock, inc in zip(self.stocks, ship_inc)]
-        for i in range(1, self.n_agents):
-            self.stocks[i] -= orders_inc[i - 1]
+        self.stocks += ship_inc
+        self.stocks[1:] -= orders_inc[:-1]
         self.stocks[0] -= demand  # for the retailer
-        # update orders
-        for i in range(self.n_agents):
-            self.orders[i].append(action[i])
-        self.next_incoming_orders = [self._get_demand()] + [
-            x[0] for x in self.orders[:-1]
-        ]
-
-        # calculate costs
-        self.holding_cost = np.zeros(self.n_agents, dtype=np.float)
-        self.stockout_cost = np.zeros(self.n_agents, dtype=np.float)
-        for i in range(self.n_agents):
-            if self.stocks[i] >= 0:
-                self.holding_cost[i] = (
-                    max(0, self.stocks[i]) * self.score_weight[0][i]
-                )  # only applicable when stocks > 0
-            else:
-                self.stockout_cost[i] = (
-                    -min(0, self.stocks[i]) * self.score_weight[1][i]
-                )  # only applicable when stocks < 0
-        self.cum_holding_cost += self.holding_cost
-        self.cum_stockout_cost += self.stockout_cost
+        # enqueue the new shipments and orders, overwriting the slots that just arrived
+        self._pipelines.put(self._shipment_index[head], shipment)
+        self._pipelines.put(self._order_index[head], action)
+        self._head = head = (head + 1) % self.lead_time
+        self.next_incoming_orders[0] = demand
+        self.next_incoming_orders[1:] = self._pipelines[0, :-1, head]
+        if probe is not None:
+            probe.lap("env.step.stocks")
+
+        # calculate costs in one pass over the positive (holding costs) and negative
+        # (stockout costs) part of the stocks
+        self._update_clipped_stocks()
+        np.multiply(self._clipped_stocks, self._weights, out=self._costs)
+        self._cum_costs += self._costs
         # calculate reward
         rewards = self._get_rewards()
+        if probe is not None:
+            probe.lap("env.step.costs")
 
         # check if done
         if self.turn == self.n_turns - 1:
-            print(
-                f"\nTotal cost is: EUR {sum(self.cum_holding_cost + self.cum_stockout_cost)}"
-            )
             self.done = True
         else:
             self.turn += 1
-        state = self._get_observations()
-        # todo flatten observation dict
-        return state, rewards, self.done, {}
+        if self.flat_observations:
+            observations = self._update_flat_observations()
+        else:
+            observations = self._last_observations = self._get_observations()
+        if self.history_window:
+            self._record_history()
+        if probe is not None:
+            probe.lap("env.step.observations")
+            probe.stop("env.step")
+            probe.count("env.steps")
+        if self.renderer is not None:
+            if self.done:
+                self.renderer.end_game(self)
+            else:
+                self.renderer.render_turn(self)
+        return observations, rewards, self.done, {}
@@ -0,0 +1,76 @@
+"""Flat observation layout and lazy per-agent views.
+
+In the flat observation mode the environment returns one float64 array of shape
+``(n_agents, n_fields)``, one row per agent (retailer first). With ``L`` the
+`lead_time` of the env, the columns of a row are:
+
+* ``0`` current_stock: stock level, negative on stockout
+* ``1`` turn: current turn, starting at 0
+* ``2`` cum_cost: cumulative cost of the agent
+* ``3`` next_incoming_order: order to ship on the next turn
+* ``4 : 4 + L`` inbound_shipments: inbound shipments in arrival order
+* ``4 + L : 4 + 2 * L`` orders: placed orders in arrival order
+
+Agents with an order or shipment lead time shorter than `lead_time` (e.g. the
+manufacturer's orders) have the remaining pipeline columns set to 0.
+"""
+from collections.abc import Mapping
+
+SCALAR_FIELDS = ("current_stock", "turn", "cum_cost", "next_incoming_order")
+PIPELINE_FIELDS = ("inbound_shipments", "orders")
+INTEGER_FIELDS = ("current_stock", "turn", "next_incoming_order")
+
+
+def observation_layout(lead_time: int) -> dict:
+    """
+    Column index (scalar fields) or slice (pipeline fields) of every field in a row.
+    :rtype: dict
+    """
+    layout = {field: i for i, field in enumerate(SCALAR_FIELDS)}
+    start = len(SCALAR_FIELDS)
+    for field in PIPELINE_FIELDS:
+        layout[field] = slice(start, start + lead_time)
+        start += lead_time
+    return layout
+
+
+def n_observation_fields(lead_time: int) -> int:
+    return len(SCALAR_FIELDS) + len(PIPELINE_FIELDS) * lead_time
+
+
+class ObservationView(Mapping):
+    """
+    Read-only dict-like view of one agent's row of the flat observations.
+
+    Values are looked up when accessed, so the view always reflects the current turn.
+    Integer fields are returned as `int`, pipelines as read-only array views.
+    """
+
+    def __init__(
+        self, row, layout: dict, order_lead_time: int, shipment_lead_time=None
+    ):
+        self._row = row
+        self._layout = dict(layout)
+        orders = layout["orders"]
+        self._layout["orders"] = slice(orders.start, orders.start + order_lead_time)
+        if shipment_lead_time is not None:
+            shipments = layout["inbound_shipments"]
+            self._layout["inbound_shipments"] = slice(
+                shipments.start, shipments.start + shipment_lead_time
+            )
+
+    def __getitem__(self, key):
+        index = self._layout[key]
+        if isinstance(index, slice):
+            return self._row[index]
+        value = self._row.item(index)
+        return int(value) if key in INTEGER_FIELDS else value
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self):
+        return len(self._layout)
+
+    def __repr__(self):
+        return f"ObservationView({dict(self)})"
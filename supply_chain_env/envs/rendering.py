@@ -0,0 +1,268 @@
+"""Renderers of the games of an env, writing through a buffer.
+
+An env with a renderer (``SupplyChainBotTournament(..., renderer="summary")``) calls it
+when a game starts, before every turn and when the game ends, so games are rendered
+by playing them, whoever plays them. The modes are:
+
+* ``"none"``: nothing, like ``renderer=None``
+* ``"summary"``: the total cost of every game, what ``verbose=True`` prints
+* ``"turns"``: the state before every turn and the total cost, like `render()`
+* ``"live"``: a dashboard of the current game and the games played so far, redrawn
+  in place on the terminal at most ``max_fps`` times per second
+
+``every_game=k`` and ``every_turn=k`` only render every k-th game or turn, the others
+cost a counter increment. The turns go through a `BufferedWriter`, which writes large
+chunks instead of a line at a time, so rendering them costs little compared to the
+game. The buffer is flushed when a rendered game ends, so its total cost shows at
+once and in order with other output of the program.
+
+Usage::
+
+    env = SupplyChainBotTournament("classical", renderer=TurnRenderer(every_game=100))
+"""
+import atexit
+import os
+import sys
+import time
+from typing import Optional
+
+RENDER_MODES = ("none", "summary", "turns", "live")
+
+
+class BufferedWriter:
+    """
+    Text kept in memory and written to a stream in chunks of `max_bytes`, or once
+    `max_delay` seconds passed since the last write to the stream.
+    """
+
+    def __init__(self, stream=None, max_bytes: int = 2**16, max_delay: float = 0.5):
+        """
+        :param stream: text stream, standard output at the time of the writes if None
+        """
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, text: str):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.max_bytes:
+            self.flush()
+        elif time.monotonic() - self._last_flush >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._parts:
+            return
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        stream = sys.stdout if self.stream is None else self.stream
+        stream.write(text)
+        stream.flush()
+
+    def discard(self):
+        """
+        Drop the buffered text without writing it.
+        """
+        self._parts.clear()
+        self._size = 0
+
+    def __getstate__(self):
+        # buffered text is written by the original only
+        state = self.__dict__.copy()
+        state["_parts"] = []
+        state["_size"] = 0
+        return state
+
+
+# shared by the renderers writing to standard output, so their text stays in order
+STDOUT = BufferedWriter()
+atexit.register(STDOUT.flush)
+if hasattr(os, "register_at_fork"):
+    # the parent writes the text it buffered before forking
+    os.register_at_fork(after_in_child=STDOUT.discard)
+
+
+def format_turn(env) -> str:
+    """
+    State of a scalar env before its current turn, the text of `render()`.
+    """
+    return (
+        f"\n{'=' * 50}\n"
+        f"Turn #:  {env.turn + 1}\n"
+        "Stocks Levels (at the end of the turn):  "
+        f"{', '.join([str(x) for x in env.stocks])}\n"
+        f"Orders Placed:  {env.orders}\n"
+        f"Shipments Inbound:  {env.inbound_shipments}\n"
+        f"Next Incoming Orders:  {env.next_incoming_orders.tolist()}\n"
+        # lists format much faster than NumPy arrays
+        f"Cumulative holding cost:  {env.cum_holding_cost.tolist()}\n"
+        f"Cumulative stockout cost:  {env.cum_stockout_cost.tolist()}\n"
+        f"Last holding cost:  {env.holding_cost.tolist()}\n"
+        f"Last stockout cost:  {env.stockout_cost.tolist()}\n"
+    )
+
+
+def total_cost(env) -> float:
+    return float(sum(env.cum_holding_cost + env.cum_stockout_cost))
+
+
+class Renderer:
+    """
+    Base class of the renderers, renders nothing. The env calls `begin_game` on
+    reset, `render_turn` before every turn and `end_game` after the last one.
+    """
+
+    def __init__(self, writer: Optional[BufferedWriter] = None, every_game: int = 1):
+        """
+        :param writer: buffer of the text, the one of standard output if None
+        :param every_game: render only every this many games, starting with the first
+        """
+        if every_game < 1:
+            raise ValueError("every_game must be at least 1")
+        self.writer = STDOUT if writer is None else writer
+        self.every_game = every_game
+        self.n_games = 0
+        # whether the current game is rendered
+        self.rendering = False
+
+    def begin_game(self, env):
+        self.rendering = self.n_games % self.every_game == 0
+        self.n_games += 1
+
+    def render_turn(self, env):
+        pass
+
+    def end_game(self, env):
+        pass
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.flush()
+
+
+class SummaryRenderer(Renderer):
+    """
+    Total cost of every game, written when the game ends.
+    """
+
+    def end_game(self, env):
+        if self.rendering:
+            self.writer.write(f"\nTotal cost is: EUR {total_cost(env)}\n")
+            # with the turns of the game, if any
+            self.writer.flush()
+
+
+class TurnRenderer(SummaryRenderer):
+    """
+    State before every turn, or every `every_turn`-th turn, and the total cost of
+    every game.
+    """
+
+    def __init__(self, writer=None, every_game: int = 1, every_turn: int = 1):
+        super().__init__(writer, every_game)
+        if every_turn < 1:
+            raise ValueError("every_turn must be at least 1")
+        self.every_turn = every_turn
+
+    def render_turn(self, env):
+        if self.rendering and env.turn % self.every_turn == 0:
+            self.writer.write(format_turn(env))
+
+
+class LiveRenderer(Renderer):
+    """
+    Dashboard of the current game and of the total costs of the games played,
+    redrawn in place with ANSI escape codes at most `max_fps` times per second.
+    """
+
+    def __init__(self, stream=None, max_fps: float = 10.0, every_game: int = 1):
+        """
+        :param stream: terminal to draw on, standard output at the time of drawing if
+            None
+        """
+        super().__init__(BufferedWriter(stream, max_delay=float("inf")), every_game)
+        self.min_interval = 1.0 / max_fps
+        self._last_draw = -float("inf")
+        self._n_lines = 0
+        self._frame = None
+        self.n_finished = 0
+        self.sum_costs = 0.0
+        self.best_cost = float("inf")
+        self.worst_cost = -float("inf")
+
+    def _format(self, env) -> list:
+        game = f"game {self.n_games}, turn {env.turn + 1}/{env.n_turns}"
+        mean = self.sum_costs / self.n_finished if self.n_finished else float("nan")
+        return [
+            f"{game:<32} total cost so far: {total_cost(env):12.1f}",
+            f"stocks: {', '.join([str(x) for x in env.stocks])}",
+            f"next incoming orders: {env.next_incoming_orders.tolist()}",
+            f"games played: {self.n_finished:<8} mean total cost: {mean:12.1f}",
+            f"best: {self.best_cost:12.1f} worst: {self.worst_cost:12.1f}",
+        ]
+
+    def _update(self, env, keep: bool = False):
+        # frames are only formatted when they are drawn, or kept to be drawn by
+        # `flush` if they are the last one of a game
+        now = time.monotonic()
+        due = now - self._last_draw >= self.min_interval
+        if due or keep:
+            self._frame = self._format(env)
+        if due:
+            self._last_draw = now
+            self._draw()
+
+    def _draw(self):
+        if self._frame is None:
+            return
+        # move to the first line of the last frame and clear everything below
+        erase = f"\x1b[{self._n_lines}F\x1b[J" if self._n_lines else ""
+        self.writer.write(erase + "\n".join(self._frame) + "\n")
+        self.writer.flush()
+        self._n_lines = len(self._frame)
+        self._frame = None
+
+    def render_turn(self, env):
+        if self.rendering:
+            self._update(env)
+
+    def end_game(self, env):
+        cost = total_cost(env)
+        self.n_finished += 1
+        self.sum_costs += cost
+        self.best_cost = min(self.best_cost, cost)
+        self.worst_cost = max(self.worst_cost, cost)
+        if self.rendering:
+            self._update(env, keep=True)
+
+    def flush(self):
+        # the last frame, even if it came too soon after the previous one
+        self._draw()
+        super().flush()
+
+
+def make_renderer(renderer, **kwargs) -> Optional[Renderer]:
+    """
+    Renderer given by mode, renderers are passed through.
+    :type renderer: str (see `RENDER_MODES`), Renderer or None
+    :param kwargs: passed to the renderer of a mode
+    """
+    if renderer is None or isinstance(renderer, Renderer):
+        return renderer
+    if renderer == "none":
+        return None
+    if renderer == "summary":
+        return SummaryRenderer(**kwargs)
+    if renderer == "turns":
+        return TurnRenderer(**kwargs)
+    if renderer == "live":
+        return LiveRenderer(**kwargs)
+    raise ValueError(f"Unknown render mode {renderer!r}, choose from {RENDER_MODES}")
@@ -0,0 +1,255 @@
+"""Precomputed scenarios: initial states and end customer demand traces.
+
+A scenario bank is a ``.npy`` file of scenario records for one env type, memory-mapped
+read-only when opened, so many processes can share one bank on disk without
+generating noise or copying it into every process. Scenarios are looked up by id,
+i.e. their index in the file. A ``.json`` file next to it records how the bank was
+generated.
+
+Banks are generated with ``python -m supply_chain_env.scenario_bank``.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+ENV_TYPES = ("classical", "uniform_0_2", "normal_10_4")
+
+# Initial pipeline level, initial stock and initialization noise for each env type.
+# These mirror the values of `SupplyChainBotTournament.reset`: noise is either drawn
+# uniformly from the integers [-width, width] or from a normal distribution with the
+# given scale clipped to [-width, width].
+INIT_PARAMS = {
+    "classical": {
+        "level": 4,
+        "stock": 12,
+        "noise": "uniform",
+        "pipeline_noise": (None, 2),
+        "stock_noise": (None, 6),
+    },
+    "uniform_0_2": {
+        "level": 1,
+        "stock": 4,
+        "noise": "uniform",
+        "pipeline_noise": (None, 1),
+        "stock_noise": (None, 2),
+    },
+    "normal_10_4": {
+        "level": 10,
+        "stock": 40,
+        "noise": "normal",
+        "pipeline_noise": (5, 10),
+        "stock_noise": (4, 10),
+    },
+}
+
+# scenarios are generated in blocks of this size, each from its own seed sequence;
+# small, as a bank's last block is generated in full whatever the size of the bank
+BLOCK_SIZE = 1024
+
+
+def score_weights(env_type: str, n_agents: int = 4) -> np.ndarray:
+    """
+    Holding (row 0) and stockout (row 1) cost per item for each agent.
+    :rtype: np.array of shape (2, n_agents)
+    """
+    if env_type == "normal_10_4":
+        # dqn paper page 24: holding costs of 1, 0.75, 0.5 and 0.25 for 4 agents
+        holding = 1 - np.arange(n_agents) / n_agents
+        return np.array([holding, [10.0] + [0.0] * (n_agents - 1)])
+    return np.array([[0.5] * n_agents, [1.0] * n_agents])
+
+
+def draw_demand(env_type: str, rng, size, start: int = 0) -> np.ndarray:
+    """
+    End customer demand of consecutive turns, the last axis of `size` is the turn.
+    :param start: turn of the first drawn demand, the classical demand depends on it
+    :rtype: np.array of ints
+    """
+    if env_type == "classical":
+        turns = np.arange(start, start + np.atleast_1d(size)[-1])
+        return np.broadcast_to(np.where(turns < 4, 4, 8), size).copy()
+    if env_type == "uniform_0_2":
+        # uniform [0, 2]
+        return rng.uniform(low=0, high=3, size=size).astype(int)
+    if env_type == "normal_10_4":
+        return np.clip(rng.normal(loc=10, scale=4, size=size), 0, 1000).astype(int)
+    raise NotImplementedError(f"env_type must be in {list(ENV_TYPES)}")
+
+
+def scenario_dtype(n_agents: int = 4, lead_time: int = 2, n_turns: int = 20):
+    """
+    Record of one scenario, pipelines are in arrival order. The manufacturer has an
+    order lead time of one turn, so its last order slot is always 0.
+    """
+    return np.dtype(
+        [
+            ("orders", np.int32, (n_agents, lead_time)),
+            ("inbound_shipments", np.int32, (n_agents, lead_time)),
+            ("next_incoming_orders", np.int32, (n_agents,)),
+            ("stocks", np.int32, (n_agents,)),
+            ("demand", np.int32, (n_turns,)),
+        ]
+    )
+
+
+def _noise(rng, params, spec, size):
+    scale, width = spec
+    if params["noise"] == "uniform":
+        return rng.choice(np.arange(2 * width + 1), size=size) - width
+    return np.clip(rng.normal(loc=0, scale=scale, size=size), -width, width)
+
+
+def generate_scenarios(
+    env_type: str,
+    n_scenarios: int,
+    rng,
+    n_agents: int = 4,
+    lead_time: int = 2,
+    n_turns: int = 20,
+    add_noise: bool = True,
+) -> np.ndarray:
+    """
+    Draw initial states and demand traces of `n_scenarios` games at once.
+    :type rng: np.random.Generator or np.random.RandomState
+    :rtype: np.array of `scenario_dtype` records
+    """
+    if env_type not in INIT_PARAMS:
+        raise NotImplementedError(f"env_type must be in {list(ENV_TYPES)}")
+    params = INIT_PARAMS[env_type]
+    shape = (n_scenarios, n_agents)
+    dtype = scenario_dtype(n_agents, lead_time, n_turns)
+    scenarios = np.zeros(n_scenarios, dtype=dtype)
+
+    orders = np.full(shape + (lead_time,), params["level"], dtype=np.float64)
+    shipments = orders.copy()
+    incoming = np.full(shape, params["level"], dtype=np.float64)
+    stocks = np.full(shape, params["stock"], dtype=np.float64)
+    if add_noise:
+        orders += _noise(rng, params, params["pipeline_noise"], orders.shape)
+        shipments += _noise(rng, params, params["pipeline_noise"], shipments.shape)
+        incoming += _noise(rng, params, params["pipeline_noise"], shape)
+        stocks += _noise(rng, params, params["stock_noise"], shape)
+    # truncate towards zero like `add_noise_to_init`
+    scenarios["orders"] = orders.astype(int)
+    scenarios["orders"][:, -1, 1:] = 0  # manufacturer has an order lead time of 1
+    scenarios["inbound_shipments"] = shipments.astype(int)
+    scenarios["next_incoming_orders"] = incoming.astype(int)
+    scenarios["stocks"] = stocks.astype(int)
+
+    scenarios["demand"] = draw_demand(env_type, rng, (n_scenarios, n_turns))
+    return scenarios
+
+
+class ScenarioBank:
+    """
+    Read-only memory-mapped scenario records of one env type, indexed by scenario id.
+
+    Pickling a bank only pickles its path, so it can be handed to worker processes
+    which then map the same file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.metadata = json.loads(self.path.with_suffix(".json").read_text())
+        self.scenarios = np.load(self.path, mmap_mode="r")
+
+    @classmethod
+    def create(
+        cls, path, env_type: str, n_scenarios: int, seed: int = 0, n_turns: int = 20
+    ):
+        """
+        Generate a bank block by block, so memory use doesn't grow with its size.
+
+        Block `b` is drawn from ``np.random.default_rng([seed, b])`` and the last
+        block is drawn in full and truncated, so a scenario only depends on
+        `env_type`, `seed` and its id, and not on the size of the bank.
+        :rtype: ScenarioBank
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        dtype = scenario_dtype(n_turns=n_turns)
+        scenarios = np.lib.format.open_memmap(
+            path, mode="w+", dtype=dtype, shape=(n_scenarios,)
+        )
+        for block, start in enumerate(range(0, n_scenarios, BLOCK_SIZE)):
+            stop = min(start + BLOCK_SIZE, n_scenarios)
+            rng = np.random.default_rng([seed, block])
+            scenarios[start:stop] = generate_scenarios(
+                env_type, BLOCK_SIZE, rng, n_turns=n_turns
+            )[: stop - start]
+        scenarios.flush()
+        del scenarios
+        metadata = {
+            "env_type": env_type,
+            "n_scenarios": n_scenarios,
+            "seed": seed,
+            "n_turns": n_turns,
+            "block_size": BLOCK_SIZE,
+        }
+        path.with_suffix(".json").write_text(json.dumps(metadata, indent=2))
+        return cls(path)
+
+    @classmethod
+    def save(cls, path, env_type: str, scenarios: np.ndarray, **metadata):
+        """
+        Write given scenarios as a bank, e.g. the worst cases of a stress test.
+        :param scenarios: records of `scenario_dtype`
+        :param metadata: JSON-serializable description of the scenarios
+        :rtype: ScenarioBank
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, np.ascontiguousarray(scenarios))
+        metadata = {
+            "env_type": env_type,
+            "n_scenarios": len(scenarios),
+            "n_turns": scenarios.dtype["demand"].shape[0],
+            **metadata,
+        }
+        path.with_suffix(".json").write_text(json.dumps(metadata, indent=2))
+        return cls(path)
+
+    @property
+    def env_type(self) -> str:
+        return self.metadata["env_type"]
+
+    @property
+    def n_turns(self) -> int:
+        return self.metadata["n_turns"]
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def __getitem__(self, scenario_id):
+        return self.scenarios[scenario_id]
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def check_env(self, env):
+        """
+        Raise a ValueError if the scenarios don't fit the env.
+        """
+        if (self.env_type, self.n_turns) != (env.env_type, env.n_turns):
+            raise ValueError(
+                f"Scenario bank of {self.env_type} with {self.n_turns} turns doesn't "
+                f"fit {env.env_type} with {env.n_turns} turns"
+            )
+        if self.scenarios.dtype["orders"].shape != (env.n_agents, env.lead_time):
+            raise ValueError(
+                "Scenario bank doesn't fit the env's number of agents and lead time"
+            )
+
+
+def open_bank(scenario_bank):
+    """
+    Open a bank given by path, banks are passed through.
+    :type scenario_bank: str, Path, ScenarioBank or None
+    """
+    if scenario_bank is None or isinstance(scenario_bank, ScenarioBank):
+        return scenario_bank
+    return ScenarioBank(scenario_bank)
@@ -0,0 +1,85 @@
+"""Independent random streams of games, derived from one root seed.
+
+An env is seeded with a root seed and plays the games ``0, 1, 2, ...`` of it. Game
+`k` of a root seed draws from its own seed sequence, the `k`-th child that
+``SeedSequence(seed).spawn`` would create. It is constructed directly from the root's
+entropy and the spawn key ``(k,)``, so any process can start any game without
+spawning the ones before it. Every game sequence has two children again:
+
+* ``SCENARIO``: initial state noise and demand trace of the game
+* ``AGENTS``: random numbers of the agents, see `seed_agents`
+* ``BATCH``: for game `b`, the games of the `b`-th random reset of a vector env,
+  which draws all of its games at once, see `batch_rng`
+
+So a game only depends on its root seed and its index, whether it is played by a
+scalar env, a vector env or a worker process, and the games of a root seed, as well
+as the root seeds, are statistically independent. Nothing is drawn from NumPy's
+global generator.
+"""
+from typing import Optional
+
+import numpy as np
+
+SCENARIO, AGENTS, BATCH = 0, 1, 2
+
+
+def root_sequence(seed=None) -> np.random.SeedSequence:
+    """
+    Seed sequence of a root seed, fresh entropy if None.
+    :type seed: int, sequence of ints, np.random.SeedSequence or None
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def game_sequence(seed, game: int = 0, stream: Optional[int] = None):
+    """
+    Seed sequence of a game of a root seed, or of one of its streams.
+    :param stream: `SCENARIO`, `AGENTS` or None for the game's own sequence
+    :rtype: np.random.SeedSequence
+    """
+    root = root_sequence(seed)
+    spawn_key = (*root.spawn_key, game)
+    if stream is not None:
+        spawn_key += (stream,)
+    return np.random.SeedSequence(
+        root.entropy, spawn_key=spawn_key, pool_size=root.pool_size
+    )
+
+
+def scenario_rng(seed, game: int = 0) -> np.random.Generator:
+    """
+    Generator of the initial state and demand of a game.
+    """
+    return np.random.default_rng(game_sequence(seed, game, SCENARIO))
+
+
+def batch_rng(seed, batch: int = 0) -> np.random.Generator:
+    """
+    Generator of the initial states and demand of a batch of games drawn at once.
+    """
+    return np.random.default_rng(game_sequence(seed, batch, BATCH))
+
+
+def agents_seed(seed, game: int = 0, agent: Optional[int] = None) -> np.ndarray:
+    """
+    Seed of NumPy's global generator for the agents of a game, or for one of them.
+    :rtype: np.array of uint32
+    """
+    sequence = game_sequence(seed, game, AGENTS)
+    if agent is not None:
+        sequence = np.random.SeedSequence(
+            sequence.entropy,
+            spawn_key=(*sequence.spawn_key, agent),
+            pool_size=sequence.pool_size,
+        )
+    return sequence.generate_state(4)
+
+
+def seed_agents(seed, game: int = 0, agent: Optional[int] = None):
+    """
+    Seed NumPy's global generator, which agents like the ones of ``bot.py`` draw
+    from, with the agents' stream of a game.
+    """
+    np.random.seed(agents_seed(seed, game, agent))
@@ -0,0 +1,290 @@
+import gym
+import numpy as np
+from gym import error
+
+from supply_chain_env.envs.env import draw_initial_state
+from supply_chain_env.envs.scenario_bank import (
+    INIT_PARAMS,
+    draw_demand,
+    generate_scenarios,
+    open_bank,
+    scenario_dtype,
+    score_weights,
+)
+from supply_chain_env.envs.streams import batch_rng, root_sequence, scenario_rng
+
+
+class VectorSupplyChainBotTournament(gym.Env):
+    """
+    N independent games of `SupplyChainBotTournament` stepped at once.
+
+    The state of all games is kept as struct-of-arrays, i.e. every quantity has a
+    leading axis of length `n_envs` followed by the agent axis (retailer first):
+
+    * ``stocks``, ``next_incoming_orders``: ``(n_envs, n_agents)`` integers
+    * ``orders``, ``inbound_shipments``: ``(n_envs, n_agents, lead_time)`` integers,
+      the pipeline slot 0 is the one arriving on the next turn. The manufacturer
+      has an order lead time of one turn, so its last order slot is always 0.
+    * ``holding_cost``, ``stockout_cost`` and their cumulative versions:
+      ``(n_envs, n_agents)`` floats
+
+    All games share the same turn counter and are finished at the same time. With a
+    `scenario_bank` (a `ScenarioBank` or its path) the games can be reset to
+    precomputed scenarios, see `reset`. Random games are drawn all at once from a
+    stream of every reset, and ``reset(games=...)`` draws the games a scalar env with
+    the same seed plays, see `supply_chain_env.envs.streams`.
+    """
+
+    metadata = {"render.modes": ["human"]}
+
+    def __init__(self, env_type: str, n_envs: int = 1, seed=None, scenario_bank=None):
+        super().__init__()
+        if env_type not in INIT_PARAMS:
+            raise NotImplementedError(
+                "env_type must be in ['classical', 'uniform_0_2', 'normal_10_4']"
+            )
+        self.env_type = env_type
+        self.n_envs = n_envs
+        self.n_agents = 4
+        self.n_turns = 20
+        self.lead_time = 2
+        # order lead time of 2 for all agents except the manufacturer
+        self.order_lead_times = np.array([self.lead_time] * (self.n_agents - 1) + [1])
+        self.add_noise_initialization = True
+
+        self.orders = None
+        self.inbound_shipments = None
+        self.next_incoming_orders = None
+        self.stocks = None
+        self.holding_cost = None
+        self.stockout_cost = None
+        self.cum_holding_cost = None
+        self.cum_stockout_cost = None
+        self.end_customer_demand = None  # (n_envs, n_turns)
+        self.score_weight = None  # (2, n_agents), shared by all games
+        self.turn = None
+        self.done = True
+        self.seed(seed)
+        self.scenario_bank = open_bank(scenario_bank)
+        if self.scenario_bank is not None:
+            self.scenario_bank.check_env(self)
+
+    @classmethod
+    def from_envs(cls, envs):
+        """
+        Create a batch holding the current state of already reset scalar envs.
+        :type envs: list of SupplyChainBotTournament, all of the same env type and turn
+        :rtype: VectorSupplyChainBotTournament
+        """
+        first = envs[0]
+        key = (first.env_type, first.turn)
+        if any((env.env_type, env.turn) != key for env in envs):
+            raise ValueError("All environments must share env_type and turn")
+        vec = cls(env_type=first.env_type, n_envs=len(envs))
+        for k, env in enumerate(envs):
+            vec.set_game(k, env)
+        return vec
+
+    def set_game(self, k: int, env):
+        """
+        Set the k-th game to the current state of an already reset scalar env. All
+        games share the turn, so it is set to the env's turn.
+        :type env: SupplyChainBotTournament
+        """
+        if (env.n_agents, env.n_turns) != (self.n_agents, self.n_turns) or not (
+            np.array_equal(env.order_lead_times, self.order_lead_times)
+            and (env.shipment_lead_times == self.lead_time).all()
+        ):
+            raise ValueError("Only envs of the default chain can be batched")
+        if self.stocks is None:
+            self._allocate()
+        self.stocks[k] = env.stocks
+        self.next_incoming_orders[k] = env.next_incoming_orders
+        self.orders[k], self.inbound_shipments[k] = env.get_pipelines()
+        self.end_customer_demand[k] = env.end_customer_demand
+        self.cum_holding_cost[k] = env.cum_holding_cost
+        self.cum_stockout_cost[k] = env.cum_stockout_cost
+        self.score_weight = score_weights(self.env_type, self.n_agents)
+        self.turn = env.turn
+        self.done = env.done
+
+    def _allocate(self):
+        shape = (self.n_envs, self.n_agents)
+        self.stocks = np.zeros(shape, dtype=np.int64)
+        self.next_incoming_orders = np.zeros(shape, dtype=np.int64)
+        self.orders = np.zeros(shape + (self.lead_time,), dtype=np.int64)
+        self.inbound_shipments = np.zeros(shape + (self.lead_time,), dtype=np.int64)
+        self.holding_cost = np.zeros(shape, dtype=np.float64)
+        self.stockout_cost = np.zeros(shape, dtype=np.float64)
+        self.cum_holding_cost = np.zeros(shape, dtype=np.float64)
+        self.cum_stockout_cost = np.zeros(shape, dtype=np.float64)
+        self.end_customer_demand = np.zeros((self.n_envs, self.n_turns), dtype=np.int64)
+
+    def _get_observations(self):
+        return {
+            "current_stock": self.stocks.copy(),
+            "turn": self.turn,
+            "cum_cost": self.cum_holding_cost + self.cum_stockout_cost,
+            "inbound_shipments": self.inbound_shipments.copy(),
+            "orders": self.orders.copy(),
+            "next_incoming_order": self.next_incoming_orders.copy(),
+        }
+
+    def get_observations(self):
+        """
+        Observations of the current turn, as returned by `reset` and `step`.
+        """
+        return self._get_observations()
+
+    def _get_rewards(self):
+        return -(self.holding_cost + self.stockout_cost)
+
+    def seed(self, seed=None):
+        """
+        Set the root seed the games are drawn from and start over with its first
+        game, see `SupplyChainBotTournament.seed`.
+        """
+        self._seed_sequence = root_sequence(seed)
+        self._next_batch = 0
+        return [self._seed_sequence.entropy]
+
+    def _draw_games(self, games) -> np.ndarray:
+        """
+        Draw games of the root seed like `SupplyChainBotTournament.reset`, each from
+        its own stream, one by one.
+        :rtype: np.array of `scenario_dtype` records
+        """
+        dtype = scenario_dtype(self.n_agents, self.lead_time, self.n_turns)
+        scenarios = np.zeros(len(games), dtype=dtype)
+        order_lead_times = self.order_lead_times.tolist()
+        shipment_lead_times = [self.lead_time] * self.n_agents
+        for k, game in enumerate(games):
+            rng = scenario_rng(self._seed_sequence, game)
+            orders, shipments, incoming, stocks = draw_initial_state(
+                self.env_type,
+                rng,
+                order_lead_times,
+                shipment_lead_times,
+                self.add_noise_initialization,
+            )
+            for i, agent_orders in enumerate(orders):
+                scenarios["orders"][k, i, : len(agent_orders)] = agent_orders
+            scenarios["inbound_shipments"][k] = shipments
+            scenarios["next_incoming_orders"][k] = incoming
+            scenarios["stocks"][k] = stocks
+            scenarios["demand"][k] = draw_demand(self.env_type, rng, self.n_turns)
+        return scenarios
+
+    def reset(self, scenario_id=None, games=None, scenarios=None):
+        """
+        Start new games, drawn at random or taken from the scenario bank.
+        :type scenario_id: array-like of `n_envs` scenario ids, or None
+        :param games: array-like of `n_envs` indices of games of the root seed to
+            draw like the scalar env does, which is much slower than drawing the
+            next batch of random games (if None)
+        :param scenarios: `n_envs` records of `scenario_dtype` to start from instead,
+            e.g. scenarios searched by `supply_chain_env.stress`
+        """
+        if scenarios is not None:
+            if scenarios.shape != (self.n_envs,):
+                raise ValueError(f"Expected {self.n_envs} scenarios")
+        elif scenario_id is None and games is not None:
+            if len(games) != self.n_envs:
+                raise ValueError(f"Expected {self.n_envs} games")
+            scenarios = self._draw_games(games)
+        elif scenario_id is None:
+            scenarios = generate_scenarios(
+                self.env_type,
+                self.n_envs,
+                batch_rng(self._seed_sequence, self._next_batch),
+                n_agents=self.n_agents,
+                lead_time=self.lead_time,
+                n_turns=self.n_turns,
+                add_noise=self.add_noise_initialization,
+            )
+            self._next_batch += 1
+        elif self.scenario_bank is None:
+            raise ValueError("Resetting to a scenario id requires a scenario bank")
+        else:
+            scenario_id = np.asarray(scenario_id)
+            if scenario_id.shape != (self.n_envs,):
+                raise ValueError(f"Expected {self.n_envs} scenario ids")
+            scenarios = self.scenario_bank[scenario_id]
+
+        self.done = False
+        self._allocate()
+        self.orders[:] = scenarios["orders"]
+        self.inbound_shipments[:] = scenarios["inbound_shipments"]
+        self.next_incoming_orders[:] = scenarios["next_incoming_orders"]
+        self.stocks[:] = scenarios["stocks"]
+        self.end_customer_demand[:] = scenarios["demand"]
+        self.score_weight = score_weights(self.env_type, self.n_agents)
+        self.turn = 0
+        return self._get_observations()
+
+    def render(self, mode="human"):
+        if mode != "human":
+            raise NotImplementedError(f"Render mode {mode} is not implemented yet")
+        total_costs = (self.cum_holding_cost + self.cum_stockout_cost).sum(axis=1)
+        print("\n" + "=" * 50)
+        print("Turn #: ", self.turn + 1)
+        print("Games: ", self.n_envs)
+        print("Mean stock levels: ", self.stocks.mean(axis=0))
+        print("Mean cumulative cost: ", total_costs.mean())
+
+    def step(self, actions):
+        # sanity checks
+        if self.done:
+            raise error.ResetNeeded(
+                "Environment is finished, please run env.reset() before taking actions"
+            )
+        actions = np.asarray(actions)
+        if actions.shape != (self.n_envs, self.n_agents):
+            raise error.InvalidAction(
+                f"Shape of actions must be (n_envs, n_agents)="
+                f"({self.n_envs}, {self.n_agents}), got {actions.shape}"
+            )
+        if (actions < 0).any():
+            raise error.InvalidAction("You can't order negative amount.")
+
+        demand = self.end_customer_demand[:, self.turn]
+        # pop the pipelines' heads
+        orders_inc = self.orders[:, :, 0].copy()
+        ship_inc = self.inbound_shipments[:, :, 0].copy()
+        self.orders[:, :, :-1] = self.orders[:, :, 1:]
+        self.orders[:, :, -1] = 0
+        self.inbound_shipments[:, :, :-1] = self.inbound_shipments[:, :, 1:]
+
+        # calculate inbound shipments respecting orders and stock levels,
+        # the manufacturer is assumed to have no constraints
+        upstream_stocks = self.stocks[:, 1:]
+        max_possible_shipment = np.maximum(upstream_stocks, 0) + ship_inc[:, 1:]
+        order = orders_inc[:, :-1] + np.maximum(-upstream_stocks, 0)
+        self.inbound_shipments[:, :-1, -1] = np.minimum(order, max_possible_shipment)
+        self.inbound_shipments[:, -1, -1] = orders_inc[:, -1]
+
+        # update stocks
+        self.stocks += ship_inc
+        self.stocks[:, 1:] -= orders_inc[:, :-1]
+        self.stocks[:, 0] -= demand  # for the retailer
+
+        # update orders
+        agents = np.arange(self.n_agents)
+        self.orders[:, agents, self.order_lead_times - 1] = actions
+        self.next_incoming_orders[:, 0] = demand
+        self.next_incoming_orders[:, 1:] = self.orders[:, :-1, 0]
+
+        # calculate costs
+        self.holding_cost = np.maximum(self.stocks, 0) * self.score_weight[0]
+        self.stockout_cost = np.maximum(-self.stocks, 0) * self.score_weight[1]
+        self.cum_holding_cost += self.holding_cost
+        self.cum_stockout_cost += self.stockout_cost
+        rewards = self._get_rewards()
+
+        # check if done
+        if self.turn == self.n_turns - 1:
+            self.done = True
+        else:
+            self.turn += 1
+        dones = np.full(self.n_envs, self.done)
+        return self._get_observations(), rewards, dones, {}
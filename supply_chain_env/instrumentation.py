@@ -0,0 +1,226 @@
+"""Optional timing instrumentation of the environment and the agents.
+
+An `Instrumentation` passed to `SupplyChainBotTournament(instrumentation=...)` or
+`run_game(instrumentation=...)` records
+
+* ``env.step``, ``env.step.<phase>``: time of `SupplyChainBotTournament.step` and
+  of its phases, i.e. ``shipments`` (resolving the arriving pipeline slots),
+  ``stocks`` (updating stocks and enqueueing orders), ``costs`` and ``observations``
+* ``agent.<name>.get_action``: latency of every agent's `get_action` in `run_game`
+
+as histograms, and counters of steps, resets and games. Without an instrumentation
+the env only checks an attribute against None per phase.
+
+The records can be dumped as JSON or as a `pstats` file, which can be read with
+``python -m pstats`` or profile viewers like snakeviz.
+
+Usage::
+
+    python -m supply_chain_env.instrumentation --agents bot:create_agents \\
+        --n_games 100 --json timings.json --pstats timings.prof
+"""
+import json
+import marshal
+import math
+from argparse import ArgumentParser
+from collections import Counter
+from time import perf_counter
+
+import numpy as np
+
+# histogram buckets are powers of two of nanoseconds, the last one is open ended
+N_BUCKETS = 40
+
+
+class Histogram:
+    """
+    Count, sum, extrema and log2-bucketed distribution of durations in seconds.
+    Memory use is fixed, so it can record arbitrarily long runs.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * N_BUCKETS
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        nanoseconds = int(seconds * 1e9)
+        self.buckets[min(nanoseconds.bit_length(), N_BUCKETS - 1)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the `q` quantile, exact up to a factor of two.
+        """
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        for bucket, cum_count in enumerate(np.cumsum(self.buckets)):
+            if cum_count >= rank:
+                return min(2**bucket / 1e9, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else math.nan,
+            "min_s": self.min if self.count else math.nan,
+            "max_s": self.max,
+            "p50_s": self.quantile(0.5),
+            "p95_s": self.quantile(0.95),
+            "p99_s": self.quantile(0.99),
+            # upper bound of the bucket in nanoseconds: count
+            "buckets_ns": {
+                2**bucket: n for bucket, n in enumerate(self.buckets) if n
+            },
+        }
+
+
+def _pstats_key(name: str) -> tuple:
+    # (file name, line number, function name) of a profiled function
+    return ("supply_chain_env", 0, name)
+
+
+class Instrumentation:
+    """
+    Counters and timing histograms keyed by name.
+
+    Timings are recorded either directly with `add` or as laps: `start` takes a
+    timestamp, every `lap(name)` records the time since the previous lap and
+    `stop(name)` the time since `start`.
+    """
+
+    def __init__(self):
+        self.counters = Counter()
+        self.histograms = {}
+        self._start = 0.0
+        self._last = 0.0
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def add(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    def start(self):
+        self._start = self._last = perf_counter()
+
+    def lap(self, name: str):
+        now = perf_counter()
+        self.add(name, now - self._last)
+        self._last = now
+
+    def stop(self, name: str):
+        self.add(name, perf_counter() - self._start)
+
+    def merge(self, other):
+        """
+        Add the records of another instrumentation, e.g. of a worker process.
+        """
+        self.counters.update(other.counters)
+        for name, histogram in other.histograms.items():
+            self.histograms.setdefault(name, Histogram()).merge(histogram)
+
+    def to_dict(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "timings": {
+                name: histogram.to_dict()
+                for name, histogram in sorted(self.histograms.items())
+            },
+        }
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def pstats_dict(self) -> dict:
+        """
+        The timings in the format of `cProfile.Profile.stats`.
+
+        Every timing is a function named after it. A phase ``a.b.c`` is called by
+        its parent ``a.b`` if that has a timing too, so the phases of a step show up
+        as its callees and only the time outside of them as the step's own time.
+        """
+        children_time = Counter()
+        for name, histogram in self.histograms.items():
+            parent = name.rpartition(".")[0]
+            if parent in self.histograms:
+                children_time[parent] += histogram.total
+
+        stats = {}
+        for name, histogram in self.histograms.items():
+            calls, total = histogram.count, histogram.total
+            parent = name.rpartition(".")[0]
+            callers = {}
+            if parent in self.histograms:
+                callers[_pstats_key(parent)] = (calls, calls, total, total)
+            own_time = max(total - children_time[name], 0.0)
+            stats[_pstats_key(name)] = (calls, calls, own_time, total, callers)
+        return stats
+
+    def dump_stats(self, path):
+        """
+        Write the timings as a profile file readable by `pstats.Stats(path)`.
+        """
+        with open(path, "wb") as f:
+            marshal.dump(self.pstats_dict(), f)
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description="Time the env phases and the agents' actions.")
+    parser.add_argument("--agents", default="bot:create_agents")
+    parser.add_argument("--env_type", default="classical")
+    parser.add_argument("--n_games", type=int, default=100)
+    parser.add_argument("--json", default=None, help="write the timings as JSON")
+    parser.add_argument("--pstats", default=None, help="write a pstats profile")
+    return parser.parse_args(argv)
+
+
+def main(args):
+    from supply_chain_env.envs.streams import seed_agents
+    from supply_chain_env.tournament import load_object, run_game
+
+    create_agents = load_object(args.agents)
+    instrumentation = Instrumentation()
+    for seed in range(args.n_games):
+        seed_agents(seed)
+        run_game(
+            create_agents(),
+            environment=args.env_type,
+            seed=seed,
+            instrumentation=instrumentation,
+        )
+    for name, timing in instrumentation.to_dict()["timings"].items():
+        print(
+            f"{name:<36} {timing['count']:8d} calls "
+            f"{timing['mean_s'] * 1e6:9.2f} us mean "
+            f"{timing['p95_s'] * 1e6:9.2f} us p95"
+        )
+    if args.json:
+        instrumentation.dump_json(args.json)
+    if args.pstats:
+        instrumentation.dump_stats(args.pstats)
+    return instrumentation
+
+
+if __name__ == "__main__":
+    main(parse_args())
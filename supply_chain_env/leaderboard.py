@@ -1,55 +1,267 @@
+import json
 import os
 import subprocess
+import sys
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 
-
-def post_score_to_api(score: float):
-    # payload data
-    data = {"user": "Anonymous", "score": score}
-    git_info = subprocess.check_output(
-        ["git", "log", "-1", "--pretty=format:%H, %an"]
-    ).decode()
-    ref, git_user = git_info.split(",")
-    github_user = _get_github_user(ref)
-    data["user"] = github_user if github_user else git_user
-
-    print(f"Sending data to leaderboard: User: {git_user}, score: {score}")
-
-    # authentication
-    username = os.environ["LEADERBOARD_API_USERNAME"]
-    password = os.environ["LEADERBOARD_API_PASSWORD"]
-    url = "https://example.com/add-user-score"
-
-    ca_file = str(Path(__file__).parent.absolute() / "resources" / "CA.crt")
-
-    r = requests.post(
-        url=url,
-        json=data,
-        headers={"content-type": "application/json"},
-        auth=HTTPBasicAuth(username, password),
-        verify=ca_file,
+# e.g. the add-user-score endpoint of a local `supply_chain_env.service`
+LEADERBOARD_URL = os.environ.get(
+    "LEADERBOARD_URL", "https://example.com/add-user-score"
+)
+GITHUB_COMMIT_URL = (
+    "https://api.github.com/repos/pydata-global2020-bot-tournament/"
+    "pydataglobal-bot-game-2020/commits/{ref}"
+)
+CA_FILE = str(Path(__file__).parent.absolute() / "resources" / "CA.crt")
+# scores that couldn't be submitted are kept here until the next submission
+QUEUE_PATH = Path(
+    os.environ.get(
+        "LEADERBOARD_QUEUE",
+        Path.home() / ".cache" / "supply_chain_env" / "leaderboard_queue.jsonl",
     )
+)
+
+
+class LeaderboardError(Exception):
+    """The leaderboard rejected a score, retrying won't help."""
+
+
+class LeaderboardClient:
+    """
+    Submit scores to the leaderboard over one pooled HTTP session.
+
+    Connection errors and 429/5xx responses are retried with exponential backoff. Scores
+    that still can't be delivered are appended to a local queue file, which is flushed
+    before every later submission, so no score is lost while the leaderboard is
+    unreachable. SSL errors, e.g. of a wrong CA bundle, are raised and the given scores
+    are not queued. Scores the leaderboard rejects (other 4xx responses) are never
+    retried: they are moved to a ``.rejected.jsonl`` file next to the queue with the
+    error, and the scores after them are still submitted. A score without a response in
+    time (read timeout) may have been stored, so it isn't posted again either but moved
+    to the rejected file, and the scores after it stay queued. The GitHub user of a
+    commit is looked up once per client.
 
-    if not r.ok:
-        raise Exception(
-            f"Updating score was not successful and failed with {r.status_code}"
+    All endpoints are parameters, so the client can be pointed at a local server.
+    """
+
+    def __init__(
+        self,
+        url: str = LEADERBOARD_URL,
+        github_commit_url: Optional[str] = GITHUB_COMMIT_URL,
+        auth=None,
+        verify=CA_FILE,
+        timeout: float = 10.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        queue_path=QUEUE_PATH,
+    ):
+        """
+        :param github_commit_url: template of the GitHub commit API url with a
+            ``{ref}`` placeholder, or None to always submit the git author name
+        :param auth: (username, password), read from the LEADERBOARD_API_USERNAME and
+            LEADERBOARD_API_PASSWORD environment variables if None
+        :param verify: CA bundle or bool to verify the leaderboard's certificate
+        :param timeout: seconds to wait for connecting and for a response
+        :param queue_path: file of the offline queue, None to raise instead
+        """
+        self.url = url
+        self.github_commit_url = github_commit_url
+        if auth is None:
+            auth = (
+                os.environ["LEADERBOARD_API_USERNAME"],
+                os.environ["LEADERBOARD_API_PASSWORD"],
+            )
+        self.timeout = timeout
+        self.queue_path = None if queue_path is None else Path(queue_path)
+        # scores that must not be posted again, kept for inspection
+        self.rejected_path = (
+            None
+            if queue_path is None
+            else self.queue_path.with_name(self.queue_path.stem + ".rejected.jsonl")
+        )
+        # passed per request, so they are not sent to GitHub
+        self.auth = HTTPBasicAuth(*auth)
+        self.verify = verify
+        self.session = requests.Session()
+        # POSTs are not retried after a read error, the score may have been stored;
+        # read=False raises read timeouts as `requests.ReadTimeout`
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=False,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False,
         )
-    print("post was successful")
-
-
-def _get_github_user(ref: str) -> Optional[str]:
-    try:
-        url = f"https://api.github.com/repos/pydata-global2020-bot-tournament/pydataglobal-bot-game-2020/commits/{ref}"
-        r = requests.get(url)
-        if r.ok:
-            commit = r.json()
-            return commit.get("author", {}).get("login")
-        return None
-    except Exception as e:
-        print("Can not get data from github api")
-        print(e)
-        return None
+        adapter = HTTPAdapter(max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._github_users = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def get_github_user(self, ref: str) -> Optional[str]:
+        """
+        GitHub login of the author of a commit, None if it can't be looked up.
+        """
+        if self.github_commit_url is None:
+            return None
+        if ref not in self._github_users:
+            try:
+                r = self.session.get(
+                    self.github_commit_url.format(ref=ref), timeout=self.timeout
+                )
+                user = r.json().get("author", {}).get("login") if r.ok else None
+            except Exception as e:
+                print("Can not get data from github api")
+                print(e)
+                return None
+            self._github_users[ref] = user
+        return self._github_users[ref]
+
+    def get_user(self) -> str:
+        """
+        GitHub user of the last commit of the current repository, or its author name.
+        """
+        git_info = subprocess.check_output(
+            ["git", "log", "-1", "--pretty=format:%H, %an"]
+        ).decode()
+        ref, git_user = git_info.split(",", 1)
+        return self.get_github_user(ref) or git_user.strip()
+
+    def submit(self, score: float, user: Optional[str] = None) -> bool:
+        """
+        Submit one score, see `submit_many`.
+        """
+        return self.submit_many([score], user=user) == 1
+
+    def submit_many(self, scores: Iterable[float], user: Optional[str] = None) -> int:
+        """
+        Submit the queued scores and then `scores` in order, queueing whatever
+        can't be delivered and moving rejected scores to `rejected_path`.
+        :param user: user to submit the scores for, see `get_user` if None
+        :return: number of the given scores that were delivered
+        :raises LeaderboardError: if one of the given scores was rejected, after the
+            others were submitted
+        """
+        if user is None:
+            user = self.get_user()
+        pending = self._read_queue()
+        n_queued = len(pending)
+        pending += [{"user": user, "score": score} for score in scores]
+        # scores sent or rejected, the others stay queued
+        n_done = n_sent = 0
+        rejected, error = [], None
+        try:
+            for data in pending:
+                try:
+                    self._post(data)
+                    if n_done >= n_queued:
+                        n_sent += 1
+                except LeaderboardError as e:
+                    rejected.append(dict(data, error=str(e)))
+                    if n_done >= n_queued and error is None:
+                        error = e
+                n_done += 1
+        except requests.ReadTimeout as e:
+            # the leaderboard may have stored the score, don't post it twice
+            if self.queue_path is None:
+                raise
+            rejected.append(dict(pending[n_done], error=str(e)))
+            n_done += 1
+        except requests.exceptions.SSLError:
+            # a misconfiguration rather than being offline, the given scores are
+            # not queued
+            pending = pending[:n_queued]
+            raise
+        except requests.ConnectionError:
+            if self.queue_path is None:
+                raise
+        finally:
+            self._write_queue(pending[n_done:])
+            self._write_rejected(rejected)
+        if error is not None:
+            raise error
+        return n_sent
+
+    def flush_queue(self) -> int:
+        """
+        Submit the queued scores.
+        :return: number of scores still queued
+        """
+        self.submit_many([], user="")
+        return len(self._read_queue())
+
+    def _post(self, data: dict):
+        r = self.session.post(
+            url=self.url,
+            json=data,
+            auth=self.auth,
+            verify=self.verify,
+            timeout=self.timeout,
+        )
+        if r.status_code in (429,) or r.status_code >= 500:
+            # still failing after the retries, treat it like being offline
+            raise requests.ConnectionError(f"Leaderboard responded {r.status_code}")
+        if not r.ok:
+            raise LeaderboardError(
+                f"Updating score was not successful and failed with {r.status_code}"
+            )
+
+    def _read_queue(self) -> list:
+        if self.queue_path is None or not self.queue_path.exists():
+            return []
+        lines = self.queue_path.read_text().splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def _write_queue(self, pending: list):
+        if self.queue_path is None:
+            return
+        if not pending:
+            if self.queue_path.exists():
+                self.queue_path.unlink()
+            return
+        self.queue_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.queue_path.with_suffix(".tmp")
+        tmp.write_text("".join(json.dumps(data) + "\n" for data in pending))
+        os.replace(tmp, self.queue_path)
+
+    def _write_rejected(self, rejected: list):
+        if self.rejected_path is None or not rejected:
+            return
+        self.rejected_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.rejected_path, "a") as f:
+            f.write("".join(json.dumps(data) + "\n" for data in rejected))
+
+
+def post_score_to_api(score: float):
+    """
+    Submit the score of the current commit's author, exit with an error if it wasn't
+    delivered, e.g. so that CI fails instead of queueing the score on a throwaway
+    machine.
+    """
+    with LeaderboardClient() as client:
+        user = client.get_user()
+        print(f"Sending data to leaderboard: User: {user}, score: {score}")
+        if not client.submit(score, user=user):
+            sys.exit(
+                "Leaderboard not reachable, queued the score in "
+                f"{client.queue_path} (or moved it to {client.rejected_path} if "
+                "the leaderboard timed out after receiving it)"
+            )
+        print("post was successful")
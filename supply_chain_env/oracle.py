@@ -0,0 +1,303 @@
+"""Minimum achievable cost of a fully known game.
+
+Given the initial state and the whole demand trace of a game, a central planner that
+controls all agents can move goods through the chain at minimum cost. The planner
+controls the shipments of every link: any amount the supplier has on hand can be
+requested for the turn it should be shipped, as long as that turn is at least an
+order lead time away. The shipments that are already requested when the game starts
+are fixed and simulated as in the env.
+
+This makes the game a min-cost flow problem on the time-expanded chain: a node per
+agent and turn holds the goods on hand at the end of the turn, keeping them costs
+the agent's holding cost, shipments arrive a shipment lead time later and goods in
+the pipelines cost nothing. Demand the retailer can't meet is backlogged at its
+stockout cost. The flow is solved exactly by successive shortest paths (Dijkstra
+with potentials) on a network of about 4 * n_turns nodes, which takes a few
+milliseconds per game.
+
+Every strategy of the agents is such a flow, so the minimum is a lower bound of the
+total cost of any strategy. It is the optimum unless the initial orders exceed what
+a supplier has: the backorders that follow are neither charged nor forced to be
+shipped first in the flow. `solve` also returns the orders realizing the flow and
+their cost when played in the env, which equals the bound in all other games.
+
+Solutions are kept in a bounded LRU cache keyed by the game, so every scenario is
+solved once per process.
+
+Usage::
+
+    from supply_chain_env import oracle
+
+    env.reset()
+    solution = oracle.solve(env)
+    gap = total_cost_of_the_bots - solution["lower_bound"]
+"""
+import heapq
+from functools import lru_cache
+
+import numpy as np
+
+from supply_chain_env.envs.env import DEMAND_BLOCK_SIZE, SupplyChainBotTournament
+from supply_chain_env.envs.scenario_bank import open_bank
+
+# number of solved games kept per process
+CACHE_SIZE = 4096
+
+
+def _game_key(env) -> tuple:
+    """
+    Hashable description of the game `env` was just reset to.
+    """
+    if env.turn != 0 or env.done:
+        raise ValueError("The oracle needs an env that was just reset")
+    if env.n_turns > DEMAND_BLOCK_SIZE:
+        raise ValueError("The oracle needs the whole demand trace of the game")
+    orders, shipments = env.get_pipelines()
+    weights = np.array([w[: env.n_agents] for w in env.score_weight], dtype=float)
+    return (
+        env.n_turns,
+        tuple(env.order_lead_times.tolist()),
+        tuple(env.shipment_lead_times.tolist()),
+        tuple(weights.ravel().tolist()),
+        tuple(env.stocks.tolist()),
+        tuple(orders.ravel().tolist()),
+        tuple(shipments.ravel().tolist()),
+        tuple(np.asarray(env.end_customer_demand).tolist()),
+    )
+
+
+class _FlowNetwork:
+    """
+    Min-cost flow by successive shortest paths, arcs are stored in flat lists.
+    """
+
+    def __init__(self, n_nodes: int):
+        self.n_nodes = n_nodes
+        self.adjacency = [[] for _ in range(n_nodes)]
+        self.head = []
+        self.capacity = []
+        self.cost = []
+
+    def add_arc(self, tail: int, head: int, capacity: int, cost: float) -> int:
+        arc = len(self.head)
+        self.adjacency[tail].append(arc)
+        self.head.append(head)
+        self.capacity.append(capacity)
+        self.cost.append(cost)
+        # residual arc, `arc ^ 1` is the reverse of `arc`
+        self.adjacency[head].append(arc + 1)
+        self.head.append(tail)
+        self.capacity.append(0)
+        self.cost.append(-cost)
+        return arc
+
+    def flow(self, arc: int) -> int:
+        return self.capacity[arc + 1]
+
+    def min_cost_flow(self, source: int, sink: int) -> float:
+        """
+        Send as much flow as possible from source to sink at minimum cost, all arc
+        costs have to be non-negative.
+        :return: cost of the flow
+        """
+        head, capacity, cost = self.head, self.capacity, self.cost
+        adjacency = self.adjacency
+        potential = [0.0] * self.n_nodes
+        total_cost = 0.0
+        while True:
+            distance = [float("inf")] * self.n_nodes
+            parent_arc = [-1] * self.n_nodes
+            distance[source] = 0.0
+            queue = [(0.0, source)]
+            while queue:
+                d, node = heapq.heappop(queue)
+                if d > distance[node]:
+                    continue
+                for arc in adjacency[node]:
+                    if capacity[arc] > 0:
+                        other = head[arc]
+                        nd = d + cost[arc] + potential[node] - potential[other]
+                        if nd < distance[other] - 1e-9:
+                            distance[other] = nd
+                            parent_arc[other] = arc
+                            heapq.heappush(queue, (nd, other))
+            if parent_arc[sink] == -1:
+                return total_cost
+            for node in range(self.n_nodes):
+                if distance[node] < float("inf"):
+                    potential[node] += distance[node]
+            # bottleneck of the shortest path
+            amount, node = float("inf"), sink
+            while node != source:
+                arc = parent_arc[node]
+                amount = min(amount, capacity[arc])
+                node = head[arc ^ 1]
+            node = sink
+            while node != source:
+                arc = parent_arc[node]
+                capacity[arc] -= amount
+                capacity[arc ^ 1] += amount
+                total_cost += amount * cost[arc]
+                node = head[arc ^ 1]
+
+
+def _forced_shipments(stocks, orders, shipments, order_leads, shipment_leads):
+    """
+    Shipments of the orders that are already placed when the game starts, simulated
+    like the env does, from the manufacturer down.
+    :return: dict mapping (link, turn) to the shipped amount, link i ships to agent i
+    """
+    n_agents = len(stocks)
+    forced = {}
+    last = n_agents - 1
+    for turn in range(order_leads[last]):
+        forced[last, turn] = orders[last][turn]
+    for i in range(last - 1, -1, -1):
+        supplier = i + 1
+        stock = stocks[supplier]
+        for turn in range(order_leads[i]):
+            incoming = 0
+            if turn < shipment_leads[supplier]:
+                incoming = shipments[supplier][turn]
+            arrived = turn - shipment_leads[supplier]
+            if arrived >= 0:
+                if (supplier, arrived) not in forced:
+                    raise ValueError(
+                        "The oracle needs order lead times at most as long as the "
+                        "supplier's order and shipment lead times together"
+                    )
+                incoming += forced[supplier, arrived]
+            request = orders[i][turn]
+            forced[i, turn] = min(max(stock, 0) + incoming, request + max(-stock, 0))
+            stock += incoming - request
+    return forced
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _solve(key: tuple):
+    (
+        n_turns,
+        order_leads,
+        shipment_leads,
+        weights,
+        stocks,
+        orders,
+        shipments,
+        demand,
+    ) = key
+    n_agents = len(stocks)
+    lead_time = len(orders) // n_agents
+    orders = np.reshape(orders, (n_agents, lead_time)).tolist()
+    shipments = np.reshape(shipments, (n_agents, lead_time)).tolist()
+    holding, stockout = weights[:n_agents], weights[n_agents:]
+
+    def node(agent, turn):
+        return agent * n_turns + turn
+
+    # sources of new goods and of unmet demand, and the sink of all leftover goods
+    fresh, penalty, end = range(n_agents * n_turns, n_agents * n_turns + 3)
+    source, sink = end + 1, end + 2
+    balance = [0] * (end + 1)
+
+    for i, stock in enumerate(stocks):
+        balance[node(i, 0)] += max(stock, 0)
+    # backlog of the retailer is demand, the one of upstream agents is ignored
+    balance[node(0, 0)] -= max(-stocks[0], 0)
+    for turn, amount in enumerate(demand):
+        balance[node(0, turn)] -= amount
+    for i in range(n_agents):
+        for turn in range(min(shipment_leads[i], n_turns)):
+            balance[node(i, turn)] += shipments[i][turn]
+    for (i, turn), amount in _forced_shipments(
+        stocks, orders, shipments, order_leads, shipment_leads
+    ).items():
+        if turn >= n_turns:
+            continue
+        if i < n_agents - 1:
+            balance[node(i + 1, turn)] -= amount
+        if turn + shipment_leads[i] < n_turns:
+            balance[node(i, turn + shipment_leads[i])] += amount
+    total_demand = max(-sum(b for b in balance if b < 0), 0)
+    balance[fresh] = balance[penalty] = total_demand
+    balance[end] = -sum(balance)
+
+    network = _FlowNetwork(sink + 1)
+    infinite = sum(b for b in balance if b > 0)
+    for i in range(n_agents):
+        for turn in range(n_turns):
+            following = node(i, turn + 1) if turn + 1 < n_turns else end
+            network.add_arc(node(i, turn), following, infinite, holding[i])
+    # shipments requested by the planner, the ones arriving after the end cost nothing
+    shipment_arcs = []
+    for i in range(n_agents):
+        for turn in range(order_leads[i], n_turns):
+            arrival = turn + shipment_leads[i]
+            target = node(i, arrival) if arrival < n_turns else end
+            tail = fresh if i == n_agents - 1 else node(i + 1, turn)
+            arc = network.add_arc(tail, target, infinite, 0.0)
+            shipment_arcs.append((i, turn - order_leads[i], arc))
+    network.add_arc(fresh, end, infinite, 0.0)
+    # unmet demand is served later (backlog) or never (penalty source)
+    for turn in range(n_turns - 1):
+        network.add_arc(node(0, turn + 1), node(0, turn), infinite, stockout[0])
+    network.add_arc(penalty, node(0, n_turns - 1), infinite, stockout[0])
+    network.add_arc(penalty, end, infinite, 0.0)
+    for v, b in enumerate(balance):
+        if b > 0:
+            network.add_arc(source, v, b, 0.0)
+        elif b < 0:
+            network.add_arc(v, sink, -b, 0.0)
+
+    cost = network.min_cost_flow(source, sink)
+    plan = np.zeros((n_turns, n_agents), dtype=np.int64)
+    for i, turn, arc in shipment_arcs:
+        plan[turn, i] = network.flow(arc)
+    plan.flags.writeable = False
+    return cost, plan
+
+
+def solve(env) -> dict:
+    """
+    Minimum cost of the game `env` was just reset to.
+    :return: dict with the ``lower_bound`` of the total cost of any strategy, the
+        orders ``plan`` of shape (n_turns, n_agents) of a central planner and
+        ``plan_cost``, the total cost of playing the plan, which usually equals the
+        bound
+    """
+    lower_bound, plan = _solve(_game_key(env))
+    replay = env.clone()
+    for actions in plan.tolist():
+        replay.step(actions)
+    plan_cost = float(np.sum(replay.cum_holding_cost + replay.cum_stockout_cost))
+    return {"lower_bound": lower_bound, "plan": plan, "plan_cost": plan_cost}
+
+
+def lower_bound(env) -> float:
+    """
+    Lower bound of the total cost of the game `env` was just reset to.
+    """
+    return _solve(_game_key(env))[0]
+
+
+def lower_bounds(env_type: str, seeds: list, scenario_bank=None) -> np.ndarray:
+    """
+    Lower bounds of the games the tournament plays for `seeds`, which are scenario
+    ids of the `scenario_bank` if given.
+    """
+    scenario_bank = open_bank(scenario_bank)
+    bounds = []
+    for seed in seeds:
+        # same game as `supply_chain_env.tournament.run_game`
+        env = SupplyChainBotTournament(
+            env_type, seed=seed, verbose=False, scenario_bank=scenario_bank
+        )
+        env.reset(scenario_id=None if scenario_bank is None else seed)
+        bounds.append(lower_bound(env))
+    return np.array(bounds, dtype=np.float64)
+
+
+def cache_info():
+    """
+    Hits, misses and size of the cache of solved games.
+    """
+    return _solve.cache_info()
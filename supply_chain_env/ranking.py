@@ -0,0 +1,347 @@
+"""Adaptive sequential ranking of bots on common random numbers.
+
+A single game is a noisy sample of a bot's cost, and playing a fixed, large number of
+games for every bot wastes most of them on bots that are clearly better or worse than
+the others. `rank_bots` plays all bots on the same seeds, i.e. the same initial
+states and demand traces (common random numbers), so that the differences of their
+costs per seed vary much less than the costs themselves, and adds seeds in rounds
+only for the bots whose place in the ranking is still open.
+
+After every round the mean cost difference of every pair of bots is estimated on the
+seeds both played, with a Student-t confidence interval. The intervals are Bonferroni
+corrected for the number of pairs and of rounds, so all of them hold at once with
+the requested confidence. A pair is resolved when its interval excludes 0 (one bot
+is better) or lies within ``+-indifference`` (the bots are as good as each other).
+A bot stops playing when all its pairs are resolved or it played `max_seeds` seeds.
+
+The score of a seed is the total cost of its game averaged over the env types.
+
+Usage::
+
+    python -m supply_chain_env.ranking random=bot:create_agents \\
+        mine=mybot:create_agents --max_seeds 2000 --indifference 5
+"""
+import math
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Iterable, Optional
+
+import numpy as np
+
+from supply_chain_env.results_store import open_store, scenario_key
+from supply_chain_env.tournament import ENV_TYPES, _play_games, load_object
+
+
+def _t_coverage(theta: float, df: int) -> float:
+    """
+    Probability that a Student-t variable with `df` degrees of freedom lies within
+    ``+-sqrt(df) * tan(theta)``, by the closed form for integer degrees of freedom
+    (Abramowitz and Stegun 26.7.3).
+    """
+    sin, cos2 = math.sin(theta), math.cos(theta) ** 2
+    if df % 2 == 0:
+        term = total = 1.0
+        for k in range(1, df // 2):
+            term *= cos2 * (2 * k - 1) / (2 * k)
+            total += term
+        return sin * total
+    if df == 1:
+        return 2 * theta / math.pi
+    term = total = 1.0
+    for k in range(1, (df - 1) // 2):
+        term *= cos2 * (2 * k) / (2 * k + 1)
+        total += term
+    return 2 / math.pi * (theta + sin * math.cos(theta) * total)
+
+
+@lru_cache(maxsize=None)
+def _t_quantile(confidence: float, df: int) -> float:
+    """
+    Quantile of the Student-t distribution for a two-sided interval.
+    """
+    low, high = 0.0, math.pi / 2
+    # bisect the angle, the coverage grows with it
+    for _ in range(100):
+        middle = (low + high) / 2
+        if _t_coverage(middle, df) < confidence:
+            low = middle
+        else:
+            high = middle
+    return math.sqrt(df) * math.tan((low + high) / 2)
+
+
+def compare(scores: dict, confidence: float = 0.95, indifference: float = 0.0):
+    """
+    Pairwise comparison of the bots on the seeds both played.
+    :param scores: dict mapping bot names to arrays of scores per seed, all bots
+        played the same seeds in the same order
+    :param confidence: coverage of the Student-t interval of every pair
+    :return: dict mapping (name, other) pairs to dicts with the ``difference`` of
+        the mean scores (name minus other), its interval ``low`` and ``high``, the
+        number of seeds ``n_seeds`` and the ``outcome``: ``"better"`` if name is
+        better, ``"worse"``, ``"tie"`` or None if undecided
+    """
+    names = list(scores)
+    comparisons = {}
+    for i, name in enumerate(names):
+        for other in names[i + 1 :]:
+            n = min(len(scores[name]), len(scores[other]))
+            differences = scores[name][:n] - scores[other][:n]
+            mean = float(differences.mean())
+            half_width = 0.0
+            if n > 1:
+                t = _t_quantile(confidence, n - 1)
+                half_width = t * float(differences.std(ddof=1)) / math.sqrt(n)
+            low, high = mean - half_width, mean + half_width
+            if n < 2:
+                outcome = None
+            elif high < 0:
+                outcome = "better"
+            elif low > 0:
+                outcome = "worse"
+            elif -indifference <= low and high <= indifference:
+                outcome = "tie"
+            else:
+                outcome = None
+            comparisons[name, other] = {
+                "difference": mean,
+                "low": low,
+                "high": high,
+                "n_seeds": n,
+                "outcome": outcome,
+            }
+    return comparisons
+
+
+def rank_bots(
+    bots: dict,
+    env_types: Iterable[str] = ENV_TYPES,
+    confidence: float = 0.95,
+    indifference: float = 0.0,
+    min_seeds: int = 10,
+    max_seeds: int = 1000,
+    growth: float = 2.0,
+    first_seed: int = 0,
+    n_workers: Optional[int] = None,
+    scenario_banks: Optional[dict] = None,
+    cache_dir=None,
+    results_path=None,
+) -> dict:
+    """
+    Rank bots with as few games as their differences allow.
+
+    The factories have to be picklable (i.e. defined at module level) when
+    `n_workers` is not 1.
+
+    :param bots: dict mapping names to `create_agents` factories
+    :param confidence: probability that all intervals of all rounds hold at once
+    :param indifference: cost difference of the mean scores below which two bots
+        are considered equally good
+    :param min_seeds: seeds every bot plays in the first round
+    :param max_seeds: seeds a bot plays at most, the size of a fixed-N evaluation
+    :param growth: factor the seeds of a bot grow by from round to round
+    :param scenario_banks, cache_dir: see `run_tournament`
+    :param results_path: file to append the results of the games to (see
+        `supply_chain_env.results_store`), the games of the bots (by name) already
+        in it are not played again
+    :return: dict with the ``ranking``, a list of dicts per bot sorted by mean
+        score, with the ``name``, ``mean``, its ``low`` and ``high`` interval
+        bounds (with `confidence`, not corrected), ``n_seeds`` and the range of
+        ranks ``rank_low`` to ``rank_high`` consistent with the pairwise
+        comparisons; the ``comparisons`` (see `compare`), whether all pairs are
+        ``resolved``, the ``n_rounds`` and the ``n_games`` played compared to the
+        ``fixed_n_games`` of playing `max_seeds` seeds with every bot
+    """
+    names = list(bots)
+    env_types = list(env_types)
+    scenario_banks = scenario_banks or {}
+    min_seeds = max(min(min_seeds, max_seeds), 2)
+    max_rounds = 1
+    n = min_seeds
+    while n < max_seeds:
+        n = min(max(math.ceil(n * growth), n + 1), max_seeds)
+        max_rounds += 1
+    n_pairs = max(len(names) * (len(names) - 1) // 2, 1)
+    # every interval of every possible round holds at once
+    pair_confidence = 1 - (1 - confidence) / (n_pairs * max_rounds)
+
+    totals = {name: {env_type: [] for env_type in env_types} for name in names}
+    targets = dict.fromkeys(names, min_seeds)
+    n_workers = n_workers or os.cpu_count()
+    store = open_store(results_path)
+
+    def collect(task, costs):
+        name, env_type, chunk, bank = task
+        if store is not None:
+            store.add("costs", name, env_type, chunk, costs.tolist(), bank)
+        new_totals[name, env_type].update(zip(chunk, costs.sum(axis=1)))
+
+    n_rounds = 0
+    with ProcessPoolExecutor(n_workers) if n_workers > 1 else nullcontext() as pool:
+        while True:
+            n_rounds += 1
+            round_seeds = {}
+            new_totals = {}
+            tasks = []
+            for name in names:
+                n_played = len(totals[name][env_types[0]])
+                seeds = list(range(first_seed + n_played, first_seed + targets[name]))
+                round_seeds[name] = seeds
+                chunk_size = max(1, math.ceil(len(seeds) / (4 * n_workers)))
+                for env_type in env_types:
+                    bank = scenario_banks.get(env_type)
+                    new = new_totals[name, env_type] = {}
+                    missing = seeds
+                    if store is not None:
+                        missing = store.missing("costs", name, env_type, seeds, bank)
+                        for seed in set(seeds) - set(missing):
+                            costs = store.get(
+                                "costs", name, env_type, scenario_key(seed, bank)
+                            )
+                            new[seed] = sum(costs)
+                    for i in range(0, len(missing), chunk_size):
+                        chunk = missing[i : i + chunk_size]
+                        args = (bots[name], env_type, chunk, bank, None, cache_dir)
+                        tasks.append(((name, env_type, chunk, bank), args))
+            if pool is None:
+                for task, args in tasks:
+                    collect(task, _play_games(*args))
+            else:
+                futures = {
+                    pool.submit(_play_games, *args): task for task, args in tasks
+                }
+                for future in as_completed(futures):
+                    collect(futures[future], future.result())
+            for (name, env_type), new in new_totals.items():
+                totals[name][env_type].extend(new[s] for s in round_seeds[name])
+
+            scores = {
+                name: np.mean([totals[name][e] for e in env_types], axis=0)
+                for name in names
+            }
+            comparisons = compare(scores, pair_confidence, indifference)
+            partners = {name: [] for name in names}
+            for (name, other), comparison in comparisons.items():
+                if comparison["outcome"] is None:
+                    partners[name].append(other)
+                    partners[other].append(name)
+            # a pair is compared on the seeds both bots played, so more seeds only
+            # help a bot if an open partner played more or can still play more
+            active = [
+                name
+                for name in names
+                if targets[name] < max_seeds
+                and any(
+                    targets[other] > targets[name] or targets[other] < max_seeds
+                    for other in partners[name]
+                )
+            ]
+            if not active:
+                break
+            for name in active:
+                targets[name] = min(
+                    max(math.ceil(targets[name] * growth), targets[name] + 1),
+                    max_seeds,
+                )
+
+    ranking = []
+    for name in names:
+        bot_scores = scores[name]
+        mean = float(bot_scores.mean())
+        n = len(bot_scores)
+        half_width = math.nan
+        if n > 1:
+            t = _t_quantile(confidence, n - 1)
+            half_width = t * float(bot_scores.std(ddof=1)) / math.sqrt(n)
+        n_better = n_worse = 0
+        for (first, second), comparison in comparisons.items():
+            if name not in (first, second):
+                continue
+            outcome = comparison["outcome"]
+            if name == second:
+                outcome = {"better": "worse", "worse": "better"}.get(outcome, outcome)
+            n_better += outcome == "better"
+            n_worse += outcome == "worse"
+        ranking.append(
+            {
+                "name": name,
+                "mean": mean,
+                "low": mean - half_width,
+                "high": mean + half_width,
+                "n_seeds": len(bot_scores),
+                "rank_low": 1 + n_worse,
+                "rank_high": len(names) - n_better,
+            }
+        )
+    ranking.sort(key=lambda entry: entry["mean"])
+    n_games = sum(entry["n_seeds"] for entry in ranking) * len(env_types)
+    return {
+        "ranking": ranking,
+        "comparisons": comparisons,
+        "resolved": all(c["outcome"] is not None for c in comparisons.values()),
+        "n_rounds": n_rounds,
+        "n_games": n_games,
+        "fixed_n_games": len(names) * max_seeds * len(env_types),
+    }
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "bots", nargs="+", help="factories as name=module:attribute or module:attribute"
+    )
+    parser.add_argument("--env_types", nargs="+", default=list(ENV_TYPES))
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--indifference", type=float, default=0.0)
+    parser.add_argument("--min_seeds", type=int, default=10)
+    parser.add_argument("--max_seeds", type=int, default=1000)
+    parser.add_argument("--growth", type=float, default=2.0)
+    parser.add_argument("--first_seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--results",
+        default=None,
+        help="JSON lines file to append the results of the games to, games already "
+        "in it are not played again, so an interrupted ranking can be resumed",
+    )
+    return parser.parse_args(argv)
+
+
+def main(args):
+    bots = {}
+    for spec in args.bots:
+        name, _, path = spec.rpartition("=")
+        bots[name or path] = load_object(path)
+    results = rank_bots(
+        bots,
+        env_types=args.env_types,
+        confidence=args.confidence,
+        indifference=args.indifference,
+        min_seeds=args.min_seeds,
+        max_seeds=args.max_seeds,
+        growth=args.growth,
+        first_seed=args.first_seed,
+        n_workers=args.workers,
+        results_path=args.results,
+    )
+    for entry in results["ranking"]:
+        ranks = f"{entry['rank_low']}-{entry['rank_high']}"
+        if entry["rank_low"] == entry["rank_high"]:
+            ranks = str(entry["rank_low"])
+        print(
+            f"{ranks:>7} {entry['name']:<20} {entry['mean']:10.1f} "
+            f"[{entry['low']:.1f}, {entry['high']:.1f}] ({entry['n_seeds']} seeds)"
+        )
+    status = "resolved" if results["resolved"] else "budget reached, ranks open"
+    print(
+        f"\n{status} after {results['n_rounds']} rounds, {results['n_games']} games "
+        f"instead of {results['fixed_n_games']}"
+    )
+    return results
+
+
+if __name__ == "__main__":
+    main(parse_args())
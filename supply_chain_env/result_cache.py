@@ -0,0 +1,239 @@
+"""Content-addressed cache of game results.
+
+A game is determined by the source of the agents' classes, the source of
+`supply_chain_env`, the env type and the seed (or the scenario record of a scenario
+bank), so its result can be stored under a hash of these and reused until any of
+them changes. `run_game(cache=...)` and `run_tournament(cache_dir=...)` look games up
+before playing them.
+
+Results are JSON files in a directory per version of the `supply_chain_env` source,
+so checkouts of several versions can share a cache. Once the files of all versions
+exceed `max_bytes` the least recently used ones are deleted, which retires the
+results of versions no longer used first.
+
+The agents must not depend on anything but the seed, i.e. their random numbers have
+to come from the global NumPy generator seeded with it (as the tournament does) or
+from their own seeded generators.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+RESULT_CACHE_DIR = Path(
+    os.environ.get(
+        "SUPPLY_CHAIN_RESULT_CACHE",
+        Path.home() / ".cache" / "supply_chain_env" / "results",
+    )
+)
+# size of the results of all games is checked every this many stored results
+EVICT_EVERY = 64
+
+
+@lru_cache(maxsize=None)
+def package_hash() -> str:
+    """
+    Hash of the source files of `supply_chain_env`.
+    """
+    root = Path(__file__).parent
+    digest = hashlib.sha256()
+    for path in sorted(root.rglob("*.py")):
+        digest.update(str(path.relative_to(root)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=256)
+def _file_hash(path: str, mtime_ns: int) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def _source_hash(obj) -> str:
+    import inspect
+
+    path = inspect.getsourcefile(obj)
+    if path is None:
+        raise TypeError(f"No source file of {obj!r}")
+    return _file_hash(path, os.stat(path).st_mtime_ns)
+
+
+def agents_fingerprint(agents, create_agents=None) -> Optional[list]:
+    """
+    Qualified names and source file hashes of the agents' classes and of the
+    factory creating them, None if a source file can't be found.
+    """
+    objects = [type(agent) for agent in agents]
+    arguments = []
+    while isinstance(create_agents, partial):
+        arguments.append([list(create_agents.args), create_agents.keywords])
+        create_agents = create_agents.func
+    if create_agents is not None:
+        objects.append(create_agents)
+    try:
+        fingerprint = [
+            [f"{obj.__module__}:{obj.__qualname__}", _source_hash(obj)]
+            for obj in objects
+        ]
+    except (TypeError, OSError):
+        return None
+    # the arguments must be JSON serializable, repr would include ids of objects
+    try:
+        json.dumps(arguments)
+    except TypeError:
+        return None
+    return fingerprint + arguments
+
+
+def _scenario_hash(scenario_bank, scenario_id) -> Optional[str]:
+    if scenario_bank is None or scenario_id is None:
+        return None
+    return hashlib.sha256(scenario_bank.scenarios[scenario_id].tobytes()).hexdigest()
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+class ResultCache:
+    """
+    Size-bounded store of JSON-serializable game results keyed by content hashes.
+    """
+
+    def __init__(self, path=RESULT_CACHE_DIR, max_bytes: int = 256 * 2**20):
+        """
+        :param path: directory of the cache, shared by all versions of the package
+        :param max_bytes: size of the stored results of all versions above which the
+            least recently used ones are deleted
+        """
+        self.root = Path(path)
+        self.max_bytes = max_bytes
+        self.path = self.root / package_hash()[:16]
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.hits = self.misses = 0
+        self._n_stored = 0
+
+    def _version_directories(self) -> list:
+        # only directories named like the ones of the versions
+        return [
+            directory
+            for directory in self.root.iterdir()
+            if directory.is_dir()
+            and len(directory.name) == 16
+            and all(c in "0123456789abcdef" for c in directory.name)
+        ]
+
+    def invalidate(self):
+        """
+        Delete the results of other versions of `supply_chain_env` right away, e.g.
+        when no other checkout uses the cache.
+        """
+        for directory in self._version_directories():
+            if directory != self.path:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def key(
+        self,
+        kind: str,
+        agents_fingerprint: list,
+        env_type: str,
+        seed: int,
+        scenario_bank=None,
+        scenario_id: Optional[int] = None,
+    ) -> str:
+        """
+        Hash of everything a result of `kind` depends on.
+        """
+        content = {
+            "kind": kind,
+            "package": package_hash(),
+            "agents": agents_fingerprint,
+            "env_type": env_type,
+            "seed": seed,
+            "scenario": _scenario_hash(scenario_bank, scenario_id),
+        }
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def get(self, key: str):
+        """
+        Stored result, None if there is none.
+        """
+        path = self._file(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            # the modification time orders the results by their last use
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value):
+        path = self._file(key)
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        text = json.dumps(value, default=_to_json)
+        try:
+            tmp.write_text(text)
+        except FileNotFoundError:
+            # the directory was deleted, e.g. with `invalidate` by another process
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(text)
+        os.replace(tmp, path)
+        self._n_stored += 1
+        if self._n_stored % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used results of all versions until the rest fits
+        into `max_bytes`, and the directories of other versions left empty.
+        """
+        entries = []
+        directories = self._version_directories()
+        for directory in directories:
+            for path in directory.glob("*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        for _, file_size, path in sorted(entries, key=lambda entry: entry[0]):
+            if size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= file_size
+        for directory in directories:
+            if directory != self.path:
+                try:
+                    directory.rmdir()
+                except OSError:
+                    # not empty, or already deleted
+                    pass
+
+    def __len__(self):
+        return sum(1 for _ in self.path.glob("*.json"))
+
+
+def open_cache(cache) -> Optional[ResultCache]:
+    """
+    Open a cache given by path, caches are passed through.
+    :type cache: str, Path, ResultCache or None
+    """
+    if cache is None or isinstance(cache, ResultCache):
+        return cache
+    return ResultCache(cache)
@@ -0,0 +1,173 @@
+"""Append-only store of evaluation results, for resumable long-running evaluations.
+
+A large evaluation plays many games for hours, and a crash or preemption must not
+lose the games played so far. `run_tournament(results_path=...)` and
+`rank_bots(results_path=...)` append the result of every game to a JSON lines file
+as soon as the chunk of games it belongs to is done, and commit it to disk (a
+checkpoint) before playing on. Run again with the same file, they only play the
+(bot, env type, scenario) games that aren't in it yet.
+
+Every record is a line::
+
+    {"kind": "costs", "bot": "bot:create_agents", "env_type": "classical",
+     "scenario": 17, "value": [120.0, 95.5, 80.0, 71.0]}
+
+The ``scenario`` is the seed, or ``[bank path, scenario id]`` for games of a
+scenario bank. Bots are identified by their name only, so a changed bot has to be
+evaluated under a new name or into a new file (unlike
+`supply_chain_env.result_cache`, which keys results on the source).
+
+Several processes can write to the same file at once, e.g. evaluations of other
+bots or seed ranges: a batch of records is appended with a single write under an
+exclusive lock of the file, so the batches of the writers never interleave. A line
+cut off by a crash is ignored when the file is read and terminated before the next
+batch is appended.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows, appends are not locked there
+    fcntl = None
+
+
+def bot_name(create_agents) -> str:
+    """
+    Default name of a bot, ``module:qualname`` of its factory.
+    """
+    name = getattr(create_agents, "__qualname__", None)
+    if name is None:
+        # e.g. functools.partial
+        return repr(create_agents)
+    return f"{create_agents.__module__}:{name}"
+
+
+def scenario_key(seed: int, scenario_bank=None):
+    """
+    JSON-serializable key of the scenario a seed stands for.
+    :type scenario_bank: str, Path, ScenarioBank or None
+    """
+    if scenario_bank is None:
+        return seed
+    return [str(getattr(scenario_bank, "path", scenario_bank)), seed]
+
+
+class ResultsStore:
+    """
+    Results of games keyed by (kind, bot, env type, scenario), read from a JSON lines
+    file and appended to it.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._results = {}
+        self.refresh()
+
+    @staticmethod
+    def key(kind: str, bot: Optional[str], env_type: str, scenario) -> str:
+        return json.dumps([kind, bot, env_type, scenario])
+
+    def refresh(self):
+        """
+        Read all records again, including the ones other processes appended.
+        """
+        self._results.clear()
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                # the last line of a crashed writer may be cut off
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                fields = ("kind", "bot", "env_type", "scenario")
+                key = self.key(*(record[field] for field in fields))
+                self._results[key] = record["value"]
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, kind: str, bot: Optional[str], env_type: str, scenario):
+        """
+        Stored result, None if there is none.
+        """
+        return self._results.get(self.key(kind, bot, env_type, scenario))
+
+    def missing(
+        self,
+        kind: str,
+        bot: Optional[str],
+        env_type: str,
+        seeds: Iterable[int],
+        scenario_bank=None,
+    ) -> list:
+        """
+        Seeds without a stored result.
+        """
+        return [
+            seed
+            for seed in seeds
+            if self.get(kind, bot, env_type, scenario_key(seed, scenario_bank))
+            is None
+        ]
+
+    def add(
+        self,
+        kind: str,
+        bot: Optional[str],
+        env_type: str,
+        seeds: Iterable[int],
+        values: Iterable,
+        scenario_bank=None,
+    ):
+        """
+        Store the results of games and commit them to disk at once.
+        :param values: JSON-serializable result per seed
+        """
+        records = []
+        for seed, value in zip(seeds, values):
+            scenario = scenario_key(seed, scenario_bank)
+            self._results[self.key(kind, bot, env_type, scenario)] = value
+            record = {
+                "kind": kind,
+                "bot": bot,
+                "env_type": env_type,
+                "scenario": scenario,
+                "value": value,
+            }
+            records.append(json.dumps(record) + "\n")
+        if records:
+            self._append("".join(records).encode())
+
+    def _append(self, data: bytes):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                # terminate the line a crashed writer cut off
+                data = b"\n" + data
+            while data:
+                data = data[os.write(fd, data) :]
+            os.fsync(fd)
+        finally:
+            # closing releases the lock
+            os.close(fd)
+
+
+def open_store(store) -> Optional[ResultsStore]:
+    """
+    Open a store given by path, stores are passed through.
+    :type store: str, Path, ResultsStore or None
+    """
+    if store is None or isinstance(store, ResultsStore):
+        return store
+    return ResultsStore(store)
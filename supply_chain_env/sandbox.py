@@ -0,0 +1,293 @@
+"""Agents in worker processes, with a time budget per turn.
+
+`AgentSandbox` runs every agent in a process of its own. Each turn the env's flat
+observations are copied into one shared memory row per agent, all agents are asked
+for their action at once and decide concurrently, and the turn waits at most
+`timeout` seconds for them. An agent that misses the deadline or raises an error
+places the `default_action` instead; a worker that is still busy with an earlier turn
+is skipped until it answers. A worker that dies, e.g. because its agent exited the
+process, places the `default_action` for the rest of the game, every turn counting
+as an error, and is started again for the next game.
+
+The agents only get their own row of the observations as the usual state dict, so
+they can't look at the env or at each other's state, and a slow or hung agent can't
+stall the game. Processes are not a security boundary though: agents could still
+use files or sockets.
+
+Agents are created in their worker by the `create_agents` factory, which has to be
+picklable, i.e. defined at module level. When a game has a seed, every worker seeds
+NumPy's global generator with its agent's child of the agents' stream of the game
+(see `supply_chain_env.envs.streams`), so games are reproducible as long as no agent
+times out, but differ from `run_game`, where all agents draw from one generator.
+
+Usage::
+
+    with AgentSandbox(create_agents, timeout=0.1) as sandbox:
+        last_state = run_sandboxed_game(sandbox, "classical", seed=0)
+    print(sandbox.timeouts, sandbox.errors)
+"""
+import multiprocessing
+from multiprocessing.connection import wait
+from time import perf_counter
+from typing import Callable, Optional
+
+import numpy as np
+
+from supply_chain_env.envs.env import SupplyChainBotTournament
+from supply_chain_env.envs.observations import (
+    ObservationView,
+    n_observation_fields,
+    observation_layout,
+)
+from supply_chain_env.envs.scenario_bank import open_bank
+from supply_chain_env.envs.streams import seed_agents
+
+# seconds to wait for a worker to stop before it is terminated
+STOP_TIMEOUT = 1.0
+
+
+def _worker(
+    connection,
+    create_agents: Callable,
+    index: int,
+    row,
+    lead_time: int,
+    order_lead_time: int,
+    shipment_lead_time: int,
+):
+    """
+    Serve one agent: ``("game", seed)`` creates a new agent, ``("act", turn)`` replies
+    ``(turn, action, error)`` for the observations in `row` and ``("stop",)`` exits.
+    """
+    view = ObservationView(
+        np.frombuffer(row, dtype=np.float64),
+        observation_layout(lead_time),
+        order_lead_time,
+        shipment_lead_time,
+    )
+    agent = None
+    while True:
+        message = connection.recv()
+        command = message[0]
+        if command == "stop":
+            break
+        if command == "game":
+            seed = message[1]
+            if seed is not None:
+                seed_agents(seed, agent=index)
+            agent = create_agents()[index]
+        elif command == "act":
+            state = {
+                key: value.astype(np.int64).tolist()
+                if isinstance(value, np.ndarray)
+                else value
+                for key, value in view.items()
+            }
+            try:
+                connection.send((message[1], int(agent.get_action(state)), None))
+            except Exception as e:
+                connection.send((message[1], None, repr(e)))
+    connection.close()
+
+
+class AgentSandbox:
+    """
+    Worker processes of the agents of a chain, reused for many games.
+    """
+
+    def __init__(
+        self,
+        create_agents: Callable,
+        timeout: float = 1.0,
+        default_action: int = 0,
+        n_agents: int = 4,
+        order_lead_times=None,
+        shipment_lead_times=None,
+        context: Optional[str] = None,
+    ):
+        """
+        :param create_agents: factory of the agents, called once per game and worker
+        :param timeout: seconds a turn waits for the actions
+        :param default_action: order placed for agents without an action in time
+        :param n_agents, order_lead_times, shipment_lead_times: configuration of the
+            chain, see `SupplyChainBotTournament`
+        :param context: multiprocessing start method, the platform's default if None
+        """
+        self.timeout = timeout
+        self.default_action = default_action
+        self.chain = dict(
+            n_agents=n_agents,
+            order_lead_times=order_lead_times,
+            shipment_lead_times=shipment_lead_times,
+        )
+        env = SupplyChainBotTournament("classical", verbose=False, **self.chain)
+        n_fields = n_observation_fields(env.lead_time)
+        self._context = multiprocessing.get_context(context)
+        self._worker_args = [
+            (
+                create_agents,
+                i,
+                self._context.RawArray("d", n_fields),
+                env.lead_time,
+                int(env.order_lead_times[i]),
+                int(env.shipment_lead_times[i]),
+            )
+            for i in range(n_agents)
+        ]
+        self._rows = [
+            np.frombuffer(args[2], dtype=np.float64) for args in self._worker_args
+        ]
+        self._connections = [None] * n_agents
+        self._processes = [None] * n_agents
+        for i in range(n_agents):
+            self._start_worker(i)
+        # workers still computing the action of an earlier turn
+        self._busy = [False] * n_agents
+        # workers that died, they are started again for the next game
+        self._dead = [False] * n_agents
+        self._turn = 0
+        self.timeouts = np.zeros(n_agents, dtype=np.int64)
+        self.errors = np.zeros(n_agents, dtype=np.int64)
+        self.last_errors = [None] * n_agents
+
+    def _start_worker(self, i: int):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker, args=(child, *self._worker_args[i]), daemon=True
+        )
+        process.start()
+        child.close()
+        self._connections[i] = parent
+        self._processes[i] = process
+
+    def _worker_died(self, i: int):
+        self._dead[i] = True
+        self._busy[i] = False
+        self._connections[i].close()
+        process = self._processes[i]
+        process.join(STOP_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        self.errors[i] += 1
+        self.last_errors[i] = f"worker exited with code {process.exitcode}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def new_game(self, seed: Optional[int] = None):
+        """
+        Create new agents in the workers.
+        """
+        for i in range(len(self._connections)):
+            if self._dead[i]:
+                self._start_worker(i)
+                self._dead[i] = False
+            try:
+                self._connections[i].send(("game", seed))
+            except OSError:
+                self._worker_died(i)
+
+    def _collect_late_answers(self):
+        # a busy worker has exactly one answer outstanding, it is dropped
+        for i, connection in enumerate(self._connections):
+            if self._busy[i] and connection.poll():
+                try:
+                    connection.recv()
+                    self._busy[i] = False
+                except (EOFError, OSError):
+                    self._worker_died(i)
+
+    def get_actions(self, observations: np.ndarray) -> list:
+        """
+        Actions of all agents for the flat `observations` of a turn, the default
+        action for agents that are busy, fail or miss the deadline.
+        :type observations: np.array of shape (n_agents, n_fields)
+        """
+        deadline = perf_counter() + self.timeout
+        self._collect_late_answers()
+        self._turn += 1
+        pending = {}
+        for i, connection in enumerate(self._connections):
+            if self._dead[i]:
+                self.errors[i] += 1
+                continue
+            if self._busy[i]:
+                self.timeouts[i] += 1
+                continue
+            self._rows[i][:] = observations[i]
+            try:
+                connection.send(("act", self._turn))
+            except OSError:
+                self._worker_died(i)
+                continue
+            pending[connection] = i
+        actions = [self.default_action] * len(self._connections)
+        while pending:
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                break
+            for connection in wait(list(pending), remaining):
+                i = pending.pop(connection)
+                try:
+                    _, action, error = connection.recv()
+                except (EOFError, OSError):
+                    self._worker_died(i)
+                    continue
+                if error is None:
+                    actions[i] = max(action, 0)
+                else:
+                    self.errors[i] += 1
+                    self.last_errors[i] = error
+        for i in pending.values():
+            self._busy[i] = True
+            self.timeouts[i] += 1
+        return actions
+
+    def close(self):
+        for i, (connection, process) in enumerate(
+            zip(self._connections, self._processes)
+        ):
+            if self._dead[i]:
+                continue
+            try:
+                connection.send(("stop",))
+            except OSError:
+                pass
+            process.join(STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            connection.close()
+
+
+def run_sandboxed_game(
+    sandbox: AgentSandbox,
+    environment: str = "classical",
+    seed: Optional[int] = None,
+    scenario_bank=None,
+    scenario_id: Optional[int] = None,
+    verbose: bool = False,
+) -> list:
+    """
+    Play one game with the agents of the `sandbox`, like `run_game`.
+    :return: last state, list of dicts
+    """
+    env = SupplyChainBotTournament(
+        env_type=environment,
+        seed=seed,
+        verbose=False,
+        renderer="turns" if verbose else None,
+        flat_observations=True,
+        scenario_bank=open_bank(scenario_bank),
+        **sandbox.chain,
+    )
+    observations = env.reset(scenario_id=scenario_id)
+    sandbox.new_game(seed)
+    while not env.done:
+        observations, rewards, done, _ = env.step(sandbox.get_actions(observations))
+    env.close()
+    return [dict(view) for view in env.observation_views]
@@ -0,0 +1,31 @@
+"""Generate a scenario bank, see `supply_chain_env.envs.scenario_bank`.
+
+Usage::
+
+    python -m supply_chain_env.scenario_bank banks/classical.npy --env_type classical
+
+writes 100000 scenarios of the given env type, see ``--help`` for more options.
+"""
+from argparse import ArgumentParser
+
+from supply_chain_env.envs.scenario_bank import ENV_TYPES, ScenarioBank
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description="Generate a scenario bank.")
+    parser.add_argument("path")
+    parser.add_argument("--env_type", choices=ENV_TYPES, default="classical")
+    parser.add_argument("--n_scenarios", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(args):
+    bank = ScenarioBank.create(
+        args.path, env_type=args.env_type, n_scenarios=args.n_scenarios, seed=args.seed
+    )
+    print(f"Wrote {len(bank)} {bank.env_type} scenarios to {bank.path}")
+
+
+if __name__ == "__main__":
+    main(parse_args())
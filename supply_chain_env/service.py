@@ -0,0 +1,608 @@
+"""Local tournament service with a submission queue and a SQLite leaderboard.
+
+For in-house competitions without the remote leaderboard: the service accepts bot
+submissions over HTTP, queues them, evaluates them with `run_tournament` on a pool
+of worker processes and keeps the scores in a SQLite database. It only listens on
+the local interface by default and needs no network access.
+
+The event loop only parses requests and reads or writes the database, evaluations
+run in the pool, so submitting never waits for an evaluation. Queued submissions are
+stored before they are acknowledged and evaluated after a restart.
+
+API, all bodies are JSON, POST requests need a ``Content-Type: application/json``:
+
+* ``POST /add-user-score`` ``{"user": ..., "score": ...}`` stores a score, like the
+  leaderboard `LeaderboardClient` posts to, so bots can be pointed at the service
+  with ``LEADERBOARD_URL=http://127.0.0.1:8000/add-user-score``
+* ``POST /submissions`` ``{"user": ..., "agents": "module:attribute"}`` or
+  ``{"user": ..., "source": "<source of a bot.py>"}`` queues the agent factory
+  (``create_agents`` of the source) for evaluation, responds ``{"id": ...}``.
+  Sources are only accepted with ``--auth``
+* ``GET /submissions/<id>`` status, score and mean cost per env type of a submission
+* ``GET /leaderboard`` the last score of every user, the lowest first, or the best
+  score of every user with ``?best=1``
+
+Submitted sources are executed by the workers, so only run the service for people
+who may run code on the machine, and give them the ``--auth`` credentials. Binding
+to the local interface alone doesn't protect the service: any web page in a
+browser on the machine can post to it. Browsers can only post JSON after a CORS
+preflight request, which the service doesn't answer, so other content types are
+rejected.
+
+Usage::
+
+    python -m supply_chain_env.service --db leaderboard.sqlite --port 8000 --workers 4
+"""
+import asyncio
+import json
+import math
+import sqlite3
+import sys
+import time
+import types
+from argparse import ArgumentParser
+from base64 import b64encode
+from functools import partial
+from http import HTTPStatus
+from typing import Iterable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from supply_chain_env.tournament import ENV_TYPES, load_object, run_tournament
+
+# requests with larger bodies are rejected
+MAX_BODY_BYTES = 2**20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    agents TEXT,
+    source TEXT,
+    status TEXT NOT NULL,
+    score REAL,
+    env_means TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    score REAL NOT NULL,
+    submission_id INTEGER REFERENCES submissions (id),
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_user ON scores (user);
+"""
+
+
+class Leaderboard:
+    """
+    Submissions and scores in a SQLite database.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: database file, created if it doesn't exist
+        """
+        self.path = str(path)
+        # used by the event loop's thread only, which needn't be the creating one
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # readers, e.g. the sqlite3 shell, don't block the service
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_score(self, user: str, score: float, submission_id=None) -> int:
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO scores (user, score, submission_id, created) "
+                "VALUES (?, ?, ?, ?)",
+                (user, score, submission_id, time.time()),
+            )
+        return cursor.lastrowid
+
+    def ranking(self, best: bool = False) -> list:
+        """
+        The last (or with `best` the lowest) score of every user, the lowest first.
+        :rtype: list of dicts with the ``rank``, ``user``, ``score`` and ``n_scores``
+        """
+        if best:
+            query = (
+                "SELECT user, MIN(score) AS score, COUNT(*) AS n_scores FROM scores "
+                "GROUP BY user ORDER BY score, user"
+            )
+        else:
+            query = (
+                "SELECT scores.user, scores.score, counts.n_scores FROM scores JOIN "
+                "(SELECT user, MAX(id) AS id, COUNT(*) AS n_scores FROM scores "
+                "GROUP BY user) AS counts ON scores.id = counts.id "
+                "ORDER BY scores.score, scores.user"
+            )
+        return [
+            {"rank": rank, **dict(row)}
+            for rank, row in enumerate(self.connection.execute(query), 1)
+        ]
+
+    def add_submission(
+        self, user: str, agents: Optional[str] = None, source: Optional[str] = None
+    ) -> int:
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO submissions (user, agents, source, status, created) "
+                "VALUES (?, ?, ?, 'queued', ?)",
+                (user, agents, source, time.time()),
+            )
+        return cursor.lastrowid
+
+    def get_submission(self, submission_id: int, source: bool = False):
+        """
+        The submission as a dict, None if there is none with this id.
+        """
+        row = self.connection.execute(
+            "SELECT * FROM submissions WHERE id = ?", (submission_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        submission = dict(row)
+        if submission["env_means"] is not None:
+            submission["env_means"] = json.loads(submission["env_means"])
+        if not source:
+            del submission["source"]
+        return submission
+
+    def pending_submissions(self) -> list:
+        """
+        Ids of the submissions that are queued or were running when the service
+        stopped, the oldest first.
+        """
+        rows = self.connection.execute(
+            "SELECT id FROM submissions WHERE status IN ('queued', 'running') "
+            "ORDER BY id"
+        )
+        return [row["id"] for row in rows]
+
+    def start_submission(self, submission_id: int):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE submissions SET status = 'running' WHERE id = ?",
+                (submission_id,),
+            )
+
+    def finish_submission(
+        self,
+        submission_id: int,
+        score: Optional[float] = None,
+        env_means: Optional[dict] = None,
+        error: Optional[str] = None,
+    ):
+        """
+        Store the result of an evaluation, the score goes to the leaderboard.
+        """
+        status = "failed" if error is not None else "done"
+        with self.connection:
+            self.connection.execute(
+                "UPDATE submissions SET status = ?, score = ?, env_means = ?, "
+                "error = ?, finished = ? WHERE id = ?",
+                (
+                    status,
+                    score,
+                    None if env_means is None else json.dumps(env_means),
+                    error,
+                    time.time(),
+                    submission_id,
+                ),
+            )
+            if error is None:
+                user = self.connection.execute(
+                    "SELECT user FROM submissions WHERE id = ?", (submission_id,)
+                ).fetchone()["user"]
+                self.connection.execute(
+                    "INSERT INTO scores (user, score, submission_id, created) "
+                    "VALUES (?, ?, ?, ?)",
+                    (user, score, submission_id, time.time()),
+                )
+
+
+def load_submission(
+    submission_id: int, agents: Optional[str] = None, source: Optional[str] = None
+):
+    """
+    The agent factory of a submission, `agents` given as ``module:attribute`` or
+    ``create_agents`` of the `source`.
+    """
+    if source is None:
+        return load_object(agents)
+    name = f"submission_{submission_id}"
+    module = types.ModuleType(name)
+    exec(compile(source, f"<submission {submission_id}>", "exec"), module.__dict__)
+    # the factory is pickled by reference when the agents run in a sandbox
+    sys.modules[name] = module
+    return module.create_agents
+
+
+def evaluate_submission(
+    submission_id: int,
+    agents: Optional[str],
+    source: Optional[str],
+    seeds: list,
+    env_types: list,
+    sandbox_timeout: Optional[float] = None,
+) -> dict:
+    """
+    Play the tournament with the agents of a submission.
+    :return: dict with the ``score``, the mean of the mean total costs of the env
+        types, and the ``env_means``
+    """
+    create_agents = load_submission(submission_id, agents, source)
+    summaries = run_tournament(
+        create_agents,
+        seeds=seeds,
+        env_types=env_types,
+        n_workers=1,
+        sandbox_timeout=sandbox_timeout,
+    )
+    env_means = {env_type: summary["mean"] for env_type, summary in summaries.items()}
+    return {
+        "score": sum(env_means.values()) / len(env_means),
+        "env_means": env_means,
+    }
+
+
+class RequestError(Exception):
+    """A request the service can't answer, carrying the HTTP status."""
+
+    def __init__(self, status: HTTPStatus, message: Optional[str] = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class TournamentService:
+    """
+    HTTP API and evaluation queue on top of a `Leaderboard`, run by an asyncio
+    event loop.
+    """
+
+    def __init__(
+        self,
+        leaderboard: Leaderboard,
+        seeds: Iterable[int] = range(100),
+        env_types: Iterable[str] = ENV_TYPES,
+        n_workers: int = 1,
+        sandbox_timeout: Optional[float] = None,
+        auth=None,
+    ):
+        """
+        :param seeds, env_types: games every submission is evaluated on
+        :param n_workers: submissions evaluated at once, each in a worker process
+        :param sandbox_timeout: see `run_tournament`
+        :param auth: (username, password) POST requests need as basic auth, None to
+            accept all requests but submissions of sources
+        """
+        self.leaderboard = leaderboard
+        self.seeds = list(seeds)
+        self.env_types = list(env_types)
+        self.n_workers = n_workers
+        self.sandbox_timeout = sandbox_timeout
+        self._authorization = None
+        if auth is not None:
+            credentials = b64encode(":".join(auth).encode()).decode()
+            self._authorization = f"Basic {credentials}"
+        self._pool = None
+        self._queue = None
+        self._evaluators = []
+        self._connections = set()
+        self._server = None
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000):
+        """
+        Queue the pending submissions, start evaluating and listen on `port`, a free
+        one if 0.
+        """
+        self._pool = self._create_pool()
+        self._queue = asyncio.Queue()
+        for submission_id in self.leaderboard.pending_submissions():
+            self._queue.put_nowait(submission_id)
+        self._evaluators = [
+            asyncio.create_task(self._evaluate_queued()) for _ in range(self.n_workers)
+        ]
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    def _create_pool(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # forked workers would inherit the sockets of open connections and keep
+        # them open after the service closed them
+        context = multiprocessing.get_context("forkserver")
+        return ProcessPoolExecutor(self.n_workers, mp_context=context)
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def join(self):
+        """
+        Wait until all queued submissions are evaluated.
+        """
+        await self._queue.join()
+
+    async def close(self):
+        """
+        Stop serving and evaluating, running evaluations are queued again on the
+        next start.
+        """
+        self._server.close()
+        await self._server.wait_closed()
+        # idle keep-alive connections are not closed by the server
+        tasks = [*self._connections, *self._evaluators]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(
+        self, user: str, agents: Optional[str] = None, source: Optional[str] = None
+    ) -> int:
+        """
+        Store and queue a submission.
+        :return: id of the submission
+        """
+        submission_id = self.leaderboard.add_submission(user, agents, source)
+        self._queue.put_nowait(submission_id)
+        return submission_id
+
+    async def _evaluate_queued(self):
+        while True:
+            submission_id = await self._queue.get()
+            try:
+                await self._evaluate(submission_id)
+            finally:
+                self._queue.task_done()
+
+    async def _evaluate(self, submission_id: int):
+        from concurrent.futures.process import BrokenProcessPool
+
+        submission = self.leaderboard.get_submission(submission_id, source=True)
+        self.leaderboard.start_submission(submission_id)
+        pool = self._pool
+        evaluate = partial(
+            evaluate_submission,
+            submission_id,
+            submission["agents"],
+            submission["source"],
+            self.seeds,
+            self.env_types,
+            self.sandbox_timeout,
+        )
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(pool, evaluate)
+        except BrokenProcessPool as e:
+            # a worker died, e.g. a submission exited the process, which fails all
+            # evaluations running in the pool
+            if self._pool is pool:
+                self._pool = self._create_pool()
+            self.leaderboard.finish_submission(submission_id, error=repr(e))
+        except Exception as e:
+            self.leaderboard.finish_submission(submission_id, error=repr(e))
+        else:
+            self.leaderboard.finish_submission(submission_id, **result)
+
+    async def _serve(self, reader, writer):
+        """
+        Answer the HTTP/1.1 requests of a connection until the client closes it.
+        """
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                keep_alive = True
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, data = self._respond(method, target, headers, body)
+                except RequestError as e:
+                    status, data = e.status, {"error": str(e)}
+                    # the rest of the request can't be told apart from the next one
+                    keep_alive = False
+                self._write_response(writer, status, data, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split()
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method, target, headers, body
+
+    @staticmethod
+    def _write_response(writer, status: HTTPStatus, data, keep_alive: bool):
+        body = json.dumps(data).encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n"
+            ).encode()
+            + body
+        )
+
+    def _respond(self, method: str, target: str, headers: dict, body: bytes):
+        """
+        Route a request.
+        :return: (status, JSON-serializable data)
+        """
+        url = urlsplit(target)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        try:
+            if method == "POST":
+                content_type = headers.get("content-type", "").partition(";")[0]
+                if content_type.strip().lower() != "application/json":
+                    raise RequestError(
+                        HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Post application/json"
+                    )
+                if self._authorization is not None:
+                    if headers.get("authorization") != self._authorization:
+                        raise RequestError(HTTPStatus.UNAUTHORIZED)
+                if path == "/add-user-score":
+                    data = _parse_json(body)
+                    score = data.get("score")
+                    if isinstance(score, bool) or not isinstance(score, (int, float)):
+                        raise RequestError(HTTPStatus.BAD_REQUEST, "No numeric score")
+                    if not math.isfinite(score):
+                        raise RequestError(HTTPStatus.BAD_REQUEST, "No finite score")
+                    score_id = self.leaderboard.add_score(_user(data), score)
+                    return HTTPStatus.OK, {"id": score_id}
+                if path == "/submissions":
+                    data = _parse_json(body)
+                    agents, source = data.get("agents"), data.get("source")
+                    if not isinstance(agents, str) and not isinstance(source, str):
+                        raise RequestError(
+                            HTTPStatus.BAD_REQUEST, "Submit agents or a source"
+                        )
+                    if isinstance(source, str) and self._authorization is None:
+                        # anyone could run code on the machine
+                        raise RequestError(
+                            HTTPStatus.FORBIDDEN, "Sources require --auth"
+                        )
+                    submission_id = self.submit(
+                        _user(data),
+                        agents if isinstance(agents, str) else None,
+                        source if isinstance(source, str) else None,
+                    )
+                    status = {"id": submission_id, "queued": self._queue.qsize()}
+                    return HTTPStatus.ACCEPTED, status
+            elif method == "GET":
+                if path == "/leaderboard":
+                    best = query.get("best", ["0"])[0] not in ("0", "false")
+                    return HTTPStatus.OK, {
+                        "leaderboard": self.leaderboard.ranking(best=best)
+                    }
+                if path.startswith("/submissions/"):
+                    submission_id = path[len("/submissions/") :]
+                    submission = None
+                    if submission_id.isdigit():
+                        submission = self.leaderboard.get_submission(
+                            int(submission_id)
+                        )
+                    if submission is None:
+                        raise RequestError(HTTPStatus.NOT_FOUND)
+                    return HTTPStatus.OK, submission
+            if path in ("/add-user-score", "/submissions", "/leaderboard"):
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED)
+            raise RequestError(HTTPStatus.NOT_FOUND)
+        except RequestError as e:
+            # the body was read, the connection can be kept
+            return e.status, {"error": str(e)}
+
+
+def _parse_json(body: bytes) -> dict:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "The body is no JSON")
+    if not isinstance(data, dict):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "The body is no JSON object")
+    return data
+
+
+def _user(data: dict) -> str:
+    user = data.get("user")
+    if not isinstance(user, str) or not user:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "No user")
+    return user
+
+
+async def serve(service: TournamentService, host: str, port: int):
+    await service.start(host, port)
+    print(f"Serving the leaderboard on http://{host}:{service.port}")
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="leaderboard.sqlite")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--n_seeds", type=int, default=100)
+    parser.add_argument("--first_seed", type=int, default=0)
+    parser.add_argument("--env_types", nargs="+", default=list(ENV_TYPES))
+    parser.add_argument(
+        "--sandbox",
+        type=float,
+        default=None,
+        metavar="TIMEOUT",
+        help="run every agent in a process of its own with this many seconds per turn",
+    )
+    parser.add_argument(
+        "--auth",
+        default=None,
+        metavar="USER:PASSWORD",
+        help="basic auth credentials required to post scores and submissions, "
+        "sources are only accepted with them",
+    )
+    return parser.parse_args(argv)
+
+
+def main(args):
+    leaderboard = Leaderboard(args.db)
+    service = TournamentService(
+        leaderboard,
+        seeds=range(args.first_seed, args.first_seed + args.n_seeds),
+        env_types=args.env_types,
+        n_workers=args.workers,
+        sandbox_timeout=args.sandbox,
+        auth=None if args.auth is None else tuple(args.auth.split(":", 1)),
+    )
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        leaderboard.close()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,292 @@
+"""Adversarial search for the scenarios a bot plays worst.
+
+The env types draw initial states and demand traces from benign distributions, so
+random seeds rarely hit the scenarios in which a bot fails. `search` looks for them
+instead: a genetic algorithm evolves a population of scenarios (initial state and
+demand trace, see `scenario_dtype`) of an env type towards the highest total cost of
+the bot. It starts from scenarios of the env type's own distribution, breeds new
+ones from the costlier of random pairs by crossover and mutation, and keeps the
+costliest distinct scenarios of parents and children.
+
+The search space of an env type is the support of its initial state noise and a
+demand per turn within `DEMAND_BOUNDS`, see `scenario_bounds`.
+
+The new scenarios of a generation are played in one `VectorSupplyChainBotTournament`
+if any agent implements the batch protocol, like in the tournament, and one by one
+otherwise. The agents are seeded with the same seed in every game, so the cost of a
+scenario doesn't depend on when it is played, and the costs of all scenarios played
+are memoized by their records: scenarios that selection, crossover and mutation
+produce again are not played again.
+
+The worst scenarios are written as a scenario bank (see
+`supply_chain_env.envs.scenario_bank`), a reusable fixture for
+`run_tournament(scenario_banks=...)`, ``env.reset(scenario_id=...)`` or tests.
+
+Usage::
+
+    python -m supply_chain_env.stress --agents bot:create_agents \\
+        --env_type normal_10_4 --generations 50 --out stress/normal_10_4.npy
+"""
+from argparse import ArgumentParser
+from typing import Callable, Optional
+
+import numpy as np
+
+from supply_chain_env.envs.env import SupplyChainBotTournament
+from supply_chain_env.envs.scenario_bank import (
+    ENV_TYPES,
+    INIT_PARAMS,
+    ScenarioBank,
+    generate_scenarios,
+)
+from supply_chain_env.envs.streams import seed_agents
+from supply_chain_env.tournament import (
+    has_batch_protocol,
+    load_object,
+    run_games_batched,
+)
+
+# lowest and highest end customer demand of a turn
+DEMAND_BOUNDS = {
+    "classical": (0, 8),  # up to the demand after the step
+    "uniform_0_2": (0, 2),
+    "normal_10_4": (0, 22),  # up to 3 standard deviations above the mean
+}
+
+
+def scenario_bounds(env_type: str) -> dict:
+    """
+    Lowest and highest value of every field of the scenarios of an env type: the
+    initial state within the support of its noise, the demand within
+    `DEMAND_BOUNDS`.
+    :return: dict mapping the fields of `scenario_dtype` to (low, high) pairs
+    """
+    params = INIT_PARAMS[env_type]
+    level, width = params["level"], params["pipeline_noise"][1]
+    pipeline = (level - width, level + width)
+    stock, width = params["stock"], params["stock_noise"][1]
+    return {
+        "orders": pipeline,
+        "inbound_shipments": pipeline,
+        "next_incoming_orders": pipeline,
+        "stocks": (stock - width, stock + width),
+        "demand": DEMAND_BOUNDS[env_type],
+    }
+
+
+def play_scenarios(
+    create_agents: Callable, env_type: str, scenarios: np.ndarray, seed: int = 0
+) -> np.ndarray:
+    """
+    Play every scenario with fresh agents, seeded with `seed` in every game.
+    :param scenarios: records of `scenario_dtype`
+    :rtype: np.array of shape (len(scenarios), n_agents), cumulative cost of each
+        agent
+    """
+    if len(scenarios) and any(has_batch_protocol(a) for a in create_agents()):
+        seeds = [seed] * len(scenarios)
+        return run_games_batched(create_agents, env_type, seeds, scenarios=scenarios)
+    env = SupplyChainBotTournament(env_type=env_type, verbose=False)
+    costs = np.zeros((len(scenarios), env.n_agents))
+    for k, scenario in enumerate(scenarios):
+        seed_agents(seed)
+        agents = create_agents()
+        states = env.reset(scenario=scenario)
+        while not env.done:
+            actions = [agent.get_action(states[i]) for i, agent in enumerate(agents)]
+            states, rewards, done, _ = env.step(actions)
+        costs[k] = env.cum_holding_cost + env.cum_stockout_cost
+    return costs
+
+
+def crossover(first: np.ndarray, second: np.ndarray, rng) -> np.ndarray:
+    """
+    Children of pairs of scenarios: the initial state values are taken from either
+    parent at random, the demand trace of the first parent up to a random turn and
+    the one of the second parent after it.
+    """
+    children = first.copy()
+    for field in first.dtype.names:
+        if field == "demand":
+            n_turns = first[field].shape[1]
+            cuts = rng.integers(1, n_turns, size=(len(first), 1))
+            mask = np.arange(n_turns) < cuts
+        else:
+            mask = rng.random(first[field].shape) < 0.5
+        children[field] = np.where(mask, first[field], second[field])
+    return children
+
+
+def mutate(scenarios: np.ndarray, bounds: dict, rng, rate: float = 0.1) -> np.ndarray:
+    """
+    Copies of the scenarios with random changes within the `bounds`: every value
+    changes with probability `rate` by up to a quarter of its range, and half of the
+    demand traces get a shock, a random window of turns at the lowest or highest
+    demand.
+    """
+    children = scenarios.copy()
+    for field, (low, high) in bounds.items():
+        values = children[field]
+        step = max((high - low) // 4, 1)
+        changed = rng.random(values.shape) < rate
+        values += changed * rng.integers(-step, step + 1, size=values.shape)
+        np.clip(values, low, high, out=values)
+    demand = children["demand"]
+    n_turns = demand.shape[1]
+    for k in np.flatnonzero(rng.random(len(children)) < 0.5):
+        length = rng.integers(1, n_turns // 4 + 1)
+        start = rng.integers(0, n_turns - length + 1)
+        demand[k, start : start + length] = bounds["demand"][rng.integers(2)]
+    children["orders"][:, -1, 1:] = 0  # manufacturer has an order lead time of 1
+    return children
+
+
+def search(
+    create_agents: Callable,
+    env_type: str = "classical",
+    population_size: int = 64,
+    n_generations: int = 30,
+    n_worst: int = 10,
+    mutation_rate: float = 0.1,
+    seed: int = 0,
+    agents_seed: int = 0,
+    max_games: Optional[int] = None,
+) -> dict:
+    """
+    Search the scenarios of an env type with the highest total cost of the agents.
+    :param population_size: scenarios kept and bred every generation
+    :param seed: seed of the search
+    :param agents_seed: seed of the agents in every game, see `play_scenarios`
+    :param max_games: stop after the generation that reached this many games
+    :return: dict with the ``n_worst`` costliest distinct ``scenarios`` found, the
+        worst first, their ``costs`` per agent and ``total_costs``; the
+        ``random_worst`` and ``random_mean`` total cost of the random scenarios the
+        search started from, the worst total cost after every generation
+        (``history``), the ``n_games`` played and the ``n_memo_hits`` of scenarios
+        that weren't played again
+    """
+    rng = np.random.default_rng(seed)
+    bounds = scenario_bounds(env_type)
+    # agents' costs by scenario record
+    memo = {}
+    n_memo_hits = 0
+
+    def evaluate(scenarios):
+        nonlocal n_memo_hits
+        keys = [scenario.tobytes() for scenario in scenarios]
+        new = {}
+        for k, key in enumerate(keys):
+            if key not in memo and key not in new:
+                new[key] = k
+        n_memo_hits += len(keys) - len(new)
+        costs = play_scenarios(
+            create_agents, env_type, scenarios[list(new.values())], agents_seed
+        )
+        memo.update(zip(new, costs))
+        return keys, np.array([memo[key].sum() for key in keys])
+
+    population = generate_scenarios(env_type, population_size, rng)
+    keys, totals = evaluate(population)
+    random_worst, random_mean = float(totals.max()), float(totals.mean())
+    history = []
+    for _ in range(n_generations):
+        # tournament selection: the costlier scenario of a random pair is a parent
+        pairs = rng.integers(len(population), size=(2, population_size, 2))
+        parents = np.where(
+            totals[pairs[..., 0]] >= totals[pairs[..., 1]],
+            pairs[..., 0],
+            pairs[..., 1],
+        )
+        children = crossover(population[parents[0]], population[parents[1]], rng)
+        children = mutate(children, bounds, rng, mutation_rate)
+        child_keys, child_totals = evaluate(children)
+
+        # the costliest distinct scenarios of parents and children survive
+        candidates = np.concatenate([population, children])
+        candidate_keys = keys + child_keys
+        candidate_totals = np.concatenate([totals, child_totals])
+        survivors, seen = [], set()
+        for k in np.argsort(-candidate_totals, kind="stable"):
+            if candidate_keys[k] not in seen:
+                seen.add(candidate_keys[k])
+                survivors.append(k)
+            if len(survivors) == population_size:
+                break
+        population = candidates[survivors]
+        keys = [candidate_keys[k] for k in survivors]
+        totals = candidate_totals[survivors]
+        history.append(float(totals[0]))
+        if max_games is not None and len(memo) >= max_games:
+            break
+
+    worst = sorted(memo, key=lambda key: -memo[key].sum())[:n_worst]
+    scenarios = np.concatenate(
+        [np.frombuffer(key, dtype=population.dtype) for key in worst]
+    )
+    costs = np.array([memo[key] for key in worst])
+    return {
+        "scenarios": scenarios,
+        "costs": costs,
+        "total_costs": costs.sum(axis=1),
+        "random_worst": random_worst,
+        "random_mean": random_mean,
+        "history": history,
+        "n_games": len(memo),
+        "n_memo_hits": n_memo_hits,
+    }
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", default="bot:create_agents")
+    parser.add_argument("--env_type", choices=ENV_TYPES, default="classical")
+    parser.add_argument("--population", type=int, default=64)
+    parser.add_argument("--generations", type=int, default=30)
+    parser.add_argument("--n_worst", type=int, default=10)
+    parser.add_argument("--mutation_rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--agents_seed", type=int, default=0)
+    parser.add_argument("--max_games", type=int, default=None)
+    parser.add_argument(
+        "--out", default=None, help="scenario bank (.npy) of the worst scenarios"
+    )
+    return parser.parse_args(argv)
+
+
+def main(args):
+    results = search(
+        load_object(args.agents),
+        env_type=args.env_type,
+        population_size=args.population,
+        n_generations=args.generations,
+        n_worst=args.n_worst,
+        mutation_rate=args.mutation_rate,
+        seed=args.seed,
+        agents_seed=args.agents_seed,
+        max_games=args.max_games,
+    )
+    print(
+        f"{args.env_type}: worst total cost {results['total_costs'][0]:.1f} after "
+        f"{results['n_games']} games ({results['n_memo_hits']} memoized), random "
+        f"scenarios: worst {results['random_worst']:.1f}, "
+        f"mean {results['random_mean']:.1f}"
+    )
+    for scenario, total in zip(results["scenarios"], results["total_costs"]):
+        print(f"  {total:10.1f}  demand {scenario['demand'].tolist()}")
+    if args.out:
+        bank = ScenarioBank.save(
+            args.out,
+            args.env_type,
+            results["scenarios"],
+            source="supply_chain_env.stress",
+            agents=args.agents,
+            agents_seed=args.agents_seed,
+            seed=args.seed,
+            total_costs=results["total_costs"].tolist(),
+        )
+        print(f"Wrote {len(bank)} scenarios to {bank.path}")
+    return results
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,355 @@
+"""Parallel parameter sweeps of parameterized agents.
+
+A sweep evaluates an agent factory taking keyword parameters, e.g.
+``create_agents(target=12, alpha=0.5)``, on seeded games of every env type and ranks
+the parameter configurations by their mean total cost. Configurations are a full
+grid, random samples or random samples raced by successive halving, which plays few
+seeds per configuration first and only keeps the best ``1 / eta`` of them for the
+next, ``eta`` times larger set of seeds.
+
+The total cost of every game is cached on disk, keyed on the factory and the
+source of the agents it creates, the parameters, the env type and the scenario id
+(seed), so repeated or extended sweeps only play the games they haven't played
+before and edited bots are played again. Halving rungs use prefixes of the
+same seeds, so every rung reuses the games of the previous one.
+
+Usage::
+
+    python -m supply_chain_env.sweep --agents mybot:create_agents \\
+        --param target=8,10,12,14 --param alpha=0.1:0.9 \\
+        --search halving --n_configs 64 --n_seeds 400 --cache sweep.jsonl
+"""
+import functools
+import itertools
+import json
+import math
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from supply_chain_env.tournament import ENV_TYPES, _play_games, load_object
+
+SEARCHES = ("grid", "random", "halving")
+# games sent to a worker at once
+CHUNK_SIZE = 50
+
+
+class SweepCache:
+    """
+    Total costs of games keyed by (factory, parameters, env type, scenario), kept in
+    memory and appended to a JSON lines file if a path is given.
+    """
+
+    def __init__(self, path=None):
+        self.path = None if path is None else Path(path)
+        self._costs = {}
+        if self.path is not None and self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # empty or cut off by an interrupted sweep
+                        continue
+                    self._costs[record["key"]] = record["cost"]
+
+    @staticmethod
+    def key(factory, params: dict, env_type: str, scenario) -> str:
+        return json.dumps([factory, params, env_type, scenario], sort_keys=True)
+
+    def __len__(self):
+        return len(self._costs)
+
+    def __contains__(self, key):
+        return key in self._costs
+
+    def __getitem__(self, key) -> float:
+        return self._costs[key]
+
+    def update(self, costs: dict):
+        """
+        Add the costs of newly played games.
+        :param costs: dict mapping keys of `key` to total costs
+        """
+        self._costs.update(costs)
+        if self.path is not None and costs:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            lines = [json.dumps({"key": k, "cost": c}) + "\n" for k, c in costs.items()]
+            # one write per update, so concurrent sweeps don't interleave lines
+            with open(self.path, "a") as f:
+                f.write("".join(lines))
+
+
+def parse_param(spec: str) -> tuple:
+    """
+    Parse a parameter given as ``name=v1,v2,...`` (values to choose from) or
+    ``name=low:high`` (range to sample from, integers if both bounds are).
+    :return: (name, list of values or (low, high) tuple)
+    """
+    name, _, values = spec.partition("=")
+    if not name or not values:
+        raise ValueError(f"Parameters are given as name=values, got {spec!r}")
+    if ":" in values:
+        low, high = (json.loads(v) for v in values.split(":"))
+        return name, (low, high)
+    return name, [json.loads(v) for v in values.split(",")]
+
+
+def grid(space: dict) -> list:
+    """
+    All combinations of the parameter values.
+    :param space: dict mapping parameter names to lists of values
+    """
+    for name, values in space.items():
+        if isinstance(values, tuple):
+            raise ValueError(f"A grid needs a list of values for {name}, not a range")
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def sample(space: dict, n: int, seed: Optional[int] = None) -> list:
+    """
+    `n` random configurations, values are drawn uniformly from the lists or ranges.
+    :param space: dict mapping parameter names to lists of values or (low, high)
+    """
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    config[name] = int(rng.integers(low, high + 1))
+                else:
+                    config[name] = float(rng.uniform(low, high))
+            else:
+                config[name] = values[rng.integers(len(values))]
+        configs.append(config)
+    return configs
+
+
+def _play_config(factory, params, env_type, seeds, scenario_bank):
+    costs = _play_games(
+        functools.partial(factory, **params), env_type, seeds, scenario_bank
+    )
+    return costs.sum(axis=1).tolist()
+
+
+def evaluate(
+    factory: Callable,
+    configs: list,
+    seeds: Iterable[int],
+    env_types: Iterable[str] = ENV_TYPES,
+    cache: Optional[SweepCache] = None,
+    pool=None,
+    scenario_banks: Optional[dict] = None,
+) -> list:
+    """
+    Mean total cost of every configuration, only the games missing from the `cache`
+    are played, spread over the `pool` if given.
+
+    The mean is taken over the games of each env type first and then over the env
+    types.
+
+    :param scenario_banks: dict mapping env types to paths of scenario banks, seeds
+        are scenario ids of these
+    :return: list of dicts with the ``params``, the ``score`` and the ``env_means``
+        of every configuration, in the order of `configs`
+    """
+    seeds = list(seeds)
+    env_types = list(env_types)
+    cache = SweepCache() if cache is None else cache
+    scenario_banks = scenario_banks or {}
+    name = f"{factory.__module__}:{factory.__qualname__}"
+    fingerprints = {}
+
+    def key(params, env_type, seed):
+        config = json.dumps(params, sort_keys=True)
+        if config not in fingerprints:
+            from supply_chain_env.result_cache import agents_fingerprint
+
+            # the sources of the agents, costs of edited bots are outdated
+            fingerprint = agents_fingerprint(factory(**params), factory)
+            fingerprints[config] = name if fingerprint is None else fingerprint
+        bank = scenario_banks.get(env_type)
+        scenario = seed if bank is None else [str(bank), seed]
+        return SweepCache.key(fingerprints[config], params, env_type, scenario)
+
+    tasks = []
+    for params in configs:
+        for env_type in env_types:
+            missing = [s for s in seeds if key(params, env_type, s) not in cache]
+            for i in range(0, len(missing), CHUNK_SIZE):
+                tasks.append((params, env_type, missing[i : i + CHUNK_SIZE]))
+    args = [
+        (factory, params, env_type, missing, scenario_banks.get(env_type))
+        for params, env_type, missing in tasks
+    ]
+
+    def collect(task, costs):
+        params, env_type, missing = task
+        # cached as soon as a chunk is played, an interrupted sweep resumes from there
+        cache.update(
+            {key(params, env_type, seed): cost for seed, cost in zip(missing, costs)}
+        )
+
+    if pool is None:
+        for task, a in zip(tasks, args):
+            collect(task, _play_config(*a))
+    else:
+        futures = {pool.submit(_play_config, *a): t for t, a in zip(tasks, args)}
+        for future in as_completed(futures):
+            collect(futures[future], future.result())
+
+    evaluations = []
+    for params in configs:
+        env_means = {
+            env_type: float(np.mean([cache[key(params, env_type, s)] for s in seeds]))
+            for env_type in env_types
+        }
+        evaluations.append(
+            {
+                "params": params,
+                "score": float(np.mean(list(env_means.values()))),
+                "n_seeds": len(seeds),
+                "env_means": env_means,
+            }
+        )
+    return evaluations
+
+
+def successive_halving(
+    factory: Callable,
+    configs: list,
+    seeds: Iterable[int],
+    eta: int = 3,
+    min_seeds: Optional[int] = None,
+    **kwargs,
+) -> list:
+    """
+    Race the configurations: evaluate all of them on the first `min_seeds` seeds,
+    keep the best ``1 / eta`` of them, evaluate those on ``eta`` times as many seeds
+    and so on, until one configuration is left or all seeds are played.
+    :param min_seeds: seeds of the first rung, by default chosen so that the last
+        rung plays all seeds
+    :param kwargs: passed to `evaluate`
+    :return: the evaluations of the last rung each configuration reached, sorted
+        by rung, the last first, and then by score
+    """
+    seeds = list(seeds)
+    if min_seeds is None:
+        n_rungs = max(math.ceil(math.log(max(len(configs), 1), eta)), 0) + 1
+        min_seeds = math.ceil(len(seeds) / eta ** (n_rungs - 1))
+    n_seeds = max(min(min_seeds, len(seeds)), 1)
+    finished = []
+    while True:
+        evaluations = evaluate(factory, configs, seeds[:n_seeds], **kwargs)
+        evaluations.sort(key=lambda e: e["score"])
+        if len(evaluations) <= 1 or n_seeds >= len(seeds):
+            return evaluations + finished
+        n_kept = max(math.ceil(len(evaluations) / eta), 1)
+        finished = evaluations[n_kept:] + finished
+        configs = [e["params"] for e in evaluations[:n_kept]]
+        n_seeds = min(n_seeds * eta, len(seeds))
+
+
+def run_sweep(
+    factory: Callable,
+    space: dict,
+    seeds: Iterable[int] = range(100),
+    env_types: Iterable[str] = ENV_TYPES,
+    search: str = "grid",
+    n_configs: int = 20,
+    eta: int = 3,
+    n_workers: Optional[int] = None,
+    cache_path=None,
+    scenario_banks: Optional[dict] = None,
+    seed: Optional[int] = None,
+) -> list:
+    """
+    Search the parameter `space` of the agent `factory`.
+
+    `factory` is called with the parameters of a configuration as keyword arguments
+    once per game and has to be picklable (i.e. defined at module level) when
+    `n_workers` is not 1.
+
+    :param space: dict mapping parameter names to lists of values, or to (low, high)
+        ranges for random and halving searches
+    :param search: ``grid``, ``random`` (`n_configs` samples, all played on all
+        seeds) or ``halving`` (`n_configs` samples raced by `successive_halving`)
+    :param cache_path: JSON lines file caching the costs of all games played
+    :param seed: seed of the random configurations
+    :return: list of the evaluations of all configurations (see `evaluate`), the
+        best first
+    """
+    if search == "grid":
+        configs = grid(space)
+    elif search in ("random", "halving"):
+        configs = sample(space, n_configs, seed=seed)
+        # duplicates would only be evaluated again
+        configs = list({json.dumps(c): c for c in configs}.values())
+    else:
+        raise ValueError(f"Unknown search {search!r}, choose from {SEARCHES}")
+    cache = SweepCache(cache_path)
+    kwargs = dict(env_types=env_types, cache=cache, scenario_banks=scenario_banks)
+    n_workers = n_workers or os.cpu_count()
+    with ProcessPoolExecutor(n_workers) if n_workers > 1 else nullcontext() as pool:
+        kwargs["pool"] = pool
+        if search == "halving":
+            return successive_halving(factory, configs, seeds, eta=eta, **kwargs)
+        evaluations = evaluate(factory, configs, seeds, **kwargs)
+    return sorted(evaluations, key=lambda e: e["score"])
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", required=True, help="factory module:attribute")
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        help="name=v1,v2,... or name=low:high, can be repeated",
+    )
+    parser.add_argument("--search", choices=SEARCHES, default="grid")
+    parser.add_argument("--n_configs", type=int, default=20)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--n_seeds", type=int, default=100)
+    parser.add_argument("--first_seed", type=int, default=0)
+    parser.add_argument("--env_types", nargs="+", default=list(ENV_TYPES))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=None, help="JSON lines file of results")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    return parser.parse_args(argv)
+
+
+def main(args):
+    space = dict(parse_param(spec) for spec in args.param)
+    evaluations = run_sweep(
+        load_object(args.agents),
+        space,
+        seeds=range(args.first_seed, args.first_seed + args.n_seeds),
+        env_types=args.env_types,
+        search=args.search,
+        n_configs=args.n_configs,
+        eta=args.eta,
+        n_workers=args.workers,
+        cache_path=args.cache,
+        seed=args.seed,
+    )
+    for evaluation in evaluations[: args.top]:
+        print(
+            f"{evaluation['score']:10.1f} ({evaluation['n_seeds']} seeds) "
+            f"{json.dumps(evaluation['params'])}"
+        )
+    return evaluations
+
+
+if __name__ == "__main__":
+    main(parse_args())
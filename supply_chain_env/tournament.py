@@ -0,0 +1,602 @@
+"""Multi-seed tournament runner.
+
+Plays the agents returned by a `create_agents()` factory on many seeded games of every
+env type, spread over a process pool, and summarizes the total costs per scenario.
+
+The game of a seed is the first game of that root seed (see
+`supply_chain_env.envs.streams`) and NumPy's global generator, which simple agents
+draw from, is seeded with the agents' stream of the game. So a game is the same in
+every process and for the scalar and the batched runner.
+
+Usage::
+
+    python -m supply_chain_env.tournament --agents bot:create_agents --n_seeds 1000
+"""
+import importlib
+import math
+import os
+import uuid
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from supply_chain_env.envs.env import SupplyChainBotTournament
+from supply_chain_env.envs.rendering import STDOUT, make_renderer
+from supply_chain_env.envs.vector_env import VectorSupplyChainBotTournament
+from supply_chain_env.envs.scenario_bank import open_bank
+from supply_chain_env.envs.streams import seed_agents
+
+# the oracle, the result cache, the results store, the trajectory recorder and the
+# process pool are imported where used, so that importing this module for `run_game`
+# stays fast
+
+ENV_TYPES = ("classical", "uniform_0_2", "normal_10_4")
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+AGENT_NAMES = ("retailer", "wholesaler", "distributor", "manufacturer")
+
+
+def run_game(
+    agents: list,
+    environment: str = "classical",
+    verbose: bool = False,
+    seed: Optional[int] = None,
+    flat_observations: bool = False,
+    scenario_bank=None,
+    scenario_id: Optional[int] = None,
+    instrumentation=None,
+    recorder=None,
+    cache=None,
+    renderer=None,
+):
+    """
+    Play one game and return the last state.
+
+    With `flat_observations` the agents get lazy read-only dict-like views of the
+    env's flat observations instead of freshly built dicts, and the last state is
+    returned as a list of dicts. With a `scenario_bank` and `scenario_id` the game
+    starts from that precomputed scenario. An `instrumentation` (see
+    `supply_chain_env.instrumentation`) records the phases of the env steps and the
+    latency of every agent's `get_action`. A `recorder` (see
+    `supply_chain_env.trajectories`) records every turn of the game.
+
+    A `renderer` or render mode (see `supply_chain_env.envs.rendering`) renders the
+    game, `verbose` renders every turn like ``renderer="turns"``. The text of a
+    renderer created from a mode is written when the game is over, renderers passed
+    in are left to their buffering.
+
+    With a `cache` (a `supply_chain_env.result_cache.ResultCache` or its directory)
+    and a `seed`, the last state of a game played before by agents of the same source
+    is returned without playing, and only its total cost is rendered. Games with flat
+    observations, an instrumentation or a recorder are always played.
+    """
+    key = None
+    if cache is not None and seed is not None and not flat_observations:
+        if instrumentation is None and recorder is None:
+            from supply_chain_env.result_cache import agents_fingerprint, open_cache
+
+            cache = open_cache(cache)
+            fingerprint = agents_fingerprint(agents)
+            if fingerprint is not None:
+                key = cache.key(
+                    "last_state",
+                    fingerprint,
+                    environment,
+                    seed,
+                    open_bank(scenario_bank),
+                    scenario_id,
+                )
+                last_state = cache.get(key)
+                if last_state is not None:
+                    renderer = make_renderer(renderer)
+                    if renderer is not None or verbose:
+                        writer = STDOUT if renderer is None else renderer.writer
+                        total = sum(state["cum_cost"] for state in last_state)
+                        writer.write(f"\nTotal cost is: EUR {total} (cached)\n")
+                        writer.flush()
+                    return last_state
+    owns_renderer = renderer is None or isinstance(renderer, str)
+    if renderer is None and verbose:
+        renderer = "turns"
+    env = SupplyChainBotTournament(
+        env_type=environment,
+        seed=seed,
+        verbose=False,
+        flat_observations=flat_observations,
+        scenario_bank=scenario_bank,
+        instrumentation=instrumentation,
+        renderer=renderer,
+    )
+    if instrumentation is not None:
+        instrumentation.count("games")
+        agent_timings = [f"agent.{name}.get_action" for name in AGENT_NAMES]
+    state = env.reset(scenario_id=scenario_id)
+    if recorder is not None:
+        recorder.begin_game(env, seed=seed, scenario_id=scenario_id)
+    if flat_observations:
+        state = env.observation_views
+    while not env.done:
+        if instrumentation is None:
+            actions = [a.get_action(state[i]) for i, a in enumerate(agents)]
+        else:
+            actions = _timed_actions(agents, state, instrumentation, agent_timings)
+        state, rewards, done, _ = env.step(actions)
+        if recorder is not None:
+            recorder.record(env, actions)
+        if flat_observations:
+            state = env.observation_views
+    if owns_renderer:
+        env.close()
+    if flat_observations:
+        return [dict(view) for view in state]
+    if key is not None:
+        cache.put(key, state)
+    return state
+
+
+def _timed_actions(agents, state, instrumentation, names):
+    actions = []
+    for i, agent in enumerate(agents):
+        start = perf_counter()
+        actions.append(agent.get_action(state[i]))
+        instrumentation.add(names[i], perf_counter() - start)
+    return actions
+
+
+def has_batch_protocol(agent) -> bool:
+    """
+    Whether the agent implements ``get_actions(states) -> np.ndarray``, which gets
+    the states of a batch of games as a dict like the one of `get_action` but with
+    arrays holding a row per game, and returns an action per game.
+    """
+    return callable(getattr(agent, "get_actions", None))
+
+
+def batch_states(observations: dict, order_lead_times) -> list:
+    """
+    Split observations of `VectorSupplyChainBotTournament` into a batch state for
+    every agent.
+    :rtype: list of dicts, same keys as the states of `get_action`
+    """
+    return [
+        {
+            "current_stock": observations["current_stock"][:, i],
+            "turn": observations["turn"],
+            "cum_cost": observations["cum_cost"][:, i],
+            "inbound_shipments": observations["inbound_shipments"][:, i],
+            "orders": observations["orders"][:, i, :lead],
+            "next_incoming_order": observations["next_incoming_order"][:, i],
+        }
+        for i, lead in enumerate(order_lead_times)
+    ]
+
+
+def _game_state(states: list, k: int) -> list:
+    # the per-agent states of `get_action` of the k-th game of a batch
+    return [
+        {
+            "current_stock": int(state["current_stock"][k]),
+            "turn": state["turn"],
+            "cum_cost": float(state["cum_cost"][k]),
+            "inbound_shipments": state["inbound_shipments"][k].tolist(),
+            "orders": state["orders"][k].tolist(),
+            "next_incoming_order": int(state["next_incoming_order"][k]),
+        }
+        for state in states
+    ]
+
+
+def run_games_batched(
+    create_agents: Callable,
+    env_type: str,
+    seeds: list,
+    scenario_bank=None,
+    scenarios: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Play the games of all seeds at once in a `VectorSupplyChainBotTournament`.
+
+    Agents implementing the batch protocol (see `has_batch_protocol`) are created once
+    and get the states of all games in one call per turn. The other agents are
+    created once per game and called with the state of their game. The games start
+    from the same states as the ones of `run_game` with the same seeds, or from the
+    `scenarios` records if given, one per seed.
+    :rtype: np.array of shape (len(seeds), n_agents), cumulative cost of each agent
+    """
+    vec = VectorSupplyChainBotTournament(
+        env_type=env_type, n_envs=len(seeds), scenario_bank=scenario_bank
+    )
+    if scenarios is not None:
+        vec.reset(scenarios=scenarios)
+    elif vec.scenario_bank is not None:
+        vec.reset(scenario_id=seeds)
+    else:
+        env = SupplyChainBotTournament(env_type=env_type, verbose=False)
+        for k, seed in enumerate(seeds):
+            env.seed(seed)
+            env.reset()
+            vec.set_game(k, env)
+    # the agents of all games draw from one generator, seeded like the first game's
+    seed_agents(seeds[0])
+    agents = create_agents()
+    batched = [has_batch_protocol(agent) for agent in agents]
+    game_agents = None
+    if not all(batched):
+        game_agents = [agents] + [create_agents() for _ in seeds[1:]]
+
+    actions = np.zeros((len(seeds), vec.n_agents), dtype=np.int64)
+    observations = vec.get_observations()
+    while not vec.done:
+        states = batch_states(observations, vec.order_lead_times)
+        for i, agent in enumerate(agents):
+            if batched[i]:
+                actions[:, i] = agent.get_actions(states[i])
+        if game_agents is not None:
+            for k, agents_k in enumerate(game_agents):
+                state = _game_state(states, k)
+                for i, agent in enumerate(agents_k):
+                    if not batched[i]:
+                        actions[k, i] = agent.get_action(state[i])
+        observations, rewards, dones, _ = vec.step(actions)
+    return vec.cum_holding_cost + vec.cum_stockout_cost
+
+
+def _play_games(
+    create_agents: Callable,
+    env_type: str,
+    seeds: list,
+    scenario_bank=None,
+    record_dir=None,
+    cache_dir=None,
+    sandbox_timeout: Optional[float] = None,
+    compress_records: bool = False,
+) -> np.ndarray:
+    """
+    Play one game per seed with fresh agents, seeds are scenario ids of the
+    `scenario_bank` if given. With a `record_dir` the games are recorded to it as
+    a part of its own with a unique name, compressed with `compress_records`. With a
+    `cache_dir` (see `supply_chain_env.result_cache`) only the games that are not
+    cached are played, unless the games are recorded. With a `sandbox_timeout` the
+    agents run in worker processes with this time budget per turn (see
+    `supply_chain_env.sandbox`), the games are then neither recorded nor cached.
+
+    If any agent implements the batch protocol, all games are played at once with
+    `run_games_batched`, unless they are recorded.
+    :rtype: np.array of shape (len(seeds), n_agents), cumulative cost of each agent
+    """
+    scenario_bank = open_bank(scenario_bank)
+    if sandbox_timeout is not None and seeds:
+        from supply_chain_env.sandbox import AgentSandbox, run_sandboxed_game
+
+        costs = []
+        with AgentSandbox(create_agents, timeout=sandbox_timeout) as sandbox:
+            for seed in seeds:
+                seed_agents(seed)
+                last_state = run_sandboxed_game(
+                    sandbox,
+                    env_type,
+                    seed=seed,
+                    scenario_bank=scenario_bank,
+                    scenario_id=None if scenario_bank is None else seed,
+                )
+                costs.append([agent_state["cum_cost"] for agent_state in last_state])
+        return np.array(costs, dtype=np.float64)
+    cache = fingerprint = None
+    if cache_dir is not None and record_dir is None and seeds:
+        from supply_chain_env.result_cache import agents_fingerprint, open_cache
+
+        cache = open_cache(cache_dir)
+        fingerprint = agents_fingerprint(create_agents(), create_agents)
+    if fingerprint is not None:
+        keys = [
+            cache.key(
+                "costs",
+                fingerprint,
+                env_type,
+                seed,
+                scenario_bank,
+                None if scenario_bank is None else seed,
+            )
+            for seed in seeds
+        ]
+        costs = [cache.get(key) for key in keys]
+        missing = [k for k, cost in enumerate(costs) if cost is None]
+        if missing:
+            played = _play_games(
+                create_agents, env_type, [seeds[k] for k in missing], scenario_bank
+            )
+            for k, game_costs in zip(missing, played.tolist()):
+                costs[k] = game_costs
+                cache.put(keys[k], game_costs)
+        return np.array(costs, dtype=np.float64)
+    if record_dir is None and seeds:
+        if any(has_batch_protocol(agent) for agent in create_agents()):
+            return run_games_batched(create_agents, env_type, seeds, scenario_bank)
+    recorder = None
+    if record_dir is not None and seeds:
+        from supply_chain_env.trajectories import TrajectoryRecorder
+
+        # unique, so that runs can record to the same directory
+        part = f"{env_type}-{seeds[0]:08d}-{uuid.uuid4().hex[:12]}"
+        recorder = TrajectoryRecorder(record_dir, part=part, compress=compress_records)
+    costs = []
+    for seed in seeds:
+        # agents like the dummy ones of bot.py draw from the global generator
+        seed_agents(seed)
+        last_state = run_game(
+            create_agents(),
+            environment=env_type,
+            seed=seed,
+            scenario_bank=scenario_bank,
+            scenario_id=None if scenario_bank is None else seed,
+            recorder=recorder,
+        )
+        costs.append([agent_state["cum_cost"] for agent_state in last_state])
+    if recorder is not None:
+        recorder.close()
+    return np.array(costs, dtype=np.float64)
+
+
+def summarize_costs(costs: np.ndarray, quantiles: Iterable[float] = QUANTILES) -> dict:
+    """
+    Summarize per-agent costs of many games.
+    :type costs: np.array of shape (n_games, n_agents)
+    """
+    total = costs.sum(axis=1)
+    return {
+        "n_games": len(total),
+        "mean": float(total.mean()),
+        "std": float(total.std()),
+        "quantiles": {q: float(np.quantile(total, q)) for q in quantiles},
+        "agent_mean": dict(zip(AGENT_NAMES, costs.mean(axis=0).tolist())),
+        "agent_std": dict(zip(AGENT_NAMES, costs.std(axis=0).tolist())),
+        "total_costs": total,
+    }
+
+
+def run_tournament(
+    create_agents: Callable,
+    seeds: Iterable[int] = range(100),
+    env_types: Iterable[str] = ENV_TYPES,
+    n_workers: Optional[int] = None,
+    quantiles: Iterable[float] = QUANTILES,
+    scenario_banks: Optional[dict] = None,
+    record_dir=None,
+    oracle: bool = False,
+    cache_dir=None,
+    sandbox_timeout: Optional[float] = None,
+    results_path=None,
+    bot: Optional[str] = None,
+    checkpoint_every: int = 100,
+    compress_records: bool = False,
+) -> dict:
+    """
+    Evaluate agents on every (env type, seed) scenario.
+
+    `create_agents` is called once per game and has to be picklable (i.e. defined at
+    module level) when `n_workers` is not 1. Games are sent to the workers in chunks
+    to keep the inter-process overhead small compared to the simulation.
+
+    `scenario_banks` maps env types to scenario banks (or their paths). For these env
+    types the seeds are scenario ids and the workers read the scenarios from the
+    shared memory-mapped bank files.
+
+    With a `record_dir` every game is recorded there, in compressed chunks with
+    `compress_records`, see `supply_chain_env.trajectories.TrajectoryReader` to read
+    them. The games of every run are added to the recording in the directory.
+
+    With `oracle` the minimum cost of every game is computed too (see
+    `supply_chain_env.oracle`) and the summaries get the mean ``lower_bound`` and
+    ``optimality_gap`` and the ``optimality_gaps`` of all games.
+
+    With a `cache_dir` the costs of the games are cached there (see
+    `supply_chain_env.result_cache`) and only games of changed agents or a changed
+    `supply_chain_env` are played.
+
+    With a `sandbox_timeout` every agent runs in a worker process of its own and
+    places a default order when it takes longer than this many seconds for a turn,
+    see `supply_chain_env.sandbox`.
+
+    With a `results_path` the evaluation can be resumed: the results of the games
+    are appended to this file (see `supply_chain_env.results_store`) under the name
+    `bot` (by default the factory's ``module:qualname``) in chunks of at most
+    `checkpoint_every` games, and only the games missing from it are played. Chunks
+    are stored as they finish, so a crashed or preempted run loses only the chunks
+    in progress.
+
+    :return: dict mapping env type to the summary of `summarize_costs`
+    """
+    seeds = list(seeds)
+    env_types = list(env_types)
+    scenario_banks = scenario_banks or {}
+    n_workers = n_workers or os.cpu_count()
+    store = None
+    if results_path is not None:
+        from supply_chain_env.results_store import bot_name, open_store, scenario_key
+
+        store = open_store(results_path)
+        bot = bot_name(create_agents) if bot is None else bot
+    kinds = ["costs"]
+    if oracle:
+        from supply_chain_env.oracle import lower_bounds
+
+        kinds.append("lower_bound")
+
+    chunk_size = max(len(seeds), 1)
+    if n_workers > 1:
+        chunk_size = max(1, math.ceil(len(seeds) * len(env_types) / (4 * n_workers)))
+    if store is not None:
+        chunk_size = min(chunk_size, checkpoint_every)
+    # results of every (kind, env type) by seed, the ones of the store are not played
+    results = {}
+    tasks = []
+    for env_type in env_types:
+        bank = scenario_banks.get(env_type)
+        for kind in kinds:
+            # lower bounds don't depend on the bot
+            owner = bot if kind == "costs" else None
+            missing = seeds
+            if store is not None:
+                missing = store.missing(kind, owner, env_type, seeds, bank)
+                results[kind, env_type] = {
+                    seed: store.get(kind, owner, env_type, scenario_key(seed, bank))
+                    for seed in set(seeds) - set(missing)
+                }
+            else:
+                results[kind, env_type] = {}
+            for i in range(0, len(missing), chunk_size):
+                chunk = missing[i : i + chunk_size]
+                if kind == "costs":
+                    args = (_play_games, create_agents, env_type, chunk, bank)
+                    args += (record_dir, cache_dir, sandbox_timeout, compress_records)
+                else:
+                    args = (lower_bounds, env_type, chunk, bank)
+                tasks.append(((kind, env_type, owner, chunk, bank), args))
+
+    def collect(task, result):
+        kind, env_type, owner, chunk, bank = task
+        values = result.tolist()
+        if store is not None:
+            store.add(kind, owner, env_type, chunk, values, bank)
+        results[kind, env_type].update(zip(chunk, values))
+
+    if n_workers == 1:
+        for task, (function, *args) in tasks:
+            collect(task, function(*args))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = {pool.submit(*args): task for task, args in tasks}
+            # results are stored as they come in, not in the order of the tasks
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+    costs = {
+        env_type: np.array(
+            [results["costs", env_type][seed] for seed in seeds], dtype=np.float64
+        )
+        for env_type in env_types
+    }
+    bounds = {
+        env_type: np.array(
+            [results["lower_bound", env_type][seed] for seed in seeds],
+            dtype=np.float64,
+        )
+        for env_type in env_types
+        if oracle
+    }
+    summaries = {}
+    for env_type, env_costs in costs.items():
+        summary = summaries[env_type] = summarize_costs(env_costs, quantiles)
+        if env_type in bounds:
+            gaps = summary["total_costs"] - bounds[env_type]
+            summary["lower_bound"] = float(bounds[env_type].mean())
+            summary["optimality_gap"] = float(gaps.mean())
+            summary["optimality_gaps"] = gaps
+    return summaries
+
+
+def load_object(path: str):
+    """Load an object given as ``module:attribute``, e.g. ``bot:create_agents``."""
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def parse_args(argv=None):
+    from supply_chain_env.result_cache import RESULT_CACHE_DIR
+
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", default="bot:create_agents")
+    parser.add_argument("--n_seeds", type=int, default=100)
+    parser.add_argument("--first_seed", type=int, default=0)
+    parser.add_argument("--env_types", nargs="+", default=list(ENV_TYPES))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--scenario_banks",
+        default=None,
+        help="directory with a scenario bank <env_type>.npy per env type, "
+        "seeds are then used as scenario ids",
+    )
+    parser.add_argument(
+        "--record", default=None, help="directory to record the trajectories to"
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="record the trajectories as compressed .npz chunks",
+    )
+    parser.add_argument(
+        "--oracle",
+        action="store_true",
+        help="compute the minimum cost of every game and the bots' optimality gap",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=str(RESULT_CACHE_DIR),
+        default=None,
+        help="reuse the costs of games played before by agents of the same source, "
+        f"cached in this directory (default {RESULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--sandbox",
+        type=float,
+        default=None,
+        metavar="TIMEOUT",
+        help="run every agent in a process of its own with this many seconds per turn",
+    )
+    parser.add_argument(
+        "--results",
+        default=None,
+        help="JSON lines file to append the results of the games to, games already "
+        "in it are not played again, so an interrupted run can be resumed",
+    )
+    parser.add_argument(
+        "--bot", default=None, help="name of the bot in the results (default --agents)"
+    )
+    return parser.parse_args(argv)
+
+
+def main(args):
+    scenario_banks = None
+    if args.scenario_banks:
+        scenario_banks = {
+            env_type: os.path.join(args.scenario_banks, f"{env_type}.npy")
+            for env_type in args.env_types
+        }
+    results = run_tournament(
+        load_object(args.agents),
+        seeds=range(args.first_seed, args.first_seed + args.n_seeds),
+        env_types=args.env_types,
+        n_workers=args.workers,
+        scenario_banks=scenario_banks,
+        record_dir=args.record,
+        compress_records=args.compress,
+        oracle=args.oracle,
+        cache_dir=args.cache,
+        sandbox_timeout=args.sandbox,
+        results_path=args.results,
+        bot=args.bot or args.agents,
+    )
+    for env_type, summary in results.items():
+        print(f"\n{env_type} ({summary['n_games']} games)")
+        print(f"  total cost: {summary['mean']:.1f} +- {summary['std']:.1f}")
+        print(
+            "  quantiles: "
+            + ", ".join(f"{q:.0%}: {v:.1f}" for q, v in summary["quantiles"].items())
+        )
+        print(
+            "  per agent: "
+            + ", ".join(f"{a}: {c:.1f}" for a, c in summary["agent_mean"].items())
+        )
+        if "lower_bound" in summary:
+            print(
+                f"  lower bound: {summary['lower_bound']:.1f}, "
+                f"optimality gap: {summary['optimality_gap']:.1f}"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    main(parse_args())
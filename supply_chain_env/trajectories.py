@@ -0,0 +1,404 @@
+"""Recording of played games to disk, reading and replaying them.
+
+A recording is a directory of chunks. Every chunk holds up to `chunk_size` turns as
+columns, one ``.npy`` file per column (memory-mapped when read) or, with
+``compress=True``, one compressed ``.npz`` file per chunk. The turn columns are:
+
+* ``game``, ``turn``: id of the game in its part and turn number
+* ``stocks``, ``next_incoming_orders``, ``orders``, ``inbound_shipments``,
+  ``cum_cost``: state of every agent before its action, the pipelines are in
+  arrival order with shape ``(n_agents, lead_time)``
+* ``demand``: end customer demand of the turn
+* ``actions``, ``rewards``, ``holding_cost``, ``stockout_cost``: the agents' orders
+  and what they cost them on that turn
+* ``done``: whether the game ended with that turn
+
+The game columns ``game``, ``env_type``, ``seed`` and ``scenario_id`` (-1 if None) of
+the games started in a chunk are stored with it. The recorder only keeps one chunk in
+memory, however many games it records.
+
+Several recorders (e.g. one per worker process) can write to the same directory as
+different parts, each with its own ``<part>.index.json``; a recorder refuses to start
+a part that exists. The reader numbers the games
+of all parts consecutively, in the order of the part names.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from supply_chain_env.envs.env import SupplyChainBotTournament
+from supply_chain_env.envs.scenario_bank import ENV_TYPES, scenario_dtype
+
+CHUNK_SIZE = 65536
+GAME_COLUMNS = ("game", "env_type", "seed", "scenario_id")
+
+
+def _turn_columns(n_agents: int, lead_time: int) -> dict:
+    """
+    Shape of a row and dtype of every turn column.
+    """
+    agents, pipelines = (n_agents,), (n_agents, lead_time)
+    return {
+        "game": ((), np.int64),
+        "turn": ((), np.int32),
+        "stocks": (agents, np.int32),
+        "next_incoming_orders": (agents, np.int32),
+        "orders": (pipelines, np.int32),
+        "inbound_shipments": (pipelines, np.int32),
+        "cum_cost": (agents, np.float64),
+        "demand": ((), np.int32),
+        "actions": (agents, np.int32),
+        "rewards": (agents, np.float64),
+        "holding_cost": (agents, np.float64),
+        "stockout_cost": (agents, np.float64),
+        "done": ((), np.bool_),
+    }
+
+
+class TrajectoryRecorder:
+    """
+    Stream the turns of many games into a recording.
+
+    Call `begin_game` after resetting the env and `record` after every step::
+
+        state = env.reset()
+        recorder.begin_game(env, seed=seed)
+        while not env.done:
+            actions = [a.get_action(state[i]) for i, a in enumerate(agents)]
+            state, rewards, done, _ = env.step(actions)
+            recorder.record(env, actions)
+        recorder.close()
+    """
+
+    def __init__(
+        self,
+        path,
+        part: str = "trajectories",
+        n_agents: int = 4,
+        lead_time: int = 2,
+        chunk_size: int = CHUNK_SIZE,
+        compress: bool = False,
+    ):
+        self.path = Path(path)
+        if (self.path / f"{part}.index.json").exists():
+            raise FileExistsError(f"The recording {self.path} has a part {part!r}")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.part = part
+        self.n_agents = n_agents
+        self.lead_time = lead_time
+        self.chunk_size = chunk_size
+        self.compress = compress
+        # orders and inbound shipments of a turn are written at once by the env
+        self._pipelines = np.zeros((chunk_size, 2, n_agents, lead_time), np.int32)
+        self.columns = {
+            name: np.zeros((chunk_size,) + shape, dtype=dtype)
+            for name, (shape, dtype) in _turn_columns(n_agents, lead_time).items()
+            if name not in ("orders", "inbound_shipments")
+        }
+        self._games = {name: [] for name in GAME_COLUMNS}
+        self._chunks = []
+        self._row = 0
+        self._n_games = 0
+        self._game = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def begin_game(self, env, seed=None, scenario_id=None) -> int:
+        """
+        Start recording the game `env` was just reset to.
+        :return: id of the game in this part
+        """
+        if (env.n_agents, env.lead_time) != (self.n_agents, self.lead_time):
+            raise ValueError("The env doesn't fit the recording's agents and lead time")
+        if self._row == self.chunk_size:
+            self.flush()
+        self._game = self._n_games
+        self._n_games += 1
+        for name, value in zip(
+            GAME_COLUMNS,
+            (
+                self._game,
+                ENV_TYPES.index(env.env_type),
+                -1 if seed is None else seed,
+                -1 if scenario_id is None else scenario_id,
+            ),
+        ):
+            self._games[name].append(value)
+        self._record_state(env)
+        return self._game
+
+    def _record_state(self, env):
+        row, columns = self._row, self.columns
+        columns["game"][row] = self._game
+        columns["turn"][row] = env.turn
+        columns["stocks"][row] = env.stocks
+        columns["next_incoming_orders"][row] = env.next_incoming_orders
+        env.get_pipelines(out=self._pipelines[row])
+        cum_cost = columns["cum_cost"][row]
+        np.add(env.cum_holding_cost, env.cum_stockout_cost, out=cum_cost)
+        columns["demand"][row] = env.demand
+
+    def record(self, env, actions):
+        """
+        Record the `actions` taken in the last step of `env` and their outcome.
+        """
+        if self._game is None:
+            raise ValueError("No game to record, call begin_game first")
+        row, columns = self._row, self.columns
+        columns["actions"][row] = actions
+        np.copyto(columns["holding_cost"][row], env.holding_cost)
+        np.copyto(columns["stockout_cost"][row], env.stockout_cost)
+        np.add(env.holding_cost, env.stockout_cost, out=columns["rewards"][row])
+        np.negative(columns["rewards"][row], out=columns["rewards"][row])
+        columns["done"][row] = env.done
+        self._row += 1
+        if env.done:
+            self._game = None
+            return
+        if self._row == self.chunk_size:
+            self.flush()
+        self._record_state(env)
+
+    def flush(self):
+        """
+        Write the buffered turns as a new chunk.
+        """
+        n_rows = self._row
+        if not n_rows and not self._games["game"]:
+            return
+        name = f"{self.part}-{len(self._chunks):05d}"
+        columns = {
+            column: values[:n_rows] for column, values in self.columns.items()
+        }
+        columns["orders"] = self._pipelines[:n_rows, 0]
+        columns["inbound_shipments"] = self._pipelines[:n_rows, 1]
+        games = {
+            column: np.array(values, dtype=np.int64)
+            for column, values in self._games.items()
+        }
+        columns.update({f"games.{column}": v for column, v in games.items()})
+        tmp = self.path / f".{name}.tmp"
+        if self.compress:
+            with open(tmp, "wb") as f:
+                np.savez_compressed(f, **columns)
+            os.replace(tmp, self.path / f"{name}.npz")
+        else:
+            tmp.mkdir()
+            for column, values in columns.items():
+                np.save(tmp / f"{column}.npy", values)
+            os.replace(tmp, self.path / name)
+        game_ids = self.columns["game"][:n_rows]
+        self._chunks.append(
+            {
+                "name": name,
+                "compressed": self.compress,
+                "n_rows": n_rows,
+                "n_games": len(games["game"]),
+                "first_game": int(game_ids[0]) if n_rows else -1,
+                "last_game": int(game_ids[-1]) if n_rows else -1,
+            }
+        )
+        self._row = 0
+        self._games = {name: [] for name in GAME_COLUMNS}
+        self._write_index()
+
+    def _write_index(self):
+        index = {
+            "n_agents": self.n_agents,
+            "lead_time": self.lead_time,
+            "env_types": list(ENV_TYPES),
+            "n_games": self._n_games,
+            "chunks": self._chunks,
+        }
+        path = self.path / f"{self.part}.index.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index, indent=2))
+        os.replace(tmp, path)
+
+    def close(self):
+        self.flush()
+        self._write_index()
+
+
+class _Chunk:
+    """
+    Lazily loaded columns of one chunk.
+    """
+
+    def __init__(self, path: Path, info: dict, game_offset: int):
+        self.info = info
+        self.game_offset = game_offset
+        if info["compressed"]:
+            self._npz = np.load(path / f"{info['name']}.npz")
+        else:
+            self._npz = None
+            self._directory = path / info["name"]
+        self._columns = {}
+
+    def __getitem__(self, column):
+        values = self._columns.get(column)
+        if values is None:
+            if self._npz is not None:
+                values = self._npz[column]
+            else:
+                values = np.load(self._directory / f"{column}.npy", mmap_mode="r")
+            self._columns[column] = values
+        return values
+
+    def rows(self, game_id: int) -> slice:
+        """
+        Rows of a game, by its global id, the game column is sorted.
+        """
+        games = self["game"]
+        local = game_id - self.game_offset
+        return slice(
+            int(np.searchsorted(games, local, side="left")),
+            int(np.searchsorted(games, local, side="right")),
+        )
+
+
+class TrajectoryReader:
+    """
+    Read the turns of a recording, with memory-mapped columns for uncompressed chunks.
+
+    Games are numbered consecutively across the parts of the recording.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        index_paths = sorted(self.path.glob("*.index.json"))
+        if not index_paths:
+            raise FileNotFoundError(f"No recording found in {self.path}")
+        self.chunks = []
+        games = {name: [] for name in GAME_COLUMNS}
+        n_games = 0
+        for index_path in index_paths:
+            index = json.loads(index_path.read_text())
+            self.n_agents = index["n_agents"]
+            self.lead_time = index["lead_time"]
+            self.env_types = index["env_types"]
+            for info in index["chunks"]:
+                chunk = _Chunk(self.path, info, n_games)
+                self.chunks.append(chunk)
+                for name in GAME_COLUMNS:
+                    games[name].append(chunk[f"games.{name}"])
+                games["game"][-1] = games["game"][-1] + n_games
+            n_games += index["n_games"]
+        self.games = {
+            name: np.concatenate(values) if values else np.zeros(0, np.int64)
+            for name, values in games.items()
+        }
+
+    def __len__(self):
+        return len(self.games["game"])
+
+    def select(self, env_type=None, seeds=None, scenario_ids=None) -> np.ndarray:
+        """
+        Ids of the games matching all given filters.
+        :type env_type: str or None
+        :type seeds: iterable of int or None
+        :type scenario_ids: iterable of int or None
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if env_type is not None:
+            mask &= self.games["env_type"] == self.env_types.index(env_type)
+        if seeds is not None:
+            mask &= np.isin(self.games["seed"], list(seeds))
+        if scenario_ids is not None:
+            mask &= np.isin(self.games["scenario_id"], list(scenario_ids))
+        return np.flatnonzero(mask)
+
+    def iter_chunks(self, columns, games=None):
+        """
+        Stream columns chunk by chunk, e.g. to compute statistics over a recording
+        that doesn't fit into memory.
+        :param games: ids of the games to keep the rows of, all if None
+        :return: iterator of dicts mapping column name to values
+        """
+        games = None if games is None else np.asarray(games)
+        for chunk in self.chunks:
+            if not chunk.info["n_rows"]:
+                continue
+            game_ids = chunk["game"] + chunk.game_offset
+            if games is None:
+                yield {column: chunk[column] for column in columns}
+                continue
+            mask = np.isin(game_ids, games)
+            if mask.any():
+                yield {column: chunk[column][mask] for column in columns}
+
+    def column(self, name: str, games=None) -> np.ndarray:
+        """
+        Values of one turn column of all or the given games.
+        """
+        parts = [values[name] for values in self.iter_chunks([name], games)]
+        if not parts:
+            shape, dtype = _turn_columns(self.n_agents, self.lead_time)[name]
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.concatenate(parts)
+
+    def game(self, game_id: int) -> dict:
+        """
+        All turn columns of one game, it may span several chunks.
+        :rtype: dict mapping column name to np.array with one row per turn
+        """
+        columns = {}
+        for chunk in self.chunks:
+            info = chunk.info
+            local = game_id - chunk.game_offset
+            if not info["n_rows"] or not (
+                info["first_game"] <= local <= info["last_game"]
+            ):
+                continue
+            rows = chunk.rows(game_id)
+            for name in _turn_columns(self.n_agents, self.lead_time):
+                columns.setdefault(name, []).append(chunk[name][rows])
+        if not columns:
+            raise KeyError(f"Game {game_id} has no recorded turns")
+        return {name: np.concatenate(values) for name, values in columns.items()}
+
+    def final_costs(self, games=None) -> np.ndarray:
+        """
+        Cumulative cost of every agent at the end of each finished game.
+        :rtype: np.array of shape (n_games, n_agents)
+        """
+        costs = []
+        columns = ["done", "cum_cost", "holding_cost", "stockout_cost"]
+        for values in self.iter_chunks(columns, games):
+            done = values["done"]
+            costs.append(
+                values["cum_cost"][done]
+                + values["holding_cost"][done]
+                + values["stockout_cost"][done]
+            )
+        if not costs:
+            return np.zeros((0, self.n_agents))
+        return np.concatenate(costs)
+
+    def replay(self, game_id: int, env=None):
+        """
+        Play the recorded actions of a game again, from its recorded initial state.
+        :param env: env to replay in, a new quiet one of the game's env type if None
+        :return: iterator of the results of `env.step`
+        """
+        turns = self.game(game_id)
+        env_type = self.env_types[self.games["env_type"][game_id]]
+        if env is None:
+            env = SupplyChainBotTournament(env_type=env_type, verbose=False)
+        if env.env_type != env_type or len(turns["turn"]) != env.n_turns:
+            raise ValueError(f"Game {game_id} doesn't fit the env")
+        scenario = np.zeros(
+            (), dtype=scenario_dtype(self.n_agents, self.lead_time, env.n_turns)
+        )
+        for name in ("orders", "inbound_shipments", "next_incoming_orders", "stocks"):
+            scenario[name] = turns[name][0]
+        scenario["demand"] = turns["demand"]
+        env.reset(scenario=scenario)
+        for actions in turns["actions"].tolist():
+            yield env.step(actions)
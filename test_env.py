@@ -0,0 +1,419 @@
+import io
+import pickle
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from supply_chain_env.envs import (
+    SupplyChainBotTournament,
+    VectorSupplyChainBotTournament,
+)
+from supply_chain_env.envs.env import DEMAND_BLOCK_SIZE
+from supply_chain_env.envs.rendering import (
+    STDOUT,
+    BufferedWriter,
+    LiveRenderer,
+    TurnRenderer,
+)
+from supply_chain_env.envs.scenario_bank import BLOCK_SIZE, ScenarioBank
+from supply_chain_env.envs.streams import AGENTS, SCENARIO, agents_seed, game_sequence
+from supply_chain_env.instrumentation import Instrumentation
+
+ENV_TYPES = ["classical", "uniform_0_2", "normal_10_4"]
+N_GAMES = 5
+
+
+@pytest.mark.parametrize("env_type", ENV_TYPES)
+def test_vector_env_matches_scalar_env(env_type):
+    envs = [SupplyChainBotTournament(env_type=env_type, seed=k) for k in range(N_GAMES)]
+    for env in envs:
+        env.reset()
+    vec = VectorSupplyChainBotTournament.from_envs(envs)
+    rng = np.random.RandomState(0)
+
+    while not vec.done:
+        actions = rng.randint(0, 15, size=(N_GAMES, 4))
+        vec_state, vec_rewards, dones, _ = vec.step(actions)
+        for k, env in enumerate(envs):
+            state, rewards, done, _ = env.step(actions[k].tolist())
+            assert done == dones[k]
+            np.testing.assert_array_equal(rewards, vec_rewards[k])
+            for i, agent_state in enumerate(state):
+                assert agent_state["current_stock"] == vec_state["current_stock"][k, i]
+                assert agent_state["cum_cost"] == vec_state["cum_cost"][k, i]
+                assert (
+                    agent_state["next_incoming_order"]
+                    == vec_state["next_incoming_order"][k, i]
+                )
+                assert agent_state["inbound_shipments"] == list(
+                    vec_state["inbound_shipments"][k, i]
+                )
+                n_orders = len(agent_state["orders"])
+                vec_orders = vec_state["orders"][k, i, :n_orders]
+                assert agent_state["orders"] == list(vec_orders)
+    assert all(env.done for env in envs)
+
+
+@pytest.mark.parametrize("env_type", ENV_TYPES)
+def test_vector_env_reset(env_type):
+    vec = VectorSupplyChainBotTournament(env_type=env_type, n_envs=N_GAMES, seed=0)
+    state = vec.reset()
+
+    assert state["current_stock"].shape == (N_GAMES, 4)
+    assert state["orders"].shape == (N_GAMES, 4, 2)
+    assert (state["orders"][:, -1, 1] == 0).all()
+    assert (vec.end_customer_demand >= 0).all()
+
+    n_steps = 0
+    while not vec.done:
+        vec.step(np.zeros((N_GAMES, 4), dtype=int))
+        n_steps += 1
+    assert n_steps == vec.n_turns
+
+    # the random batches of a seed are drawn at once, in the same order
+    demand = vec.end_customer_demand.copy()
+    stocks = [vec.reset()["current_stock"] for _ in range(2)]
+    vec.seed(0)
+    vec.reset()
+    np.testing.assert_array_equal(vec.end_customer_demand, demand)
+    for batch_stocks in stocks:
+        np.testing.assert_array_equal(vec.reset()["current_stock"], batch_stocks)
+
+
+def test_env_continues_identically_after_save_and_load():
+    env = SupplyChainBotTournament(env_type="classical", seed=0, verbose=False)
+    env.reset()
+    for _ in range(5):
+        env.step([3, 5, 7, 9])
+    loaded = SupplyChainBotTournament(env_type="classical")
+    loaded._load(env._save())
+
+    while not env.done:
+        state, rewards, _, _ = env.step([4, 4, 4, 4])
+        loaded_state, loaded_rewards, _, _ = loaded.step([4, 4, 4, 4])
+        assert state == loaded_state
+        np.testing.assert_array_equal(rewards, loaded_rewards)
+    assert loaded.done
+
+
+@pytest.mark.parametrize("env_type", ENV_TYPES)
+def test_flat_observations_match_dict_observations(env_type):
+    env = SupplyChainBotTournament(env_type=env_type, seed=0, verbose=False)
+    flat_env = SupplyChainBotTournament(
+        env_type=env_type, seed=0, verbose=False, flat_observations=True
+    )
+    state = env.reset()
+    flat_state = flat_env.reset()
+    views = flat_env.observation_views
+
+    while True:
+        assert not flat_state.flags.writeable
+        for agent_state, view in zip(state, views):
+            assert dict(view).keys() == agent_state.keys()
+            for key, value in agent_state.items():
+                assert np.array_equal(view[key], value)
+        if env.done:
+            break
+        state, _, _, _ = env.step([5, 6, 7, 8])
+        flat_state_after_step, _, _, _ = flat_env.step([5, 6, 7, 8])
+        assert flat_state_after_step is flat_state
+
+
+def _play(env, actions):
+    rewards = []
+    while not env.done:
+        _, reward, _, _ = env.step(actions)
+        rewards.append(reward)
+    return np.array(rewards), env.snapshot()
+
+
+def test_snapshot_restore_and_clone_replay_the_same_rollout():
+    env = SupplyChainBotTournament(env_type="uniform_0_2", seed=0, verbose=False)
+    env.reset()
+    env.step([1, 2, 3, 4])
+    snapshot = env.snapshot()
+    clones = [env.clone() for _ in range(3)]
+
+    rewards, final = _play(env, [2, 2, 2, 2])
+    for clone in clones:
+        clone_rewards, clone_final = _play(clone, [2, 2, 2, 2])
+        np.testing.assert_array_equal(rewards, clone_rewards)
+        assert clone_final.tobytes() == final.tobytes()
+
+    env.restore(snapshot)
+    assert env.turn == 1 and not env.done
+    restored_rewards, _ = _play(env, [2, 2, 2, 2])
+    np.testing.assert_array_equal(rewards, restored_rewards)
+
+    env.reset()
+    with pytest.raises(ValueError):
+        env.restore(snapshot)
+
+
+def test_clone_is_neither_rendered_nor_instrumented():
+    stream = io.StringIO()
+    instrumentation = Instrumentation()
+    env = SupplyChainBotTournament(
+        env_type="classical",
+        seed=0,
+        renderer=TurnRenderer(BufferedWriter(stream)),
+        instrumentation=instrumentation,
+    )
+    env.reset()
+    env.renderer.flush()
+    text, counters = stream.getvalue(), dict(instrumentation.counters)
+
+    clone = env.clone()
+    _play(clone, [2, 2, 2, 2])
+    clone.reset()
+    env.renderer.flush()
+    assert stream.getvalue() == text
+    assert instrumentation.counters == counters
+    assert env.renderer is not None and env.instrumentation is instrumentation
+
+
+def test_scenarios_do_not_depend_on_the_size_of_the_bank(tmp_path):
+    large = ScenarioBank.create(tmp_path / "large.npy", "classical", BLOCK_SIZE + 5)
+    small = ScenarioBank.create(tmp_path / "small.npy", "classical", BLOCK_SIZE + 2)
+    assert small.scenarios.tobytes() == large.scenarios[: BLOCK_SIZE + 2].tobytes()
+
+
+@pytest.mark.parametrize("env_type", ENV_TYPES)
+def test_scalar_and_vector_env_reset_from_scenario_bank(tmp_path, env_type):
+    bank = ScenarioBank.create(tmp_path / f"{env_type}.npy", env_type, n_scenarios=10)
+    again = ScenarioBank.create(tmp_path / "again.npy", env_type, n_scenarios=3)
+    assert again.scenarios.tobytes() == bank.scenarios[:3].tobytes()
+    bank = pickle.loads(pickle.dumps(bank))
+
+    scenario_ids = [7, 2, 2]
+    vec = VectorSupplyChainBotTournament(env_type, n_envs=3, scenario_bank=bank)
+    vec.reset(scenario_id=scenario_ids)
+    envs = [
+        SupplyChainBotTournament(env_type, verbose=False, scenario_bank=bank.path)
+        for _ in scenario_ids
+    ]
+    for env, scenario_id in zip(envs, scenario_ids):
+        env.reset(scenario_id=scenario_id)
+
+    while not vec.done:
+        _, vec_rewards, _, _ = vec.step(np.full((3, 4), 5))
+        for k, env in enumerate(envs):
+            _, rewards, _, _ = env.step([5, 5, 5, 5])
+            np.testing.assert_array_equal(rewards, vec_rewards[k])
+    np.testing.assert_array_equal(vec.cum_holding_cost[1], vec.cum_holding_cost[2])
+
+
+def _reference_step(stocks, orders, shipments, actions, demand):
+    """
+    Straightforward queue implementation of a turn of the game.
+    """
+    n_agents = len(stocks)
+    orders_inc = [queue.pop(0) for queue in orders]
+    ship_inc = [queue.pop(0) for queue in shipments]
+    for i in range(n_agents - 1):
+        upstream = stocks[i + 1]
+        shipments[i].append(
+            min(max(upstream, 0) + ship_inc[i + 1], orders_inc[i] + max(-upstream, 0))
+        )
+    shipments[-1].append(orders_inc[-1])
+    for i in range(n_agents):
+        stocks[i] += ship_inc[i] - (orders_inc[i - 1] if i else demand)
+        orders[i].append(actions[i])
+
+
+@pytest.mark.parametrize("flat_observations", [False, True])
+def test_deep_chain_with_lead_times(flat_observations):
+    order_lead_times = [3, 1, 2, 4, 2, 1]
+    shipment_lead_times = [1, 3, 2, 2, 4, 2]
+    env = SupplyChainBotTournament(
+        "normal_10_4",
+        seed=0,
+        verbose=False,
+        flat_observations=flat_observations,
+        n_agents=6,
+        n_turns=50,
+        order_lead_times=order_lead_times,
+        shipment_lead_times=shipment_lead_times,
+    )
+    env.reset()
+    stocks = env.stocks.tolist()
+    orders, shipments = env.get_pipelines().tolist()
+    orders = [x[:lead] for x, lead in zip(orders, order_lead_times)]
+    shipments = [x[:lead] for x, lead in zip(shipments, shipment_lead_times)]
+    rng = np.random.RandomState(0)
+
+    while not env.done:
+        actions = rng.randint(0, 20, size=6).tolist()
+        _reference_step(stocks, orders, shipments, actions, env.demand)
+        states, _, _, _ = env.step(actions)
+        assert env.stocks.tolist() == stocks
+        assert env.orders == orders
+        assert env.inbound_shipments == shipments
+        if flat_observations:
+            states = env.observation_views
+        for i, state in enumerate(states):
+            assert list(state["orders"]) == orders[i]
+            assert list(state["inbound_shipments"]) == shipments[i]
+    assert env.turn == 49
+
+
+def test_long_game_draws_demand_in_blocks():
+    n_turns = 2 * DEMAND_BLOCK_SIZE + 10
+    env = SupplyChainBotTournament(
+        "uniform_0_2", seed=0, verbose=False, n_turns=n_turns
+    )
+    env.reset()
+    actions = [1] * env.n_agents
+    snapshot = env.snapshot()
+    demand = []
+    while not env.done:
+        if env.turn == DEMAND_BLOCK_SIZE:
+            tracemalloc.start()
+        demand.append(env.demand)
+        env.step(actions)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(demand) == n_turns
+    assert len(env.end_customer_demand) == 10
+    # memory doesn't grow with the turns played, only a new demand block is drawn
+    assert peak < 20 * DEMAND_BLOCK_SIZE * 8
+    assert set(demand) == {0, 1, 2}
+
+    # the demand only depends on the game and the turn
+    env.restore(snapshot)
+    replayed = []
+    while not env.done:
+        replayed.append(env.demand)
+        env.step(actions)
+    assert replayed == demand
+
+
+@pytest.mark.parametrize("flat_observations", [False, True])
+def test_history_holds_the_last_flat_observations(flat_observations):
+    env = SupplyChainBotTournament(
+        "normal_10_4",
+        seed=0,
+        verbose=False,
+        flat_observations=flat_observations,
+        history_window=3,
+    )
+    reference = SupplyChainBotTournament(
+        "normal_10_4", seed=0, verbose=False, flat_observations=True
+    )
+    env.reset()
+    frames = [reference.reset().copy()] * 3
+
+    turn = 0
+    while not env.done:
+        history = env.history
+        assert history.shape == (3, *frames[0].shape)
+        np.testing.assert_array_equal(history, frames)
+        np.testing.assert_array_equal(env.agent_history(1), history[:, 1])
+        assert not history.flags.writeable
+        if turn == 4:
+            snapshot, clone = env.snapshot(), env.clone()
+            expected = history.copy()
+        env.step([turn % 5] * 4)
+        observations, _, _, _ = reference.step([turn % 5] * 4)
+        frames = frames[1:] + [observations.copy()]
+        turn += 1
+
+    # the history is part of the state record
+    env.restore(snapshot)
+    np.testing.assert_array_equal(env.history, expected)
+    np.testing.assert_array_equal(clone.history, expected)
+    # the views of a head position are created once, not every turn
+    assert env.history is env.history
+
+
+def test_game_streams_are_spawned_from_the_root_seed():
+    for k, game in enumerate(np.random.SeedSequence(7).spawn(3)):
+        streams = game.spawn(2)
+        for stream in (SCENARIO, AGENTS):
+            np.testing.assert_array_equal(
+                game_sequence(7, k, stream).generate_state(4),
+                streams[stream].generate_state(4),
+            )
+        np.testing.assert_array_equal(
+            agents_seed(7, k, agent=2), streams[AGENTS].spawn(3)[2].generate_state(4)
+        )
+
+
+@pytest.mark.parametrize("env_type", ENV_TYPES)
+def test_games_only_depend_on_root_seed_and_index(env_type):
+    env = SupplyChainBotTournament(env_type=env_type, seed=3, verbose=False)
+    games = []
+    for k in range(N_GAMES):
+        # the global generator doesn't matter
+        np.random.seed(k)
+        env.reset()
+        games.append((env.stocks.copy(), env.get_pipelines(), env.end_customer_demand))
+    assert not all(np.array_equal(games[0][0], game[0]) for game in games[1:])
+
+    other = SupplyChainBotTournament(env_type=env_type, seed=3, verbose=False)
+    other.reset(game=2)
+    np.testing.assert_array_equal(other.get_pipelines(), games[2][1])
+    other.reset()
+    np.testing.assert_array_equal(other.stocks, games[3][0])
+
+    vec = VectorSupplyChainBotTournament(env_type=env_type, n_envs=N_GAMES, seed=3)
+    vec.reset(games=range(N_GAMES))
+    for k, (stocks, (orders, shipments), demand) in enumerate(games):
+        np.testing.assert_array_equal(vec.stocks[k], stocks)
+        np.testing.assert_array_equal(vec.orders[k], orders)
+        np.testing.assert_array_equal(vec.inbound_shipments[k], shipments)
+        np.testing.assert_array_equal(vec.end_customer_demand[k], demand)
+
+
+def test_renderers_sample_games_and_turns(capsys):
+    # the turns of unfinished games other tests left in the buffer
+    STDOUT.flush()
+    capsys.readouterr()
+    env = SupplyChainBotTournament(env_type="classical", seed=0)
+    print("before")
+    env.reset()
+    while not env.done:
+        env.step([4] * env.n_agents)
+    print("after")
+    # the total cost is written when the game ends, in order with prints
+    lines = capsys.readouterr().out.split()
+    assert lines[:5] == ["before", "Total", "cost", "is:", "EUR"]
+    assert lines[-1] == "after"
+
+    stream = io.StringIO()
+    renderer = TurnRenderer(BufferedWriter(stream), every_game=2, every_turn=5)
+    env = SupplyChainBotTournament(env_type="classical", seed=0, renderer=renderer)
+    texts = []
+    for _ in range(4):
+        env.reset()
+        while not env.done:
+            if env.turn % 5 == 0 and renderer.rendering:
+                texts.append(env.render(mode="ansi"))
+            env.step([4] * env.n_agents)
+        # every rendered game is written when it ends
+        n_rendered = (renderer.n_games + 1) // 2
+        assert stream.getvalue().count("Total cost is: EUR") == n_rendered
+    output = stream.getvalue()
+    assert output.count("Total cost is: EUR") == 2
+    assert output.count("Turn #:") == len(texts) == 2 * 4
+    for text in texts:
+        assert text in output
+
+
+def test_live_renderer_caps_the_refresh_rate():
+    stream = io.StringIO()
+    env = SupplyChainBotTournament(
+        env_type="classical", seed=0, renderer=LiveRenderer(stream, max_fps=1e-3)
+    )
+    for _ in range(3):
+        env.reset()
+        while not env.done:
+            env.step([4] * env.n_agents)
+    env.close()
+    frames = stream.getvalue().split("\x1b[J")
+    # the first turn and the end of the last game
+    assert len(frames) == 2
+    assert "game 3, turn 20/20" in frames[-1]
+    assert "games played: 3" in frames[-1]
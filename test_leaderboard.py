@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from supply_chain_env import leaderboard
+from supply_chain_env.leaderboard import (
+    LeaderboardClient,
+    LeaderboardError,
+    post_score_to_api,
+)
+
+
+class LeaderboardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def do_GET(self):
+        self.server.github_requests += 1
+        self._respond(200, {"author": {"login": "octocat"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        score = json.loads(body)["score"]
+        if self.server.failures:
+            self.server.failures -= 1
+            self._respond(503, {})
+        elif self.headers.get("Authorization") is None:
+            self._respond(401, {})
+        elif score in self.server.invalid:
+            self._respond(422, {})
+        else:
+            self.server.scores.append(json.loads(body))
+            if score in self.server.slow:
+                time.sleep(0.5)
+            self._respond(200, {})
+
+    def _respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LeaderboardHandler)
+    server.scores, server.failures, server.github_requests = [], 0, 0
+    server.invalid, server.slow = set(), set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, tmp_path, port=None, **kwargs):
+    url = f"http://127.0.0.1:{port or server.server_port}"
+    return LeaderboardClient(
+        url=f"{url}/add-user-score",
+        github_commit_url=f"{url}/commits/{{ref}}",
+        auth=("user", "password"),
+        backoff=0,
+        queue_path=tmp_path / "queue.jsonl",
+        **kwargs,
+    )
+
+
+def test_submit_many_with_retries(server, tmp_path):
+    server.failures = 2
+    with make_client(server, tmp_path) as client:
+        assert client.get_github_user("abc") == "octocat"
+        assert client.get_github_user("abc") == "octocat"
+        assert client.submit_many([1.0, 2.0, 3.0], user="octocat") == 3
+
+    assert server.github_requests == 1
+    assert server.scores == [{"user": "octocat", "score": s} for s in (1.0, 2.0, 3.0)]
+    assert not (tmp_path / "queue.jsonl").exists()
+
+
+def test_offline_queue(server, tmp_path):
+    with make_client(server, tmp_path, port=closed_port(), retries=1) as client:
+        assert not client.submit(1.0, user="a")
+        assert client.submit_many([2.0], user="b") == 0
+    assert server.scores == []
+
+    with make_client(server, tmp_path) as client:
+        assert client.flush_queue() == 0
+        assert client.submit(3.0, user="c")
+    assert [data["score"] for data in server.scores] == [1.0, 2.0, 3.0]
+
+
+def test_rejected_score_raises(server, tmp_path):
+    with make_client(server, tmp_path) as client:
+        client.auth = None
+        with pytest.raises(LeaderboardError):
+            client.submit(1.0, user="a")
+
+
+def test_rejected_scores_are_not_queued(server, tmp_path):
+    server.invalid = {2.0, 4.0}
+    with make_client(server, tmp_path) as client:
+        client._write_queue([{"user": "a", "score": 1.0}, {"user": "a", "score": 2.0}])
+        # a rejected queued score doesn't block the scores after it
+        assert client.submit_many([3.0], user="b") == 1
+        assert not client.queue_path.exists()
+        with pytest.raises(LeaderboardError):
+            client.submit_many([4.0, 5.0], user="b")
+        assert not client.queue_path.exists()
+        assert client.submit(6.0, user="b")
+
+    assert [data["score"] for data in server.scores] == [1.0, 3.0, 5.0, 6.0]
+    lines = (tmp_path / "queue.rejected.jsonl").read_text().splitlines()
+    assert [json.loads(line)["score"] for line in lines] == [2.0, 4.0]
+
+
+def test_timed_out_score_is_not_posted_again(server, tmp_path):
+    server.slow = {1.0}
+    with make_client(server, tmp_path, timeout=0.1) as client:
+        assert client.submit_many([1.0, 2.0], user="a") == 0
+        assert client.submit(3.0, user="a")
+
+    # the leaderboard stored the score after the client gave up on it
+    assert [data["score"] for data in server.scores] == [1.0, 2.0, 3.0]
+    lines = (tmp_path / "queue.rejected.jsonl").read_text().splitlines()
+    assert [json.loads(line)["score"] for line in lines] == [1.0]
+
+
+def test_ssl_errors_are_raised(server, tmp_path):
+    with make_client(server, tmp_path) as client:
+        client.url = client.url.replace("http://", "https://")
+        with pytest.raises(requests.exceptions.SSLError):
+            client.submit(1.0, user="a")
+    assert not (tmp_path / "queue.jsonl").exists()
+
+
+def test_undelivered_score_fails(server, tmp_path, monkeypatch, capsys):
+    def create_client(port):
+        client = make_client(server, tmp_path, port=port, retries=0)
+        client.get_user = lambda: "a"
+        return client
+
+    monkeypatch.setattr(leaderboard, "LeaderboardClient", lambda: create_client(None))
+    post_score_to_api(1.0)
+    assert "post was successful" in capsys.readouterr().out
+
+    port = closed_port()
+    monkeypatch.setattr(leaderboard, "LeaderboardClient", lambda: create_client(port))
+    with pytest.raises(SystemExit) as exit_info:
+        post_score_to_api(2.0)
+    assert "not reachable" in str(exit_info.value.code)
+    assert [data["score"] for data in server.scores] == [1.0]
+
+
+def closed_port():
+    # a port nobody listens on
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LeaderboardHandler)
+    port = server.server_port
+    server.server_close()
+    return port
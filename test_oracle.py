@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from bot import create_agents
+from supply_chain_env import oracle
+from supply_chain_env.envs import SupplyChainBotTournament
+from supply_chain_env.tournament import ENV_TYPES, run_tournament
+
+
+def _total_cost(env, actions):
+    env = env.clone()
+    while not env.done:
+        env.step(actions)
+    return np.sum(env.cum_holding_cost + env.cum_stockout_cost)
+
+
+@pytest.mark.parametrize("env_type", ENV_TYPES)
+def test_lower_bound(env_type):
+    for seed in range(10):
+        env = SupplyChainBotTournament(env_type, seed=seed, verbose=False)
+        env.reset()
+        solution = oracle.solve(env)
+
+        assert solution["plan"].shape == (env.n_turns, env.n_agents)
+        assert solution["plan_cost"] >= solution["lower_bound"] - 1e-9
+        for amount in range(0, 15, 2):
+            assert _total_cost(env, [amount] * 4) >= solution["lower_bound"] - 1e-9
+
+
+def test_plan_is_optimal():
+    env = SupplyChainBotTournament("normal_10_4", seed=3, verbose=False)
+    env.reset()
+    solution = oracle.solve(env)
+    # playing the plan reaches the bound, so both are the optimum
+    assert solution["plan_cost"] == pytest.approx(solution["lower_bound"])
+    assert solution["plan_cost"] < _total_cost(env, [10] * 4)
+
+
+def test_deep_chain():
+    env = SupplyChainBotTournament(
+        "classical",
+        seed=0,
+        verbose=False,
+        n_agents=6,
+        n_turns=30,
+        order_lead_times=[1, 2, 3, 2, 1, 1],
+        shipment_lead_times=[2, 3, 1, 2, 2, 3],
+    )
+    env.reset()
+    solution = oracle.solve(env)
+    assert solution["plan_cost"] == pytest.approx(solution["lower_bound"])
+    assert _total_cost(env, [4] * 6) >= solution["lower_bound"]
+
+
+def test_needs_fresh_game():
+    env = SupplyChainBotTournament("classical", seed=0, verbose=False)
+    env.reset()
+    env.step([4] * 4)
+    with pytest.raises(ValueError):
+        oracle.solve(env)
+
+
+def test_tournament_optimality_gaps():
+    results = run_tournament(
+        create_agents, seeds=range(4), env_types=["classical"], n_workers=1, oracle=True
+    )
+    summary = results["classical"]
+    bounds = oracle.lower_bounds("classical", range(4))
+    assert summary["lower_bound"] == pytest.approx(bounds.mean())
+    np.testing.assert_allclose(
+        summary["optimality_gaps"], summary["total_costs"] - bounds
+    )
+    assert (summary["optimality_gaps"] >= 0).all()
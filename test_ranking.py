@@ -0,0 +1,92 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+from bot import create_agents
+from supply_chain_env.ranking import _t_quantile, compare, rank_bots
+from test_sweep import create_agents as create_base_stock_agents
+
+
+def test_compare_pairs_on_common_seeds():
+    rng = np.random.default_rng(0)
+    noise = rng.normal(0, 100, size=50)
+    scores = {"a": 1000 + noise, "b": 1010 + noise, "c": 1000 + noise[:20]}
+
+    comparisons = compare(scores, indifference=1.0)
+
+    # the noise is common to all bots, only the differences matter
+    assert comparisons["a", "b"]["outcome"] == "better"
+    assert comparisons["a", "b"]["difference"] == pytest.approx(-10)
+    assert comparisons["a", "c"]["outcome"] == "tie"
+    assert comparisons["a", "c"]["n_seeds"] == 20
+    assert comparisons["b", "c"]["outcome"] == "worse"
+
+
+def test_t_quantiles():
+    # two-sided quantiles from the tables of the Student-t distribution
+    assert _t_quantile(0.95, 1) == pytest.approx(12.7062, abs=1e-4)
+    assert _t_quantile(0.95, 2) == pytest.approx(4.3027, abs=1e-4)
+    assert _t_quantile(0.99, 9) == pytest.approx(3.2498, abs=1e-4)
+    assert _t_quantile(0.95, 30) == pytest.approx(2.0423, abs=1e-4)
+
+
+def test_rank_bots_stops_playing_separated_bots():
+    bots = {
+        "random": create_agents,
+        "target_8": partial(create_base_stock_agents, target=8),
+        "target_12": partial(create_base_stock_agents, target=12),
+        "target_12_again": partial(create_base_stock_agents, target=12),
+    }
+    results = rank_bots(
+        bots, env_types=["classical"], min_seeds=8, max_seeds=64, n_workers=1
+    )
+
+    assert results["resolved"]
+    assert results["n_games"] < results["fixed_n_games"]
+    ranking = {entry["name"]: entry for entry in results["ranking"]}
+    assert results["comparisons"]["target_12", "target_12_again"]["outcome"] == "tie"
+    assert ranking["target_12"]["rank_low"] == ranking["target_12_again"]["rank_low"]
+    assert ranking["target_12"]["rank_high"] == ranking["target_12_again"]["rank_high"]
+    for entry in results["ranking"]:
+        assert entry["low"] <= entry["mean"] <= entry["high"]
+        assert entry["rank_low"] <= entry["rank_high"]
+
+
+def test_rank_bots_stops_at_the_budget():
+    # different bots whose difference can't be resolved on few seeds
+    bots = {
+        "target_12": partial(create_base_stock_agents, target=12),
+        "target_13": partial(create_base_stock_agents, target=13),
+    }
+    results = rank_bots(
+        bots,
+        env_types=["classical"],
+        min_seeds=2,
+        max_seeds=3,
+        n_workers=1,
+    )
+
+    assert not results["resolved"]
+    assert [entry["n_seeds"] for entry in results["ranking"]] == [3, 3]
+    assert [entry["rank_low"] for entry in results["ranking"]] == [1, 1]
+    assert [entry["rank_high"] for entry in results["ranking"]] == [2, 2]
+
+
+def test_rank_bots_only_plays_seeds_open_pairs_can_use():
+    # the target bots stay unresolved up to the budget, random is separated early
+    bots = {
+        "random": create_agents,
+        "target_12": partial(create_base_stock_agents, target=12),
+        "target_13": partial(create_base_stock_agents, target=13),
+    }
+    results = rank_bots(
+        bots, env_types=["classical"], min_seeds=3, max_seeds=5, n_workers=1
+    )
+
+    n_seeds = {entry["name"]: entry["n_seeds"] for entry in results["ranking"]}
+    assert results["comparisons"]["target_12", "target_13"]["outcome"] is None
+    assert n_seeds == {"random": 3, "target_12": 5, "target_13": 5}
+    # no more rounds once the open pair reached the budget
+    assert results["n_rounds"] == 2
+    assert results["n_games"] == 13
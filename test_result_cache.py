@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from bot import create_agents
+from supply_chain_env import result_cache
+from supply_chain_env.result_cache import ResultCache, agents_fingerprint
+from supply_chain_env.tournament import run_game, run_tournament
+
+
+def test_run_game_is_cached(tmp_path, monkeypatch):
+    np.random.seed(0)
+    played = run_game(create_agents(), seed=0, cache=tmp_path)
+    n_calls = 0
+
+    def get_action(_, state: dict):
+        nonlocal n_calls
+        n_calls += 1
+        return 4
+
+    # same source files, so the cached game is returned
+    monkeypatch.setattr("bot.Retailer.get_action", get_action)
+    assert run_game(create_agents(), seed=0, cache=tmp_path) == played
+    assert n_calls == 0
+    # other seeds and games without seeds are played
+    run_game(create_agents(), seed=1, cache=tmp_path)
+    run_game(create_agents(), cache=tmp_path)
+    assert n_calls == 2 * 20
+
+
+def test_cached_game_is_rendered(tmp_path, capsys):
+    last_state = run_game(create_agents(), seed=0, cache=tmp_path)
+    total = sum(state["cum_cost"] for state in last_state)
+    for renderer in ("summary", "turns"):
+        run_game(create_agents(), seed=0, cache=tmp_path, renderer=renderer)
+        assert capsys.readouterr().out == f"\nTotal cost is: EUR {total} (cached)\n"
+    run_game(create_agents(), seed=0, cache=tmp_path, renderer="none")
+    assert capsys.readouterr().out == ""
+
+
+def test_tournament_only_plays_missing_games(tmp_path):
+    cache = ResultCache(tmp_path)
+    first = run_tournament(
+        create_agents, seeds=range(4), env_types=["classical"], cache_dir=tmp_path
+    )
+    assert len(cache) == 4
+    again = run_tournament(
+        create_agents, seeds=range(6), env_types=["classical"], cache_dir=tmp_path
+    )
+    assert len(cache) == 6
+    played = run_tournament(create_agents, seeds=range(6), env_types=["classical"])
+    np.testing.assert_array_equal(
+        again["classical"]["total_costs"], played["classical"]["total_costs"]
+    )
+    np.testing.assert_array_equal(
+        again["classical"]["total_costs"][:4], first["classical"]["total_costs"]
+    )
+
+
+def test_fingerprint_follows_the_source(tmp_path, monkeypatch):
+    module = tmp_path / "tmp_agents.py"
+    module.write_text("class Agent:\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import tmp_agents
+
+    fingerprint = agents_fingerprint([tmp_agents.Agent()])
+    module.write_text("class Agent:\n    target = 1\n")
+    os.utime(module, ns=(0, 0))
+    assert agents_fingerprint([tmp_agents.Agent()]) != fingerprint
+
+
+def test_invalidation_and_eviction(tmp_path, monkeypatch):
+    cache = ResultCache(tmp_path, max_bytes=1000)
+    outdated = tmp_path / "0123456789abcdef"
+    outdated.mkdir()
+    (tmp_path / "other").mkdir()
+    cache.invalidate()
+    assert not outdated.exists() and (tmp_path / "other").exists()
+
+    monkeypatch.setattr(result_cache, "EVICT_EVERY", 1)
+    for i in range(30):
+        cache.put(f"{i:064x}", list(range(20)))
+        os.utime(cache._file(f"{i:064x}"), ns=(i, i))
+        # reading a result makes it the most recently used one
+        cache.get(f"{0:064x}")
+    assert sum(f.stat().st_size for f in cache.path.iterdir()) <= 1000
+    assert cache.get(f"{0:064x}") == list(range(20))
+    assert cache.get(f"{1:064x}") is None
+
+
+def test_other_versions_are_kept_until_evicted(tmp_path, monkeypatch):
+    other = tmp_path / "0123456789abcdef"
+    other.mkdir()
+    (other / f"{0:064x}.json").write_text(json.dumps(list(range(20))))
+    os.utime(other / f"{0:064x}.json", ns=(0, 0))
+    cache = ResultCache(tmp_path, max_bytes=1000)
+    # another checkout uses the cache at the same time
+    assert other.exists()
+
+    monkeypatch.setattr(result_cache, "EVICT_EVERY", 1)
+    for i in range(1, 15):
+        cache.put(f"{i:064x}", list(range(20)))
+    # the least recently used results are the ones of the other version
+    assert not other.exists()
+    assert len(cache) == 14
+
+    shutil.rmtree(cache.path)
+    cache.put(f"{0:064x}", [1])
+    assert cache.get(f"{0:064x}") == [1]
@@ -0,0 +1,84 @@
+import json
+import multiprocessing
+from functools import partial
+
+import numpy as np
+
+from bot import create_agents
+from supply_chain_env.ranking import rank_bots
+from supply_chain_env.results_store import ResultsStore
+from supply_chain_env.tournament import run_tournament
+from test_sweep import create_agents as create_base_stock_agents
+
+
+def _append_batches(path, writer, n_batches, batch_size):
+    store = ResultsStore(path)
+    for batch in range(n_batches):
+        seeds = range(batch * batch_size, (batch + 1) * batch_size)
+        store.add("costs", f"bot{writer}", "classical", seeds, [[1.0] * 4] * batch_size)
+
+
+def test_interrupted_tournament_is_resumed(tmp_path):
+    path = tmp_path / "results.jsonl"
+    kwargs = dict(env_types=["classical", "uniform_0_2"], results_path=path)
+    expected = run_tournament(
+        create_agents, seeds=range(6), env_types=kwargs["env_types"], n_workers=1
+    )
+    run_tournament(
+        create_agents, seeds=range(4), n_workers=1, checkpoint_every=3, **kwargs
+    )
+    lines = path.read_bytes().splitlines(keepends=True)
+    assert len(lines) == 2 * 4
+    # a crash while the last chunk is written
+    path.write_bytes(b"".join(lines[:-1]) + lines[-1][:10])
+    assert len(ResultsStore(path)) == 2 * 4 - 1
+
+    resumed = run_tournament(create_agents, seeds=range(6), n_workers=2, **kwargs)
+    for env_type, summary in expected.items():
+        np.testing.assert_array_equal(
+            resumed[env_type]["total_costs"], summary["total_costs"]
+        )
+    assert len(ResultsStore(path)) == 2 * 6
+
+    # stored games are not played again
+    store = ResultsStore(path)
+    store.add("costs", "bot:create_agents", "classical", [0], [[0.0] * 4])
+    again = run_tournament(create_agents, seeds=range(6), n_workers=1, **kwargs)
+    assert again["classical"]["total_costs"][0] == 0.0
+    assert len(ResultsStore(path)) == 2 * 6
+
+
+def test_concurrent_writers_append_whole_batches(tmp_path):
+    path = tmp_path / "results.jsonl"
+    context = multiprocessing.get_context("spawn")
+    writers = [
+        context.Process(target=_append_batches, args=(path, writer, 20, 30))
+        for writer in range(4)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+        assert writer.exitcode == 0
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == len(ResultsStore(path)) == 4 * 20 * 30
+    # batches are never interleaved
+    for i in range(0, len(records), 30):
+        assert len({record["bot"] for record in records[i : i + 30]}) == 1
+
+
+def test_ranking_is_resumed(tmp_path):
+    path = tmp_path / "results.jsonl"
+    bots = {
+        "random": create_agents,
+        "target_12": partial(create_base_stock_agents, target=12),
+    }
+    kwargs = dict(env_types=["classical"], min_seeds=8, max_seeds=32, n_workers=1)
+    first = rank_bots(bots, results_path=path, **kwargs)
+    n_lines = len(path.read_text().splitlines())
+    assert n_lines == first["n_games"]
+
+    again = rank_bots(bots, results_path=path, **kwargs)
+    assert len(path.read_text().splitlines()) == n_lines
+    assert again["ranking"] == first["ranking"]
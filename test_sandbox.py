@@ -0,0 +1,93 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from supply_chain_env.sandbox import AgentSandbox, run_sandboxed_game
+from supply_chain_env.tournament import AGENT_NAMES, run_game, run_tournament
+from test_tournament import BaseStockAgent, create_base_stock_agents
+
+
+class SlowAgent(BaseStockAgent):
+    def get_action(self, step_state: dict) -> int:
+        time.sleep(0.5)
+        return super().get_action(step_state)
+
+
+class FailingAgent(BaseStockAgent):
+    def get_action(self, step_state: dict) -> int:
+        raise RuntimeError("no action")
+
+
+class ExitingAgent(BaseStockAgent):
+    def get_action(self, step_state: dict) -> int:
+        if step_state["turn"] == 2:
+            os._exit(1)
+        return super().get_action(step_state)
+
+
+def create_slow_agents():
+    return [BaseStockAgent(), BaseStockAgent(), SlowAgent(), BaseStockAgent()]
+
+
+def create_failing_agents():
+    return [FailingAgent()] + [BaseStockAgent() for _ in AGENT_NAMES[1:]]
+
+
+def create_exiting_agents():
+    return [ExitingAgent()] + [BaseStockAgent() for _ in AGENT_NAMES[1:]]
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    with AgentSandbox(create_base_stock_agents, timeout=5.0) as sandbox:
+        yield sandbox
+
+
+def test_sandboxed_game_matches_run_game(sandbox):
+    for seed in range(3):
+        np.random.seed(seed)
+        expected = run_game(create_base_stock_agents(), seed=seed)
+        np.random.seed(seed)
+        last_state = run_sandboxed_game(sandbox, seed=seed)
+        assert [s["cum_cost"] for s in last_state] == [
+            s["cum_cost"] for s in expected
+        ]
+    assert sandbox.timeouts.sum() == sandbox.errors.sum() == 0
+
+
+def test_slow_agent_gets_default_action():
+    with AgentSandbox(create_slow_agents, timeout=0.05, default_action=3) as sandbox:
+        start = time.perf_counter()
+        run_sandboxed_game(sandbox, seed=0)
+        elapsed = time.perf_counter() - start
+    # the game doesn't wait for the slow agent
+    assert elapsed < 20 * 0.5
+    assert sandbox.timeouts.tolist() == [0, 0, 20, 0]
+
+
+def test_failing_agent_gets_default_action():
+    with AgentSandbox(create_failing_agents, timeout=5.0) as sandbox:
+        run_sandboxed_game(sandbox, seed=0)
+    assert sandbox.errors.tolist() == [20, 0, 0, 0]
+    assert "no action" in sandbox.last_errors[0]
+
+
+def test_sandboxed_tournament():
+    kwargs = dict(seeds=range(3), env_types=["classical"], n_workers=1)
+    sandboxed = run_tournament(create_base_stock_agents, sandbox_timeout=5.0, **kwargs)
+    serial = run_tournament(create_base_stock_agents, **kwargs)
+    np.testing.assert_array_equal(
+        sandboxed["classical"]["total_costs"], serial["classical"]["total_costs"]
+    )
+
+
+def test_dead_worker_gets_default_action_and_is_restarted():
+    with AgentSandbox(create_exiting_agents, timeout=5.0) as sandbox:
+        for seed in range(2):
+            last_state = run_sandboxed_game(sandbox, seed=seed)
+            assert last_state[0]["turn"] == 19
+    # the agent of the restarted worker exits again in the second game
+    assert sandbox.errors.tolist() == [2 * 18, 0, 0, 0]
+    assert "exited with code 1" in sandbox.last_errors[0]
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+
+import pytest
+import requests
+
+from bot import create_agents
+from supply_chain_env.leaderboard import LeaderboardClient, LeaderboardError
+from supply_chain_env.service import Leaderboard, TournamentService
+from supply_chain_env.tournament import run_tournament
+
+AUTH = ("user", "password")
+FAILING_SOURCE = """
+def create_agents():
+    raise RuntimeError("no agents")
+"""
+
+
+class ServiceThread:
+    """Service running in an event loop of a background thread."""
+
+    def __init__(self, path, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.leaderboard = Leaderboard(path)
+        self.service = TournamentService(self.leaderboard, **kwargs)
+        self.run(self.service.start(port=0))
+        self.url = f"http://127.0.0.1:{self.service.port}"
+
+    def run(self, coroutine, timeout=60):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def close(self):
+        self.run(self.service.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.leaderboard.close()
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ServiceThread(
+        tmp_path / "leaderboard.sqlite",
+        seeds=range(3),
+        env_types=["classical", "uniform_0_2"],
+        n_workers=2,
+        auth=AUTH,
+    )
+    yield service
+    service.close()
+
+
+def test_add_user_score_mirrors_leaderboard_api(service):
+    client = LeaderboardClient(
+        url=f"{service.url}/add-user-score",
+        github_commit_url=None,
+        auth=AUTH,
+        queue_path=None,
+    )
+    with client:
+        assert client.submit_many([30.0, 10.0], user="a") == 2
+        assert client.submit(20.0, user="b")
+    wrong_auth = LeaderboardClient(
+        url=client.url, auth=("user", "wrong"), queue_path=None
+    )
+    with wrong_auth, pytest.raises(LeaderboardError):
+        wrong_auth.submit(0.0, user="c")
+
+    last = requests.get(f"{service.url}/leaderboard").json()["leaderboard"]
+    assert [(r["rank"], r["user"], r["score"]) for r in last] == [
+        (1, "a", 10.0),
+        (2, "b", 20.0),
+    ]
+    assert last[0]["n_scores"] == 2
+
+
+def test_submissions_are_queued_and_evaluated(service):
+    with requests.Session() as session:
+        post = lambda data: session.post(  # noqa: E731
+            f"{service.url}/submissions", json=data, auth=AUTH
+        )
+        responses = [
+            post({"user": f"u{i}", "agents": "bot:create_agents"}) for i in range(4)
+        ]
+        responses.append(post({"user": "f", "source": FAILING_SOURCE}))
+        assert [r.status_code for r in responses] == [202] * 5
+        assert post({"user": "x"}).status_code == 400
+        assert session.post(f"{service.url}/submissions", json={}).status_code == 401
+        assert session.get(f"{service.url}/submissions/999").status_code == 404
+        # what a web page can post without a CORS preflight
+        plain = session.post(
+            f"{service.url}/submissions",
+            data='{"user": "x", "agents": "bot:create_agents"}',
+            headers={"Content-Type": "text/plain"},
+            auth=AUTH,
+        )
+        assert plain.status_code == 415
+
+        service.run(service.service.join())
+        submissions = [
+            session.get(f"{service.url}/submissions/{r.json()['id']}").json()
+            for r in responses
+        ]
+
+    expected = run_tournament(
+        create_agents,
+        seeds=range(3),
+        env_types=["classical", "uniform_0_2"],
+        n_workers=1,
+    )
+    for submission in submissions[:4]:
+        assert submission["status"] == "done"
+        assert submission["env_means"] == {
+            env_type: summary["mean"] for env_type, summary in expected.items()
+        }
+    assert submissions[-1]["status"] == "failed"
+    assert "no agents" in submissions[-1]["error"]
+    ranking = service.leaderboard.ranking()
+    assert sorted(r["user"] for r in ranking) == ["u0", "u1", "u2", "u3"]
+
+
+def test_pending_submissions_are_evaluated_after_restart(tmp_path):
+    path = tmp_path / "leaderboard.sqlite"
+    leaderboard = Leaderboard(path)
+    submission_id = leaderboard.add_submission("a", agents="bot:create_agents")
+    leaderboard.start_submission(submission_id)
+    leaderboard.close()
+
+    service = ServiceThread(path, seeds=range(2), env_types=["classical"])
+    try:
+        response = requests.post(
+            f"{service.url}/submissions", json={"user": "b", "source": FAILING_SOURCE}
+        )
+        assert response.status_code == 403
+        service.run(service.service.join())
+        assert service.leaderboard.get_submission(submission_id)["status"] == "done"
+        assert service.leaderboard.pending_submissions() == []
+    finally:
+        service.close()
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+
+import pytest
+
+
+def _imported_modules(code: str) -> set:
+    output = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return set(output.split())
+
+
+@pytest.mark.parametrize(
+    "code, heavy",
+    [
+        ("import supply_chain_env", {"gym", "numpy", "requests", "cloudpickle"}),
+        ("import bot", {"requests", "cloudpickle"}),
+        ("import supply_chain_env.tournament", {"requests", "cloudpickle"}),
+    ],
+)
+def test_heavy_dependencies_are_imported_when_used(code, heavy):
+    assert not heavy & _imported_modules(code)
+
+
+def test_envs_are_registered_with_gym():
+    modules = _imported_modules(
+        "import gym\n"
+        "import supply_chain_env\n"
+        "assert 'SupplyChainTournament-v0' in gym.envs.registry"
+    )
+    assert "gym" in modules
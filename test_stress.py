@@ -0,0 +1,63 @@
+import numpy as np
+
+from supply_chain_env import stress
+from supply_chain_env.envs.scenario_bank import ScenarioBank
+from supply_chain_env.stress import play_scenarios, scenario_bounds, search
+from supply_chain_env.tournament import run_tournament
+from test_tournament import create_base_stock_agents, create_batch_agents
+
+
+def test_search_finds_costlier_scenarios_than_random_seeds(tmp_path):
+    results = search(
+        create_batch_agents,
+        env_type="uniform_0_2",
+        population_size=16,
+        n_generations=10,
+        n_worst=4,
+    )
+
+    assert results["total_costs"][0] > results["random_worst"]
+    assert results["history"] == sorted(results["history"])
+    assert results["n_games"] <= 16 * 11
+    np.testing.assert_array_equal(
+        results["total_costs"], np.sort(results["total_costs"])[::-1]
+    )
+    for field, (low, high) in scenario_bounds("uniform_0_2").items():
+        assert results["scenarios"][field].min() >= low
+        assert results["scenarios"][field].max() <= high
+
+    # the worst scenarios are fixtures, per game agents play them the same way
+    path = tmp_path / "uniform_0_2.npy"
+    ScenarioBank.save(path, "uniform_0_2", results["scenarios"], source="test")
+    scenarios = ScenarioBank(path).scenarios
+    costs = play_scenarios(create_base_stock_agents, "uniform_0_2", scenarios)
+    np.testing.assert_array_equal(costs, results["costs"])
+    summary = run_tournament(
+        create_base_stock_agents,
+        seeds=range(4),
+        env_types=["uniform_0_2"],
+        n_workers=1,
+        scenario_banks={"uniform_0_2": path},
+    )["uniform_0_2"]
+    np.testing.assert_array_equal(summary["total_costs"], results["total_costs"])
+
+
+def test_search_memoizes_played_scenarios(monkeypatch):
+    played = []
+
+    def counting_play(create_agents, env_type, scenarios, seed=0):
+        played.extend(scenario.tobytes() for scenario in scenarios)
+        return play_scenarios(create_agents, env_type, scenarios, seed)
+
+    monkeypatch.setattr(stress, "play_scenarios", counting_play)
+    # without mutations, crossovers of few parents soon repeat scenarios
+    results = search(
+        create_base_stock_agents,
+        env_type="classical",
+        population_size=4,
+        n_generations=5,
+        mutation_rate=0.0,
+    )
+
+    assert len(played) == len(set(played)) == results["n_games"]
+    assert results["n_memo_hits"] > 0
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from supply_chain_env.sweep import (
+    SweepCache,
+    evaluate,
+    grid,
+    parse_param,
+    run_sweep,
+    sample,
+    successive_halving,
+)
+from test_tournament import BaseStockAgent
+
+
+def create_agents(target=12):
+    agents = [BaseStockAgent() for _ in range(4)]
+    for agent in agents:
+        agent.target = target
+    return agents
+
+
+def test_parse_param_and_spaces():
+    space = dict(parse_param(s) for s in ["target=8,12", "alpha=0.1:0.9", "n=1:3"])
+    assert space == {"target": [8, 12], "alpha": (0.1, 0.9), "n": (1, 3)}
+
+    configs = sample(space, 50, seed=0)
+    assert all(0.1 <= c["alpha"] <= 0.9 and c["n"] in (1, 2, 3) for c in configs)
+    assert {c["target"] for c in configs} == {8, 12}
+    with pytest.raises(ValueError):
+        grid(space)
+    assert grid({"a": [1, 2], "b": [3]}) == [{"a": 1, "b": 3}, {"a": 2, "b": 3}]
+
+
+def test_grid_sweep_is_cached(tmp_path):
+    cache_path = tmp_path / "sweep.jsonl"
+    kwargs = dict(seeds=range(4), env_types=["classical"], cache_path=cache_path)
+    results = run_sweep(create_agents, {"target": [4, 12, 40]}, n_workers=2, **kwargs)
+
+    assert [r["score"] for r in results] == sorted(r["score"] for r in results)
+    assert len(SweepCache(cache_path)) == 3 * 4
+    lines = cache_path.read_text().splitlines()
+
+    # a second sweep plays only the new configuration
+    again = run_sweep(create_agents, {"target": [4, 12, 40, 20]}, n_workers=1, **kwargs)
+    assert len(cache_path.read_text().splitlines()) == len(lines) + 4
+    scores = {json.dumps(r["params"]): r["score"] for r in again}
+    for r in results:
+        assert scores[json.dumps(r["params"])] == r["score"]
+
+
+def test_edited_agents_are_played_again(tmp_path, monkeypatch):
+    module = tmp_path / "tmp_sweep_agents.py"
+    source = (
+        "from test_tournament import BaseStockAgent\n\n\n"
+        "def create_agents(target=12):\n"
+        "    return [BaseStockAgent() for _ in range(4)]\n"
+    )
+    module.write_text(source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import tmp_sweep_agents
+
+    cache = SweepCache()
+    kwargs = dict(seeds=range(3), env_types=["classical"], cache=cache)
+    evaluate(tmp_sweep_agents.create_agents, [{"target": 12}], **kwargs)
+    evaluate(tmp_sweep_agents.create_agents, [{"target": 12}], **kwargs)
+    assert len(cache) == 3
+
+    module.write_text(source + "    # edited\n")
+    os.utime(module, ns=(0, 0))
+    evaluate(tmp_sweep_agents.create_agents, [{"target": 12}], **kwargs)
+    assert len(cache) == 6
+
+
+def test_successive_halving_drops_losers():
+    configs = [{"target": t} for t in (0, 4, 8, 12, 16, 40, 80, 120, 200)]
+    cache = SweepCache()
+    results = successive_halving(
+        create_agents, configs, range(9), eta=3, env_types=["classical"], cache=cache
+    )
+
+    assert len(results) == len(configs)
+    assert [r["n_seeds"] for r in results] == [9] + [3] * 2 + [1] * 6
+    # 9 games on the first rung, 3 * 2 new on the second and 6 on the last
+    assert len(cache) == 9 + 6 + 6
+    # the clearly worst ones are dropped on the first rung
+    assert {80, 120, 200} <= {r["params"]["target"] for r in results[3:]}
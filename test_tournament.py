@@ -0,0 +1,138 @@
+import pstats
+
+import numpy as np
+
+from bot import create_agents
+from supply_chain_env.envs.scenario_bank import ScenarioBank
+from supply_chain_env.instrumentation import Instrumentation
+from supply_chain_env.tournament import AGENT_NAMES, ENV_TYPES, run_game, run_tournament
+
+
+def test_tournament_is_reproducible_across_workers():
+    serial = run_tournament(create_agents, seeds=range(6), n_workers=1)
+    parallel = run_tournament(create_agents, seeds=range(6), n_workers=2)
+
+    assert set(serial) == set(ENV_TYPES)
+    for env_type in ENV_TYPES:
+        assert serial[env_type]["n_games"] == 6
+        np.testing.assert_array_equal(
+            serial[env_type]["total_costs"], parallel[env_type]["total_costs"]
+        )
+
+
+def test_tournament_summary():
+    summary = run_tournament(
+        create_agents, seeds=range(4), env_types=["classical"], n_workers=1
+    )["classical"]
+
+    assert summary["quantiles"][0.05] <= summary["quantiles"][0.95]
+    assert np.isclose(sum(summary["agent_mean"].values()), summary["mean"])
+
+
+def test_tournament_on_shared_scenario_bank(tmp_path):
+    ScenarioBank.create(tmp_path / "normal_10_4.npy", "normal_10_4", n_scenarios=8)
+    banks = {"normal_10_4": tmp_path / "normal_10_4.npy"}
+
+    serial, parallel = (
+        run_tournament(
+            create_agents,
+            seeds=range(8),
+            env_types=["normal_10_4"],
+            n_workers=n_workers,
+            scenario_banks=banks,
+        )["normal_10_4"]
+        for n_workers in (1, 2)
+    )
+
+    np.testing.assert_array_equal(serial["total_costs"], parallel["total_costs"])
+
+
+def test_run_game_instrumentation(tmp_path):
+    instrumentation = Instrumentation()
+    np.random.seed(3)
+    timed = run_game(create_agents(), seed=3, instrumentation=instrumentation)
+    np.random.seed(3)
+    assert timed == run_game(create_agents(), seed=3)
+
+    timings = instrumentation.to_dict()["timings"]
+    assert instrumentation.counters == {"games": 1, "env.resets": 1, "env.steps": 20}
+    for name in AGENT_NAMES:
+        assert timings[f"agent.{name}.get_action"]["count"] == 20
+    phases = ["shipments", "stocks", "costs", "observations"]
+    assert timings["env.step"]["total_s"] >= sum(
+        timings[f"env.step.{phase}"]["total_s"] for phase in phases
+    )
+
+    instrumentation.dump_json(tmp_path / "timings.json")
+    instrumentation.dump_stats(tmp_path / "timings.prof")
+    stats = pstats.Stats(str(tmp_path / "timings.prof"))
+    assert stats.total_calls == 9 * 20
+
+
+class BaseStockAgent:
+    """Orders up to a target inventory position, per game and batched."""
+
+    target = 12
+
+    def get_action(self, step_state: dict) -> int:
+        position = (
+            step_state["current_stock"]
+            + sum(step_state["inbound_shipments"])
+            - step_state["next_incoming_order"]
+        )
+        return max(self.target - position, 0)
+
+
+class BatchBaseStockAgent(BaseStockAgent):
+    calls = 0
+
+    def get_actions(self, states: dict) -> np.ndarray:
+        BatchBaseStockAgent.calls += 1
+        position = (
+            states["current_stock"]
+            + states["inbound_shipments"].sum(axis=1)
+            - states["next_incoming_order"]
+        )
+        return np.maximum(self.target - position, 0)
+
+
+def create_base_stock_agents():
+    return [BaseStockAgent() for _ in AGENT_NAMES]
+
+
+def create_batch_agents():
+    return [BatchBaseStockAgent() for _ in AGENT_NAMES]
+
+
+def create_mixed_agents():
+    return [BatchBaseStockAgent(), BaseStockAgent()] * 2
+
+
+def test_batch_protocol_matches_per_game_agents():
+    seeds = range(10)
+    expected = run_tournament(create_base_stock_agents, seeds=seeds, n_workers=1)
+    BatchBaseStockAgent.calls = 0
+    batched = run_tournament(create_batch_agents, seeds=seeds, n_workers=1)
+    mixed = run_tournament(create_mixed_agents, seeds=seeds, n_workers=2)
+
+    # one call per agent and turn for all games of an env type
+    assert BatchBaseStockAgent.calls == len(ENV_TYPES) * len(AGENT_NAMES) * 20
+    for env_type in ENV_TYPES:
+        for results in (batched, mixed):
+            np.testing.assert_array_equal(
+                results[env_type]["total_costs"], expected[env_type]["total_costs"]
+            )
+
+
+def test_batch_protocol_on_scenario_bank(tmp_path):
+    ScenarioBank.create(tmp_path / "uniform_0_2.npy", "uniform_0_2", n_scenarios=6)
+    kwargs = dict(
+        seeds=range(6),
+        env_types=["uniform_0_2"],
+        n_workers=1,
+        scenario_banks={"uniform_0_2": tmp_path / "uniform_0_2.npy"},
+    )
+    expected = run_tournament(create_base_stock_agents, **kwargs)["uniform_0_2"]
+    batched = run_tournament(create_batch_agents, **kwargs)["uniform_0_2"]
+
+    np.testing.assert_array_equal(batched["total_costs"], expected["total_costs"])
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from bot import create_agents
+from supply_chain_env.tournament import ENV_TYPES, run_game, run_tournament
+from supply_chain_env.trajectories import TrajectoryReader, TrajectoryRecorder
+
+
+def test_tournament_recording(tmp_path):
+    results = run_tournament(
+        create_agents, seeds=range(5), n_workers=2, record_dir=tmp_path
+    )
+    reader = TrajectoryReader(tmp_path)
+
+    assert len(reader) == 5 * len(ENV_TYPES)
+    for env_type in ENV_TYPES:
+        games = reader.select(env_type=env_type)
+        assert reader.games["seed"][games].tolist() == list(range(5))
+        np.testing.assert_allclose(
+            reader.final_costs(games).sum(axis=1), results[env_type]["total_costs"]
+        )
+
+
+def test_tournaments_add_to_a_recording(tmp_path):
+    kwargs = dict(seeds=range(3), env_types=["classical"], n_workers=1)
+    run_tournament(create_agents, record_dir=tmp_path, **kwargs)
+    run_tournament(create_agents, record_dir=tmp_path, compress_records=True, **kwargs)
+
+    reader = TrajectoryReader(tmp_path)
+    assert len(reader) == 2 * 3
+    assert sorted(reader.games["seed"].tolist()) == [0, 0, 1, 1, 2, 2]
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+    assert not list(tmp_path.glob(".*.tmp"))
+    part = next(tmp_path.glob("*.index.json")).name[: -len(".index.json")]
+    with pytest.raises(FileExistsError):
+        TrajectoryRecorder(tmp_path, part=part)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_record_and_replay(tmp_path, compress):
+    # small chunks, so games span several of them
+    with TrajectoryRecorder(tmp_path, chunk_size=7, compress=compress) as recorder:
+        last_states = []
+        for seed in range(3):
+            np.random.seed(seed)
+            last_states.append(
+                run_game(
+                    create_agents(),
+                    environment="normal_10_4",
+                    seed=seed,
+                    recorder=recorder,
+                )
+            )
+    reader = TrajectoryReader(tmp_path)
+
+    assert len(reader.column("turn")) == 3 * 20
+    assert len(reader.column("turn", games=[1])) == 20
+    for game_id, last_state in enumerate(last_states):
+        turns = reader.game(game_id)
+        assert turns["turn"].tolist() == list(range(20))
+        assert turns["done"].tolist() == [False] * 19 + [True]
+        cum_cost = [agent_state["cum_cost"] for agent_state in last_state]
+        np.testing.assert_allclose(reader.final_costs([game_id])[0], cum_cost)
+
+        replayed = list(reader.replay(game_id))
+        np.testing.assert_array_equal(
+            [rewards for _, rewards, _, _ in replayed], turns["rewards"]
+        )
+        assert replayed[-1][0] == last_state